@@ -0,0 +1,90 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+##  Compact storage for the points of a layer polygon.
+#
+#   The engine works with integer micron coordinates, so the X and Z
+#   coordinates of the points can be stored as integer microns relative to
+#   an origin. If every step between two consecutive points fits in an int16,
+#   only these steps are stored, otherwise the offsets from the origin are
+#   stored as int32. For paths in a single plane (which is all of them, unless
+#   the print is spiralized) the height is stored only once.
+#
+#   Points are only encoded if decoding them gives back exactly the same
+#   float32 values, so using this never changes what is displayed.
+#   Use encode() to create an instance of this class.
+class CompactPointData:
+    ##  The number of stored units per mm, the engine's micron resolution.
+    units_per_mm = 1000
+
+    def __init__(self, origin, offsets, heights, is_delta):
+        self._origin = origin
+        self._offsets = offsets
+        self._heights = heights
+        self._is_delta = is_delta
+
+    ##  Encode an array of points.
+    #
+    #   \param points A float32 array of shape (n, 3) with the points.
+    #   \return A CompactPointData with the points, or None if the points can
+    #   not be encoded without loss.
+    @classmethod
+    def encode(cls, points):
+        if len(points) == 0:
+            return None
+
+        microns = numpy.rint(points[:, [0, 2]].astype(numpy.float64) * cls.units_per_mm)
+        if numpy.any(numpy.abs(microns) > numpy.iinfo(numpy.int32).max):
+            return None
+        microns = microns.astype(numpy.int64)
+        origin = microns[0].copy()
+
+        steps = numpy.diff(microns, axis = 0)
+        int16_info = numpy.iinfo(numpy.int16)
+        if len(steps) == 0 or (steps.min() >= int16_info.min and steps.max() <= int16_info.max):
+            offsets = steps.astype(numpy.int16)
+            is_delta = True
+        else:
+            offsets = (microns - origin).astype(numpy.int32)
+            is_delta = False
+
+        heights = points[:, 1]
+        if numpy.all(heights == heights[0]):
+            heights = heights[0]
+        else:
+            heights = heights.copy()
+
+        result = cls(origin, offsets, heights, is_delta)
+        if not numpy.array_equal(result.decode(), points):
+            return None
+        return result
+
+    ##  Decode the points.
+    #
+    #   \return A float32 array of shape (n, 3) with the points.
+    def decode(self):
+        if self._is_delta:
+            microns = numpy.empty((len(self._offsets) + 1, 2), dtype = numpy.int64)
+            microns[0] = self._origin
+            numpy.cumsum(self._offsets, axis = 0, dtype = numpy.int64, out = microns[1:])
+            microns[1:] += self._origin
+        else:
+            microns = self._offsets.astype(numpy.int64) + self._origin
+
+        points = numpy.empty((len(microns), 3), dtype = numpy.float32)
+        points[:, 0] = microns[:, 0] / self.units_per_mm
+        points[:, 1] = self._heights
+        points[:, 2] = microns[:, 1] / self.units_per_mm
+        return points
+
+    ##  The number of bytes used to store the points.
+    @property
+    def nbytes(self):
+        return self._origin.nbytes + self._offsets.nbytes + numpy.asarray(self._heights).nbytes
+
+    def __len__(self):
+        if self._is_delta:
+            return len(self._offsets) + 1
+        return len(self._offsets)
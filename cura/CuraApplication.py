@@ -41,7 +41,10 @@ from . import MultiMaterialDecorator
 from . import ZOffsetDecorator
 from . import CuraSplashScreen
 from . import CameraImageProvider
+from . import LayerThumbnailImageProvider
 from . import MachineActionManager
+from .GCodePostProcessingPipeline import GCodePostProcessingPipeline
+from .MultiDeviceWriter import MultiDeviceWriter
 
 import cura.Settings
 
@@ -151,6 +154,7 @@ class CuraApplication(QtApplication):
         self._volume = None
         self._output_devices = {}
         self._print_information = None
+        self._multi_device_writer = None
         self._previous_active_tool = None
         self._platform_activity = False
         self._scene_bounding_box = AxisAlignedBox.Null
@@ -198,6 +202,9 @@ class CuraApplication(QtApplication):
         Preferences.getInstance().addPreference("cura/categories_expanded", "")
         Preferences.getInstance().addPreference("cura/jobname_prefix", True)
         Preferences.getInstance().addPreference("view/center_on_select", True)
+        Preferences.getInstance().addPreference("view/layer_line_mesh_vertex_budget", 4000000)
+        Preferences.getInstance().addPreference("view/compact_layer_data", False)
+        Preferences.getInstance().addPreference("view/layer_thumbnail_size", 64)
         Preferences.getInstance().addPreference("mesh/scale_to_fit", True)
         Preferences.getInstance().addPreference("mesh/scale_tiny_meshes", True)
 
@@ -256,6 +263,7 @@ class CuraApplication(QtApplication):
         JobQueue.getInstance().jobFinished.connect(self._onJobFinished)
 
         self.applicationShuttingDown.connect(self.saveSettings)
+        self.applicationShuttingDown.connect(self._removeLayerThumbnails)
         self.engineCreatedSignal.connect(self._onEngineCreated)
         self._recent_files = []
         files = Preferences.getInstance().getValue("cura/recent_files").split(";")
@@ -267,6 +275,7 @@ class CuraApplication(QtApplication):
 
     def _onEngineCreated(self):
         self._engine.addImageProvider("camera", CameraImageProvider.CameraImageProvider())
+        self._engine.addImageProvider("layer_thumbnails", LayerThumbnailImageProvider.LayerThumbnailImageProvider())
 
     ## A reusable dialogbox
     #
@@ -345,6 +354,13 @@ class CuraApplication(QtApplication):
                 with SaveFile(path, "wt", -1, "utf-8") as f:
                     f.write(data)
 
+    ##  Delete the files with the images of the layers that are shown, which
+    #   would be left behind in the temporary directory otherwise.
+    def _removeLayerThumbnails(self):
+        for node in DepthFirstIterator(self.getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data:
+                layer_data.removeThumbnails()
 
     @pyqtSlot(str, result = QUrl)
     def getDefaultPath(self, key):
@@ -360,6 +376,7 @@ class CuraApplication(QtApplication):
     def _loadPlugins(self):
         self._plugin_registry.addType("profile_reader", self._addProfileReader)
         self._plugin_registry.addType("profile_writer", self._addProfileWriter)
+        self._plugin_registry.addType("gcode_post_processor", self._addGCodePostProcessor)
         self._plugin_registry.addPluginLocation(os.path.join(QtApplication.getInstallPrefix(), "lib", "cura"))
         if not hasattr(sys, "frozen"):
             self._plugin_registry.addPluginLocation(os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "plugins"))
@@ -536,12 +553,12 @@ class CuraApplication(QtApplication):
                 continue
 
             count += 1
+            # Layers that are read from a file have the size of their paths.
+            other_bb = node.callDecoration("getLayerBoundingBox") or node.getBoundingBox()
             if not scene_bounding_box:
-                scene_bounding_box = node.getBoundingBox()
-            else:
-                other_bb = node.getBoundingBox()
-                if other_bb is not None:
-                    scene_bounding_box = scene_bounding_box + node.getBoundingBox()
+                scene_bounding_box = other_bb
+            elif other_bb is not None:
+                scene_bounding_box = scene_bounding_box + other_bb
 
         if not scene_bounding_box:
             scene_bounding_box = AxisAlignedBox.Null
@@ -852,6 +869,19 @@ class CuraApplication(QtApplication):
         node = job.getResult()
         if node != None:
             self.fileLoaded.emit(job.getFileName())
+            if node.callDecoration("getLayerData"):
+                # Files with layer data (g-code) are shown on the build volume like the result of a slice, they can not
+                # be moved or scaled.
+                node.setScale(Vector(1, 1, 1))
+                node.setName(os.path.basename(job.getFileName()))
+                node.setParent(self.getBuildVolume())
+                statistics = node.callDecoration("getLayerData").getStatistics()
+                if statistics and statistics.getPrintTime() is not None and self._print_information:
+                    self._print_information.setPrintDuration(statistics.getPrintTime(), statistics.getMaterialAmounts())
+                self.getController().setActiveView("LayerView")
+                self.getController().getScene().sceneChanged.emit(node)
+                return
+
             node.setSelectable(True)
             node.setName(os.path.basename(job.getFileName()))
             op = AddSceneNodeOperation(node, self.getController().getScene().getRoot())
@@ -891,6 +921,29 @@ class CuraApplication(QtApplication):
         job.finished.connect(self._onFileLoaded)
         job.start()
 
+    ##  Write the g-code of the scene to all output devices at once.
+    #
+    #   The g-code is encoded once and written to all devices at the same time,
+    #   see MultiDeviceWriter. Saving to a local file is left out, because it
+    #   asks for a file name.
+    #
+    #   \param file_name The name of the file to write, without extension.
+    @pyqtSlot(str)
+    def requestWriteToAllDevices(self, file_name):
+        if self._multi_device_writer:
+            Logger.log("w", "Already writing to all devices")
+            return
+        devices = [device for device in self.getOutputDeviceManager().getOutputDevices() if device.getId() != "local_file"]
+        if not devices:
+            return
+
+        self._multi_device_writer = MultiDeviceWriter(devices, self.getController().getScene().getRoot(), file_name)
+        self._multi_device_writer.finished.connect(self._onMultiDeviceWriteFinished)
+        self._multi_device_writer.start()
+
+    def _onMultiDeviceWriteFinished(self, writer):
+        self._multi_device_writer = None
+
     def _addProfileReader(self, profile_reader):
         # TODO: Add the profile reader to the list of plug-ins that can be used when importing profiles.
         pass
@@ -898,6 +951,9 @@ class CuraApplication(QtApplication):
     def _addProfileWriter(self, profile_writer):
         pass
 
+    def _addGCodePostProcessor(self, post_processor):
+        GCodePostProcessingPipeline.getInstance().addProcessor(post_processor)
+
     @pyqtSlot("QSize")
     def setMinimumWindowSize(self, size):
         self.getMainWindow().setMinimumSize(size)
@@ -0,0 +1,123 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+from UM.Mesh.MeshWriter import MeshWriter
+from UM.PluginRegistry import PluginRegistry
+
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+
+##  G-code of the scene that is encoded once into a spool file, to write it
+#   to several output devices.
+#
+#   The spool file is not changed after it is written, so any number of
+#   devices can read it at the same time, each with its own file handle. A
+#   gzip compressed copy is made when a device asks for it, once for all
+#   devices.
+class EncodedGCode:
+    ##  \param file_name The spool file with the g-code.
+    #   \param mime_type The MIME type of the contents of the spool file.
+    def __init__(self, file_name, mime_type = "text/x-gcode"):
+        self._file_name = file_name
+        self._mime_type = mime_type
+        self._compressed = None
+        self._compress_lock = threading.Lock()
+
+    ##  Encode the g-code of the scene into a new spool file.
+    #
+    #   \param node The node to write, passed on to the g-code writer.
+    #   \param progress_callback Called with the number of bytes written and
+    #   the total number of bytes, while the g-code is encoded.
+    #   \return The EncodedGCode, or None if there is no g-code.
+    @classmethod
+    def encode(cls, node, progress_callback = None):
+        gcode_writer = PluginRegistry.getInstance().getPluginObject("GCodeWriter")
+        if not gcode_writer:
+            Logger.log("e", "The GCodeWriter plug-in is needed to encode g-code.")
+            return None
+
+        handle, file_name = tempfile.mkstemp(prefix = "cura_gcode_", suffix = ".gcode")
+        with os.fdopen(handle, "wb") as stream:
+            written = gcode_writer.writeWithProgress(stream, node, MeshWriter.OutputMode.BinaryMode, progress_callback)
+        if not written:
+            os.remove(file_name)
+            return None
+        return cls(file_name)
+
+    ##  The MIME type of the encoded data.
+    def getMimeType(self):
+        return self._mime_type
+
+    ##  The size of the encoded data, in bytes.
+    def getSize(self):
+        return os.path.getsize(self._file_name)
+
+    ##  Open the encoded data for reading.
+    #
+    #   \return A new binary stream, the caller must close it.
+    def open(self):
+        return open(self._file_name, "rb")
+
+    ##  Get a gzip compressed copy of the data.
+    #
+    #   The copy is made the first time it is asked for. It can be asked for
+    #   from several threads at the same time.
+    def getCompressed(self):
+        with self._compress_lock:
+            if self._compressed is None:
+                handle, file_name = tempfile.mkstemp(prefix = "cura_gcode_", suffix = ".gcode.gz")
+                with os.fdopen(handle, "wb") as stream, self.open() as source:
+                    with gzip.GzipFile(fileobj = stream, mode = "wb", compresslevel = 6) as gzip_stream:
+                        shutil.copyfileobj(source, gzip_stream, self.__chunk_size)
+                self._compressed = EncodedGCode(file_name, "application/gzip")
+            return self._compressed
+
+    ##  Get the data as one of several MIME types, in order of preference.
+    #
+    #   \param mime_types The MIME types that are accepted.
+    #   \return The EncodedGCode with the data, or None if none of the MIME
+    #   types can be made.
+    def getAs(self, mime_types):
+        for mime_type in mime_types:
+            if mime_type == self._mime_type:
+                return self
+            if mime_type == "application/gzip":
+                return self.getCompressed()
+        return None
+
+    ##  Copy the data to a stream in large chunks.
+    #
+    #   \param stream A binary stream to write to.
+    #   \param progress_callback Called after every chunk with the number of
+    #   bytes written and the total number of bytes.
+    def copyTo(self, stream, progress_callback = None):
+        total_size = self.getSize()
+        written_size = 0
+        with self.open() as source:
+            while True:
+                chunk = source.read(self.__chunk_size)
+                if not chunk:
+                    break
+                stream.write(chunk)
+                written_size += len(chunk)
+                if progress_callback:
+                    progress_callback(written_size, total_size)
+        return True
+
+    ##  Delete the spool files.
+    def remove(self):
+        with self._compress_lock:
+            if self._compressed:
+                self._compressed.remove()
+                self._compressed = None
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    # The number of bytes to copy at once.
+    __chunk_size = 1024 * 1024
@@ -0,0 +1,111 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+import itertools
+from time import perf_counter
+
+##  Applies the g-code post-processors to the g-code, while it is written.
+#
+#   The stages of the pipeline are generators: the g-code of the scene is
+#   split into lines lazily and every stage takes the lines it needs from the
+#   stage before it. The writer takes the lines from the last stage. So the
+#   g-code is post-processed once, while it is written or sent to a printer,
+#   without making a changed copy of all g-code first.
+#
+#   The time spent in each stage is measured, to find slow post-processors.
+#
+#   Post-processors are plug-ins of the type "gcode_post_processor", see
+#   GCodePostProcessor.
+class GCodePostProcessingPipeline:
+    def __init__(self):
+        self._processors = []
+        self._stage_times = []
+
+    ##  Add a post-processor to the pipeline.
+    def addProcessor(self, processor):
+        if processor not in self._processors:
+            self._processors.append(processor)
+
+    ##  Remove a post-processor from the pipeline.
+    def removeProcessor(self, processor):
+        if processor in self._processors:
+            self._processors.remove(processor)
+
+    ##  All post-processors of the pipeline, enabled or not.
+    def getProcessors(self):
+        return list(self._processors)
+
+    ##  The post-processors that change the g-code, in the order in which they
+    #   are applied.
+    def getActiveProcessors(self):
+        return sorted([processor for processor in self._processors if processor.isEnabled()], key = lambda processor: processor.getOrder())
+
+    ##  Apply the post-processors to g-code.
+    #
+    #   \param gcode_list The g-code, as a list of strings (the g-code of the
+    #   scene is a string per layer).
+    #   \param split_lines Whether to always generate single lines. If False,
+    #   the strings of the list are generated as they are if there are no
+    #   post-processors to apply.
+    #   \return Generates the post-processed g-code, line by line.
+    def process(self, gcode_list, split_lines = False):
+        processors = self.getActiveProcessors()
+        if not processors and not split_lines:
+            return iter(gcode_list)
+        return self._process(gcode_list, processors)
+
+    ##  The time spent in each stage the last time the g-code was processed.
+    #
+    #   \return A list of tuples with the name of the stage and the time in
+    #   seconds. The first stage splits the g-code into lines.
+    def getStageTimes(self):
+        return list(self._stage_times)
+
+    def _process(self, gcode_list, processors):
+        stage_names = ["split"] + [processor.getPluginId() for processor in processors]
+        # The time spent in each stage including the stages before it.
+        cumulative_times = [0.0] * len(stage_names)
+
+        lines = self._timeStage(self._splitLines(gcode_list), cumulative_times, 0)
+        for index, processor in enumerate(processors):
+            lines = self._timeStage(processor.process(lines), cumulative_times, index + 1)
+        yield from lines
+
+        times = [cumulative_times[0]] + [cumulative_times[index] - cumulative_times[index - 1] for index in range(1, len(cumulative_times))]
+        self._stage_times = list(zip(stage_names, times))
+        for name, stage_time in self._stage_times:
+            Logger.log("d", "G-code post-processing stage %s took %s seconds", name, stage_time)
+
+    def _splitLines(self, gcode_list):
+        for gcode in gcode_list:
+            yield from gcode.splitlines(True)
+
+    ##  Measure the time it takes to get the lines of a stage.
+    #
+    #   The lines are taken in batches, so measuring the time does not slow
+    #   down the pipeline much.
+    def _timeStage(self, lines, cumulative_times, index):
+        lines = iter(lines)
+        while True:
+            start_time = perf_counter()
+            batch = list(itertools.islice(lines, self.__batch_size))
+            cumulative_times[index] += perf_counter() - start_time
+            if not batch:
+                return
+            yield from batch
+
+    # The number of lines to take from a stage at once.
+    __batch_size = 4096
+
+    ##  The instance of the singleton pattern.
+    __instance = None
+
+    ##  Gets the instance of the pipeline, or creates it if it doesn't exist
+    #   yet.
+    @classmethod
+    def getInstance(cls):
+        if not cls.__instance:
+            cls.__instance = GCodePostProcessingPipeline()
+        return cls.__instance
@@ -0,0 +1,38 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.PluginObject import PluginObject
+
+##  A type of plug-ins that changes the g-code while it is written or sent to
+#   a printer.
+#
+#   Post-processors are stages of the GCodePostProcessingPipeline. Each stage
+#   gets the lines of g-code of the stage before it and generates the lines
+#   for the stage after it, one line at a time, so the g-code is never copied
+#   in full.
+class GCodePostProcessor(PluginObject):
+    def __init__(self):
+        super().__init__()
+
+    ##  Whether the stage changes the g-code with its current settings.
+    #
+    #   Stages that are not enabled are left out of the pipeline.
+    def isEnabled(self):
+        return True
+
+    ##  The order of the stage in the pipeline. Stages with a lower order get
+    #   the g-code first.
+    def getOrder(self):
+        return 0
+
+    ##  Change the g-code.
+    #
+    #   This is called once for every time the g-code is written. It should
+    #   generate the lines lazily, taking lines from the input as they are
+    #   needed.
+    #
+    #   \param lines An iterable of lines of g-code. Each line ends with a
+    #   newline, except perhaps the last line.
+    #   \return Generates the changed lines, each ending with a newline.
+    def process(self, lines):
+        raise NotImplementedError("G-code post-processor plug-in was not correctly implemented. The process function was not implemented.")
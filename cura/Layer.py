@@ -1,4 +1,5 @@
 from .LayerPolygon import LayerPolygon
+from .LayerSpatialIndex import LayerSpatialIndex
 
 from UM.Math.Vector import Vector
 from UM.Mesh.MeshBuilder import MeshBuilder
@@ -11,6 +12,9 @@ class Layer:
         self._height = 0.0
         self._thickness = 0.0
         self._polygons = []
+        self._line_mesh_polygons = None  # Simplified polygons to build the line mesh from, if a level of detail is used.
+        self._spatial_index = None
+        self._segment_end_times = None  # For each segment in the layer, the time since the start of the layer at which it is finished.
         self._element_count = 0
 
     @property
@@ -35,41 +39,169 @@ class Layer:
     def setThickness(self, thickness):
         self._thickness = thickness
 
-    def lineMeshVertexCount(self):
+    ##  Estimate how long each line segment of this layer takes to print.
+    #
+    #   The segments of all polygons are numbered consecutively, in the order
+    #   in which they are printed.
+    #
+    #   \param speeds An array with the speed (in mm/s) of each line type.
+    def buildTimeIndex(self, speeds):
+        durations = [polygon.getSegmentLengths() / speeds[polygon.types.ravel()] for polygon in self._polygons]
+        if durations:
+            self.setSegmentDurations(numpy.concatenate(durations))
+        else:
+            self.setSegmentDurations(numpy.empty(0, dtype = numpy.float32))
+
+    ##  Set how long each line segment of this layer takes to print, if that
+    #   is known from elsewhere (e.g. the feedrates in g-code).
+    #
+    #   \param durations An array with the duration of each segment, in
+    #   seconds, in the same order as for buildTimeIndex().
+    def setSegmentDurations(self, durations):
+        self._segment_end_times = numpy.cumsum(durations).astype(numpy.float32)
+
+    ##  The estimated time it takes to print this layer, in seconds.
+    @property
+    def duration(self):
+        if self._segment_end_times is None or len(self._segment_end_times) == 0:
+            return 0.0
+        return float(self._segment_end_times[-1])
+
+    ##  Find the segment that is being printed at a time.
+    #
+    #   \param time The time since the start of this layer, in seconds.
+    #   \return The number of the segment, counting the segments of all
+    #   polygons of the layer consecutively. If the layer is finished at the
+    #   time, this is the number of segments in the layer.
+    def findSegmentAtTime(self, time):
+        if self._segment_end_times is None:
+            return 0
+        return int(numpy.searchsorted(self._segment_end_times, time, side = "right"))
+
+    ##  Build the spatial index over the segments of this layer.
+    #
+    #   This is done by findSegment when the layer is first searched, as most
+    #   layers are never searched. It should only be called once all polygons
+    #   of the layer are added.
+    def buildSpatialIndex(self):
+        self._spatial_index = LayerSpatialIndex(self._polygons)
+
+    ##  Find the extrusion segment under a point in this layer.
+    #
+    #   \param x The X coordinate of the point, in layer data coordinates.
+    #   \param z The Z coordinate of the point, in layer data coordinates.
+    #   \param margin Extra distance (in mm) beyond the edge of a line at which
+    #   the line is still found.
+    #   \return A dictionary describing the segment (see
+    #   LayerSpatialIndex.findSegment), or None if there is no segment there.
+    def findSegment(self, x, z, margin = 0.0):
+        if self._spatial_index is None:
+            self.buildSpatialIndex()
+        return self._spatial_index.findSegment(x, z, margin)
+
+    ##  Use simplified polygons for the line mesh of this layer.
+    #
+    #   This only affects the line mesh that is built by build(), the meshes
+    #   created by createMesh() and createJumps() always have full detail.
+    #
+    #   \param tolerance The maximum deviation from the original paths, in mm.
+    #   If 0, the line mesh is built from the original polygons.
+    def simplifyLineMesh(self, tolerance):
+        if tolerance <= 0:
+            self._line_mesh_polygons = None
+            return
+
+        self._line_mesh_polygons = [polygon.simplify(tolerance) for polygon in self._polygons]
+
+    def _getLineMeshPolygons(self):
+        if self._line_mesh_polygons is not None:
+            return self._line_mesh_polygons
+        return self._polygons
+
+    ##  The number of vertices this layer adds to the line mesh.
+    #
+    #   \param line_type Only count the vertices of this line type. If None,
+    #   the vertices of all line types are counted.
+    def lineMeshVertexCount(self, line_type = None):
         result = 0
-        for polygon in self._polygons:
-            result += polygon.lineMeshVertexCount()
+        for polygon in self._getLineMeshPolygons():
+            result += polygon.lineMeshVertexCount(line_type)
 
         return result
 
-    def lineMeshElementCount(self):
+    ##  The number of lines this layer adds to the line mesh.
+    #
+    #   \param line_type Only count the lines of this line type. If None, the
+    #   lines of all line types are counted.
+    def lineMeshElementCount(self, line_type = None):
         result = 0
-        for polygon in self._polygons:
-            result += polygon.lineMeshElementCount()
+        for polygon in self._getLineMeshPolygons():
+            result += polygon.lineMeshElementCount(line_type)
 
         return result
 
-    def build(self, vertex_offset, index_offset, vertices, colors, indices):
-        result_vertex_offset = vertex_offset
-        result_index_offset = index_offset
-        self._element_count = 0
+    ##  Fill the line mesh buffers with the lines of this layer.
+    #
+    #   The lines of each line type go to their own range of the buffers. All
+    #   line types are filled in one pass over the polygons, so the points of
+    #   each polygon are decoded only once.
+    #
+    #   \param vertex_offsets The index of the first vertex to fill, per line
+    #   type.
+    #   \param index_offsets The index of the first line to fill, per line type.
+    def build(self, vertex_offsets, index_offsets, vertices, colors, indices):
+        vertex_offsets = dict(vertex_offsets)
+        index_offsets = dict(index_offsets)
+        for polygon in self._getLineMeshPolygons():
+            data = polygon.data
+            for line_type in vertex_offsets:
+                vertex_count, index_count = polygon.build(line_type, vertex_offsets[line_type], index_offsets[line_type], vertices, colors, indices, data)
+                vertex_offsets[line_type] += vertex_count
+                index_offsets[line_type] += index_count
+                self._element_count += index_count * 2  # Each line has two vertices.
+
+    ##  The number of lines of a line type in the mesh created by createMesh().
+    def meshLineCount(self, line_type):
+        result = 0
         for polygon in self._polygons:
-            polygon.build(result_vertex_offset, result_index_offset, vertices, colors, indices)
-            result_vertex_offset += polygon.lineMeshVertexCount()
-            result_index_offset += polygon.lineMeshElementCount()
-            self._element_count += polygon.elementCount
+            result += int(numpy.sum(numpy.logical_and(polygon.types == line_type, numpy.logical_not(polygon.jumpMask))))
 
-        return (result_vertex_offset, result_index_offset)
+        return result
 
     def createMesh(self):
         return self.createMeshOrJumps(True)
 
+    ##  Create a mesh of the extrusion lines in the order in which they are
+    #   printed, for playing back the print.
+    #
+    #   \return A tuple with the mesh and an array with, for each segment in
+    #   the layer, the number of faces in the mesh of the segments before it.
+    def createPlaybackMesh(self):
+        builder = MeshBuilder()
+        line_count = sum(polygon.meshLineCount for polygon in self._polygons)
+        builder.reserveFaceAndVertexCount(2 * line_count, 4 * line_count)
+        extrusion_masks = []
+        for polygon in self._polygons:
+            index_mask = numpy.logical_not(polygon.jumpMask)
+            self._addLineFaces(builder, polygon, index_mask, True)
+            extrusion_masks.append(index_mask.ravel())
+
+        face_offsets = numpy.zeros(1, dtype = numpy.int32)
+        if extrusion_masks:
+            face_offsets = numpy.concatenate((face_offsets, numpy.cumsum(numpy.concatenate(extrusion_masks) * 2, dtype = numpy.int32)))
+        return builder.build(), face_offsets
+
     def createJumps(self):
         return self.createMeshOrJumps(False)
 
     # Defines the two triplets of local point indices to use to draw the two faces for each line segment in createMeshOrJump
     __index_pattern = numpy.array([[0, 3, 2, 0, 1, 3]], dtype = numpy.int32 )
 
+    ##  Create a mesh with faces for either the extrusion lines or the jumps.
+    #
+    #   The faces of the extrusion lines are ordered by line type, in the
+    #   order of LayerPolygon.LineMeshTypeOrder. Together with meshLineCount()
+    #   this gives the range of faces of each line type.
     def createMeshOrJumps(self, make_mesh):
         builder = MeshBuilder()
         
@@ -84,35 +216,52 @@ class Layer:
         
         # Reserve the neccesary space for the data upfront
         builder.reserveFaceAndVertexCount(2 * line_count, 4 * line_count)
-        
-        for polygon in self._polygons:
-            # Filter out the types of lines we are not interesed in depending on whether we are drawing the mesh or the jumps.
-            index_mask = numpy.logical_not(polygon.jumpMask) if make_mesh else polygon.jumpMask
 
-            # Create an array with rows [p p+1] and only keep those we whant to draw based on make_mesh
-            points = numpy.concatenate((polygon.data[:-1], polygon.data[1:]), 1)[index_mask.ravel()]
-            # Line types of the points we want to draw
-            line_types = polygon.types[index_mask]
-            
-             # Shift the z-axis according to previous implementation. 
-            if make_mesh:
-                points[polygon.isInfillOrSkinType(line_types), 1::3] -= 0.01
-            else:
-                points[:, 1::3] += 0.01
+        if make_mesh:
+            # Decode the points of each polygon once, instead of once per line type.
+            polygon_data = [polygon.data for polygon in self._polygons]
+            for line_type in LayerPolygon.LineMeshTypeOrder:
+                for polygon, data in zip(self._polygons, polygon_data):
+                    index_mask = polygon.types == line_type
+                    # Jumps are never part of the mesh.
+                    index_mask &= numpy.logical_not(polygon.jumpMask)
+                    self._addLineFaces(builder, polygon, index_mask, make_mesh, data)
+        else:
+            for polygon in self._polygons:
+                self._addLineFaces(builder, polygon, polygon.jumpMask, make_mesh)
+
+        return builder.build()
+
+    ##  Add faces for the line segments of a polygon.
+    #
+    #   \param data The points of the polygon if they were decoded already.
+    def _addLineFaces(self, builder, polygon, index_mask, make_mesh, data = None):
+        if not numpy.any(index_mask):
+            return
 
-            # Create an array with normals and tile 2 copies to match size of points variable
-            normals = numpy.tile( polygon.getNormals()[index_mask.ravel()], (1, 2))
+        # Create an array with rows [p p+1] and only keep those we whant to draw based on the mask
+        if data is None:
+            data = polygon.data
+        points = numpy.concatenate((data[:-1], data[1:]), 1)[index_mask.ravel()]
+        # Line types of the points we want to draw
+        line_types = polygon.types[index_mask]
 
-            # Scale all normals by the line width of the current line so we can easily offset.
-            normals *= (polygon.lineWidths[index_mask.ravel()] / 2)
+        # Shift the z-axis according to previous implementation.
+        if make_mesh:
+            points[polygon.isInfillOrSkinType(line_types), 1::3] -= 0.01
+        else:
+            points[:, 1::3] += 0.01
 
-            # Create 4 points to draw each line segment, points +- normals results in 2 points each. Reshape to one point per line
-            f_points = numpy.concatenate((points-normals, points+normals), 1).reshape((-1, 3))
-            # __index_pattern defines which points to use to draw the two faces for each lines egment, the following linesegment is offset by 4 
-            f_indices = ( self.__index_pattern + numpy.arange(0, 4 * len(normals), 4, dtype=numpy.int32).reshape((-1, 1)) ).reshape((-1, 3))
-            f_colors = numpy.repeat(polygon.mapLineTypeToColor(line_types), 4, 0)
+        # Create an array with normals and tile 2 copies to match size of points variable
+        normals = numpy.tile( polygon.getNormals(data)[index_mask.ravel()], (1, 2))
 
-            builder.addFacesWithColor(f_points, f_indices, f_colors)
+        # Scale all normals by the line width of the current line so we can easily offset.
+        normals *= (polygon.lineWidths[index_mask.ravel()] / 2)
 
-        
-        return builder.build()
\ No newline at end of file
+        # Create 4 points to draw each line segment, points +- normals results in 2 points each. Reshape to one point per line
+        f_points = numpy.concatenate((points-normals, points+normals), 1).reshape((-1, 3))
+        # __index_pattern defines which points to use to draw the two faces for each lines egment, the following linesegment is offset by 4
+        f_indices = ( self.__index_pattern + numpy.arange(0, 4 * len(normals), 4, dtype=numpy.int32).reshape((-1, 1)) ).reshape((-1, 3))
+        f_colors = numpy.repeat(polygon.mapLineTypeToColor(line_types), 4, 0)
+
+        builder.addFacesWithColor(f_points, f_indices, f_colors)
@@ -2,15 +2,25 @@
 # Cura is released under the terms of the AGPLv3 or higher.
 from UM.Mesh.MeshData import MeshData
 
+import numpy
+
 ##  Class to holds the layer mesh and information about the layers.
 # Immutable, use LayerDataBuilder to create one of these.
 class LayerData(MeshData):
     def __init__(self, vertices = None, normals = None, indices = None, colors = None, uvs = None, file_name = None,
-        center_position = None, layers=None, element_counts=None):
+        center_position = None, layers=None, element_counts=None, layer_numbers=None, element_offsets=None,
+        statistics=None):
         super().__init__(vertices=vertices, normals=normals, indices=indices, colors=colors, uvs=uvs,
                          file_name=file_name, center_position=center_position)
         self._layers = layers
         self._element_counts = element_counts
+        if layer_numbers is None and layers:
+            layer_numbers = sorted(layers.keys())
+        self._layer_numbers = layer_numbers
+        self._element_offsets = element_offsets
+        self._layer_end_times = None
+        self._statistics = statistics
+        self._thumbnails = None
 
     def getLayer(self, layer):
         if layer in self._layers:
@@ -23,3 +33,69 @@ class LayerData(MeshData):
 
     def getElementCounts(self):
         return self._element_counts
+
+    ##  Get the statistics of the paths in the layers.
+    #
+    #   \return A LayerStatistics, or None if no statistics were computed.
+    def getStatistics(self):
+        return self._statistics
+
+    ##  Get the small images of the layers.
+    #
+    #   \return A LayerThumbnails, or None if the images are not drawn (yet).
+    def getThumbnails(self):
+        return self._thumbnails
+
+    ##  Set the small images of the layers, once they are drawn.
+    def setThumbnails(self, thumbnails):
+        self._thumbnails = thumbnails
+
+    ##  Delete the small images of the layers and their file.
+    #
+    #   This must be called when the layer data is discarded, as the file
+    #   would be left behind otherwise.
+    def removeThumbnails(self):
+        if self._thumbnails:
+            self._thumbnails.remove()
+            self._thumbnails = None
+
+    ##  Get the range of elements in the line mesh that contains all lines of
+    #   a line type up to and including a layer.
+    #
+    #   \param line_type The line type, one of the types in LayerPolygon.
+    #   \param last_layer The number of the last layer to include.
+    #   \return A tuple (start, end) with the range of elements.
+    def getElementRange(self, line_type, last_layer):
+        if not self._element_offsets or line_type not in self._element_offsets:
+            return (0, 0)
+
+        offsets = self._element_offsets[line_type]
+        layer_count = numpy.searchsorted(self._layer_numbers, last_layer, side = "right")
+        return (int(offsets[0]), int(offsets[layer_count]))
+
+    ##  The estimated time it takes to print all layers, in seconds.
+    def getPrintDuration(self):
+        end_times = self._getLayerEndTimes()
+        if len(end_times) == 0:
+            return 0.0
+        return float(end_times[-1])
+
+    ##  Find the layer and segment that is being printed at a time.
+    #
+    #   \param time The time since the start of the print, in seconds.
+    #   \return A tuple with the layer number and the number of the segment in
+    #   that layer (see Layer.findSegmentAtTime), or None if there are no layers.
+    def findSegmentAtTime(self, time):
+        end_times = self._getLayerEndTimes()
+        if len(end_times) == 0:
+            return None
+
+        index = min(int(numpy.searchsorted(end_times, time, side = "right")), len(end_times) - 1)
+        layer_start_time = end_times[index - 1] if index > 0 else 0.0
+        layer_number = self._layer_numbers[index]
+        return (layer_number, self._layers[layer_number].findSegmentAtTime(time - layer_start_time))
+
+    def _getLayerEndTimes(self):
+        if self._layer_end_times is None:
+            self._layer_end_times = numpy.cumsum([self._layers[layer_number].duration for layer_number in self._layer_numbers or []])
+        return self._layer_end_times
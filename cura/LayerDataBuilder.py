@@ -6,6 +6,8 @@ from .LayerPolygon import LayerPolygon
 from UM.Mesh.MeshBuilder import MeshBuilder
 from .LayerData import LayerData
 
+from UM.Logger import Logger
+
 import numpy
 
 ## Builder class for constructing a LayerData object
@@ -14,6 +16,7 @@ class LayerDataBuilder(MeshBuilder):
         super().__init__()
         self._layers = {}
         self._element_counts = {}
+        self._statistics = None
 
     def addLayer(self, layer):
         if layer not in self._layers:
@@ -48,7 +51,22 @@ class LayerDataBuilder(MeshBuilder):
 
         self._layers[layer].setThickness(thickness)
 
-    def build(self):
+    ##  Set the statistics of the layers, to pass on to the layer data.
+    #
+    #   \param statistics A LayerStatistics with the statistics of the layers.
+    def setStatistics(self, statistics):
+        self._statistics = statistics
+
+    ##  Build the layer data, with a line mesh containing all layers.
+    #
+    #   \param vertex_budget The maximum number of vertices the line mesh should
+    #   have. If the full detail line mesh has more vertices, the polygons are
+    #   simplified with increasing tolerances until it fits (or the coarsest
+    #   level of detail is reached). If 0, the line mesh always has full detail.
+    def build(self, vertex_budget = 0):
+        if vertex_budget > 0:
+            self._applyLevelOfDetail(vertex_budget)
+
         vertex_count = 0
         index_count = 0
         for layer, data in self._layers.items():
@@ -59,11 +77,32 @@ class LayerDataBuilder(MeshBuilder):
         colors = numpy.empty((vertex_count, 4), numpy.float32)
         indices = numpy.empty((index_count, 2), numpy.int32)
 
+        # The line mesh is ordered by line type first and layer second. All lines of one line type in a range of
+        # layers are then a single range of elements, so line types can be hidden without rebuilding the mesh.
+        # The ranges follow from the counts, so each layer can then fill the ranges of all its line types at once.
+        layer_numbers = sorted(self._layers.keys())
+        element_offsets = {}
+        layer_vertex_offsets = {layer: {} for layer in layer_numbers}
+        layer_index_offsets = {layer: {} for layer in layer_numbers}
         vertex_offset = 0
         index_offset = 0
+        for line_type in LayerPolygon.LineMeshTypeOrder:
+            offsets = numpy.empty(len(layer_numbers) + 1, numpy.int64)
+            for i, layer in enumerate(layer_numbers):
+                offsets[i] = index_offset * 2  # Each line has two elements.
+                layer_vertex_offsets[layer][line_type] = vertex_offset
+                layer_index_offsets[layer][line_type] = index_offset
+                vertex_offset += self._layers[layer].lineMeshVertexCount(line_type)
+                index_offset += self._layers[layer].lineMeshElementCount(line_type)
+            offsets[-1] = index_offset * 2
+            element_offsets[line_type] = offsets
+
+        for layer in layer_numbers:
+            self._layers[layer].build(layer_vertex_offsets[layer], layer_index_offsets[layer], vertices, colors, indices)
+
         for layer, data in self._layers.items():
-            ( vertex_offset, index_offset ) = data.build( vertex_offset, index_offset, vertices, colors, indices)
             self._element_counts[layer] = data.elementCount
+            data.simplifyLineMesh(0)  # The simplified polygons are only needed to fill the buffers.
 
         self.addVertices(vertices)
         self.addColors(colors)
@@ -72,4 +111,22 @@ class LayerDataBuilder(MeshBuilder):
         return LayerData(vertices=self.getVertices(), normals=self.getNormals(), indices=self.getIndices(),
                         colors=self.getColors(), uvs=self.getUVCoordinates(), file_name=self.getFileName(),
                         center_position=self.getCenterPosition(), layers=self._layers,
-                        element_counts=self._element_counts)
+                        element_counts=self._element_counts, layer_numbers=layer_numbers, element_offsets=element_offsets,
+                        statistics=self._statistics)
+
+    ##  Simplify the line mesh of all layers with the smallest tolerance that
+    #   makes it fit in the vertex budget.
+    def _applyLevelOfDetail(self, vertex_budget):
+        vertex_count = sum(layer.lineMeshVertexCount() for layer in self._layers.values())
+        for tolerance in self.__level_of_detail_tolerances:
+            if vertex_count <= vertex_budget:
+                return
+
+            vertex_count = 0
+            for layer in self._layers.values():
+                layer.simplifyLineMesh(tolerance)
+                vertex_count += layer.lineMeshVertexCount()
+            Logger.log("d", "Simplified layer line mesh with a tolerance of %s mm to %s vertices", tolerance, vertex_count)
+
+    # Tolerances (in mm) of the levels of detail of the line mesh, from fine to coarse.
+    __level_of_detail_tolerances = [0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
@@ -1,3 +1,4 @@
+from UM.Math.AxisAlignedBox import AxisAlignedBox
 from UM.Scene.SceneNodeDecorator import SceneNodeDecorator
 
 ## Simple decorator to indicate a scene node holds layer data.
@@ -5,9 +6,28 @@ class LayerDataDecorator(SceneNodeDecorator):
     def __init__(self):
         super().__init__()
         self._layer_data = None
+        self._layer_bounding_box = None
         
     def getLayerData(self):
         return self._layer_data
     
     def setLayerData(self, layer_data):
-        self._layer_data = layer_data
\ No newline at end of file
+        self._layer_data = layer_data
+
+    ##  Set the box around the paths of the layers, in the coordinates of the
+    #   node.
+    #
+    #   Nodes with layer data have no mesh, so the bounding box of the node
+    #   does not include the layers. Set this for layers that are not the
+    #   result of a slice, like a g-code file, to show their size.
+    def setLayerBoundingBox(self, bounding_box):
+        self._layer_bounding_box = bounding_box
+
+    ##  Get the box around the paths of the layers, in world coordinates.
+    #
+    #   \return An AxisAlignedBox, or None if the box is not set.
+    def getLayerBoundingBox(self):
+        if self._layer_bounding_box is None:
+            return None
+        position = self.getNode().getWorldPosition()
+        return AxisAlignedBox(minimum = self._layer_bounding_box.minimum + position, maximum = self._layer_bounding_box.maximum + position)
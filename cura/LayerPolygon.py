@@ -1,5 +1,7 @@
 from UM.Math.Color import Color
 
+from .CompactPointData import CompactPointData
+
 import numpy
 
 
@@ -15,6 +17,9 @@ class LayerPolygon:
     MoveCombingType = 8
     MoveRetractionType = 9
     
+    ##  The order in which the line types are stored in the line mesh.
+    LineMeshTypeOrder = [Inset0Type, InsetXType, SkinType, SupportType, SkirtType, InfillType, SupportInfillType, MoveCombingType, MoveRetractionType, NoneType]
+
     __jump_map = numpy.logical_or( numpy.arange(10) == NoneType, numpy.arange(10) >= MoveCombingType )
     
     def __init__(self, mesh, extruder, line_types, data, line_widths):
@@ -24,95 +29,186 @@ class LayerPolygon:
         self._data = data
         self._line_widths = line_widths
         
-        self._vertex_begin = 0
-        self._vertex_end = 0
-        self._index_begin = 0
-        self._index_end = 0
-        
         self._jump_mask = self.__jump_map[self._types]
         self._jump_count = numpy.sum(self._jump_mask)
         self._mesh_line_count = len(self._types)-self._jump_count
         self._vertex_count = self._mesh_line_count + numpy.sum( self._types[1:] == self._types[:-1])
 
-        # Buffering the colors shouldn't be necessary as it is not 
-        # re-used and can save alot of memory usage.
-        self._colors = self.__color_map[self._types]
+        # The colors are not buffered, the line types are indices in the color map which are only
+        # resolved when building the buffers. This saves a lot of memory usage.
         self._color_map = self.__color_map
-        
-        # When type is used as index returns true if type == LayerPolygon.InfillType or type == LayerPolygon.SkinType or type == LayerPolygon.SupportInfillType
-        # Should be generated in better way, not hardcoded.
-        self._isInfillOrSkinTypeMap = numpy.array([0, 0, 0, 1, 0, 0, 1, 1, 0, 0], dtype=numpy.bool)
-        
-        self._build_cache_line_mesh_mask = None
-        self._build_cache_needed_points = None
-        
+
+        # Number of vertices and indices this polygon adds to the line mesh, per line type. Filled by buildCache.
+        self._line_mesh_vertex_counts = None
+        self._line_mesh_index_counts = None
+        self._element_count = 0
+
+    ##  Count the vertices and indices this polygon needs in the line mesh for
+    #   each line type.
     def buildCache(self):
-        # For the line mesh we do not draw Infill or Jumps. Therefore those lines are filtered out.
-        self._build_cache_line_mesh_mask = numpy.logical_not(numpy.logical_or(self._jump_mask, self._types == LayerPolygon.InfillType ))
-        mesh_line_count = numpy.sum(self._build_cache_line_mesh_mask)
-        self._index_begin = 0
-        self._index_end = mesh_line_count
-        
-        self._build_cache_needed_points = numpy.ones((len(self._types), 2), dtype=numpy.bool)
-        # Only if the type of line segment changes do we need to add an extra vertex to change colors
-        self._build_cache_needed_points[1:, 0][:, numpy.newaxis] = self._types[1:] != self._types[:-1]
-        # Mark points as unneeded if they are of types we don't want in the line mesh according to the calculated mask
-        numpy.logical_and(self._build_cache_needed_points, self._build_cache_line_mesh_mask, self._build_cache_needed_points )
-        
-        self._vertex_begin = 0
-        self._vertex_end = numpy.sum( self._build_cache_needed_points )
-        
+        line_types = self._types.ravel()
+        type_changes = self.__getTypeChanges(line_types)
+
+        self._line_mesh_vertex_counts = {}
+        self._line_mesh_index_counts = {}
+        for line_type in numpy.unique(line_types):
+            line_mesh_mask = line_types == line_type
+            index_count = int(numpy.sum(line_mesh_mask))
+            # Each line segment needs an end point, and a start point only where the line type changes.
+            self._line_mesh_index_counts[line_type] = index_count
+            self._line_mesh_vertex_counts[line_type] = index_count + int(numpy.sum(type_changes[line_mesh_mask]))
 
-    def build(self, vertex_offset, index_offset, vertices, colors, indices):
-        if (self._build_cache_line_mesh_mask is None) or (self._build_cache_needed_points is None ):
+    ##  Fill the line mesh buffers with the line segments of one line type.
+    #
+    #   The line mesh is built one line type at a time, so that all segments
+    #   of a line type (in all layers) form a single range of elements that
+    #   can be drawn or hidden without rebuilding the mesh.
+    #
+    #   \param line_type The line type of the segments to add.
+    #   \param vertex_offset The index of the first vertex to fill.
+    #   \param index_offset The index of the first line to fill.
+    #   \param data The points of this polygon if they were decoded already, see
+    #   the data property.
+    #   \return A tuple with the number of vertices and lines that were added.
+    def build(self, line_type, vertex_offset, index_offset, vertices, colors, indices, data = None):
+        if self._line_mesh_index_counts is None:
             self.buildCache()
-            
-        line_mesh_mask = self._build_cache_line_mesh_mask
-        needed_points_list = self._build_cache_needed_points
-        
+
+        index_count = self._line_mesh_index_counts.get(line_type, 0)
+        if index_count == 0:
+            return (0, 0)
+        vertex_count = self._line_mesh_vertex_counts[line_type]
+        if data is None:
+            data = self.data
+
+        line_types = self._types.ravel()
+        line_mesh_mask = line_types == line_type
+        needed_points_list = numpy.empty((len(line_types), 2), dtype = numpy.bool)
+        # Only if the type of line segment changes do we need to add an extra vertex to change colors
+        needed_points_list[:, 0] = numpy.logical_and(self.__getTypeChanges(line_types), line_mesh_mask)
+        needed_points_list[:, 1] = line_mesh_mask
+
         # Index to the points we need to represent the line mesh. This is constructed by generating simple
-        # start and end points for each line. For line segment n these are points n and n+1. Row n reads [n n+1] 
-        # Then then the indices for the points we don't need are thrown away based on the pre-calculated list. 
-        index_list = ( numpy.arange(len(self._types)).reshape((-1, 1)) + numpy.array([[0, 1]]) ).reshape((-1, 1))[needed_points_list.reshape((-1, 1))]
-        
-        # The relative values of begin and end indices have already been set in buildCache, so we only need to offset them to the parents offset.
-        self._vertex_begin += vertex_offset
-        self._vertex_end += vertex_offset
-        
-        # Points are picked based on the index list to get the vertices needed. 
-        vertices[self._vertex_begin:self._vertex_end, :] = self._data[index_list, :]
-        # Create an array with colors for each vertex and remove the color data for the points that has been thrown away. 
-        colors[self._vertex_begin:self._vertex_end, :] = numpy.tile(self._colors, (1, 2)).reshape((-1, 4))[needed_points_list.ravel()] 
-        colors[self._vertex_begin:self._vertex_end, :] *= numpy.array([[0.5, 0.5, 0.5, 1.0]], numpy.float32)
-
-        # The relative values of begin and end indices have already been set in buildCache, so we only need to offset them to the parents offset.
-        self._index_begin += index_offset
-        self._index_end += index_offset
-        
-        indices[self._index_begin:self._index_end, :] = numpy.arange(self._index_end-self._index_begin, dtype=numpy.int32).reshape((-1, 1))
+        # start and end points for each line. For line segment n these are points n and n+1. Row n reads [n n+1]
+        # Then then the indices for the points we don't need are thrown away based on the mask.
+        index_list = ( numpy.arange(len(line_types)).reshape((-1, 1)) + numpy.array([[0, 1]]) ).ravel()[needed_points_list.ravel()]
+
+        vertex_end = vertex_offset + vertex_count
+        # Points are picked based on the index list to get the vertices needed.
+        vertices[vertex_offset:vertex_end, :] = data[index_list, :]
+        # All vertices have the (darkened) color of this line type.
+        colors[vertex_offset:vertex_end, :] = self._color_map[line_type] * numpy.array([0.5, 0.5, 0.5, 1.0], numpy.float32)
+
+        index_end = index_offset + index_count
+        indices[index_offset:index_end, :] = numpy.arange(index_count, dtype=numpy.int32).reshape((-1, 1))
         # When the line type changes the index needs to be increased by 2.
-        indices[self._index_begin:self._index_end, :] += numpy.cumsum(needed_points_list[line_mesh_mask.ravel(), 0], dtype=numpy.int32).reshape((-1, 1))
-        # Each line segment goes from it's starting point p to p+1, offset by the vertex index. 
-        # The -1 is to compensate for the neccecarily True value of needed_points_list[0,0] which causes an unwanted +1 in cumsum above.
-        indices[self._index_begin:self._index_end, :] += numpy.array([self._vertex_begin - 1, self._vertex_begin])
-        
-        self._build_cache_line_mesh_mask = None
-        self._build_cache_needed_points = None
+        indices[index_offset:index_end, :] += numpy.cumsum(needed_points_list[line_mesh_mask, 0], dtype=numpy.int32).reshape((-1, 1))
+        # Each line segment goes from it's starting point p to p+1, offset by the vertex index.
+        # The -1 is to compensate for the neccecarily True value of the first start point which causes an unwanted +1 in cumsum above.
+        indices[index_offset:index_end, :] += numpy.array([vertex_offset - 1, vertex_offset])
+
+        self._element_count += index_count * 2  # Each line uses two vertices.
+        return (vertex_count, index_count)
+
+    ##  True for each line segment that has a different type than the previous one.
+    @staticmethod
+    def __getTypeChanges(line_types):
+        type_changes = numpy.ones(len(line_types), dtype = numpy.bool)
+        type_changes[1:] = line_types[1:] != line_types[:-1]
+        return type_changes
+
+    ##  Create a simplified copy of this polygon, used as a level of detail
+    #   for the layer line mesh.
+    #
+    #   Vertices where the path continues in (nearly) the same direction are
+    #   removed, merging their two segments into one. This also drops segments
+    #   that are shorter than the tolerance. Vertices where the line type or the
+    #   line width changes are always kept. The removal is done in a few passes
+    #   that each never remove two neighbouring vertices, so the simplified path
+    #   never deviates more than the tolerance from the original path.
+    #
+    #   \param tolerance The maximum deviation from the original path, in mm.
+    #   \return A new LayerPolygon with the cache built, or this polygon if no
+    #   vertices could be removed.
+    def simplify(self, tolerance):
+        pass_tolerance = tolerance / self.__simplify_passes
+        data = self.data
+        keep = numpy.ones(len(data), dtype = numpy.bool)
+        for pass_number in range(self.__simplify_passes):
+            kept_indices = numpy.flatnonzero(keep)
+            if len(kept_indices) < 3:
+                break
+
+            previous_indices = kept_indices[:-2]
+            current_indices = kept_indices[1:-1]
+            previous_points = data[previous_indices]
+            segments = data[kept_indices[2:]] - previous_points
+            offsets = data[current_indices] - previous_points
+
+            # Distance of each vertex to the segment between its neighbours.
+            segment_lengths_squared = numpy.sum(segments ** 2, axis = 1)
+            projections = numpy.sum(segments * offsets, axis = 1) / numpy.maximum(segment_lengths_squared, 1e-12)
+            projections = numpy.clip(projections, 0.0, 1.0)
+            distances = numpy.sqrt(numpy.sum((offsets - segments * projections[:, numpy.newaxis]) ** 2, axis = 1))
+
+            removable = distances < pass_tolerance
+            removable &= (self._types[previous_indices] == self._types[current_indices]).ravel()
+            removable &= (self._line_widths[previous_indices] == self._line_widths[current_indices]).ravel()
+            # Never remove two neighbouring vertices in the same pass, alternate between the odd and even ones.
+            removable[(pass_number % 2)::2] = False
+            keep[current_indices[removable]] = False
+
+        if numpy.all(keep):
+            return self
+
+        # Each remaining segment starts at a kept vertex and has the type and width of that vertex' segment.
+        segment_indices = numpy.flatnonzero(keep)[:-1]
+        polygon = LayerPolygon(self._mesh, self._extruder, self._types[segment_indices], data[keep], self._line_widths[segment_indices])
+        polygon.buildCache()
+        return polygon
+
+    # Number of passes simplify() uses. Each pass may remove up to half of the vertices.
+    __simplify_passes = 4
 
     def getColors(self):
-        return self._colors
+        return self._color_map[self._types.ravel()]
+
+    ##  Get the colour of each line type.
+    #
+    #   \return An array of RGBA colours, indexed by the line type.
+    @classmethod
+    def getColorMap(cls):
+        return cls.__color_map
 
     def mapLineTypeToColor(self, line_types):
         return self._color_map[line_types]
 
     def isInfillOrSkinType(self, line_types):
-        return self._isInfillOrSkinTypeMap[line_types]
+        return self.__is_infill_or_skin_type_map[line_types]
+
+    ##  The number of vertices this polygon adds to the line mesh.
+    #
+    #   \param line_type Only count the vertices of this line type. If None,
+    #   the vertices of all line types are counted.
+    def lineMeshVertexCount(self, line_type = None):
+        if self._line_mesh_vertex_counts is None:
+            self.buildCache()
+        return self.__getLineMeshCount(self._line_mesh_vertex_counts, line_type)
 
-    def lineMeshVertexCount(self):
-        return (self._vertex_end - self._vertex_begin)
+    ##  The number of lines this polygon adds to the line mesh.
+    #
+    #   \param line_type Only count the lines of this line type. If None, the
+    #   lines of all line types are counted.
+    def lineMeshElementCount(self, line_type = None):
+        if self._line_mesh_index_counts is None:
+            self.buildCache()
+        return self.__getLineMeshCount(self._line_mesh_index_counts, line_type)
 
-    def lineMeshElementCount(self):
-        return (self._index_end - self._index_begin)
+    @staticmethod
+    def __getLineMeshCount(counts, line_type):
+        if line_type is None:
+            return sum(counts.values())
+        return counts.get(line_type, 0)
 
     @property
     def extruder(self):
@@ -122,13 +218,21 @@ class LayerPolygon:
     def types(self):
         return self._types
 
+    ##  The points of this polygon, as a float32 array of shape (n, 3).
+    #
+    #   If the points are stored as CompactPointData, they are decoded on every
+    #   access, which takes about as long as copying them. Code that needs the
+    #   points more than once should keep the result, and pass it to the
+    #   methods that accept the decoded points.
     @property
     def data(self):
+        if isinstance(self._data, CompactPointData):
+            return self._data.decode()
         return self._data
 
     @property
     def elementCount(self):
-        return (self._index_end - self._index_begin) * 2  # The range of vertices multiplied by 2 since each vertex is used twice
+        return self._element_count  # The number of lines that were built multiplied by 2 since each line has two vertices
 
     @property
     def lineWidths(self):
@@ -146,9 +250,21 @@ class LayerPolygon:
     def jumpCount(self):
         return self._jump_count
 
-    # Calculate normals for the entire polygon using numpy.
-    def getNormals(self):
-        normals = numpy.copy(self._data)
+    ##  Calculate the length of each line segment, in mm.
+    #
+    #   \param data The points of this polygon if they were decoded already.
+    def getSegmentLengths(self, data = None):
+        if data is None:
+            data = self.data
+        return numpy.sqrt(numpy.sum(numpy.diff(data, 1, 0) ** 2, axis = 1))
+
+    ##  Calculate normals for the entire polygon using numpy.
+    #
+    #   \param data The points of this polygon if they were decoded already.
+    def getNormals(self, data = None):
+        if data is None:
+            data = self.data
+        normals = numpy.copy(data)
         normals[:, 1] = 0.0 # We are only interested in 2D normals
 
         # Calculate the edges between points.
@@ -184,6 +300,10 @@ class LayerPolygon:
         MoveRetractionType: Color(0.5, 0.5, 1.0, 1.0),
     }
 
+    # When type is used as index returns true if type == LayerPolygon.InfillType or type == LayerPolygon.SkinType or type == LayerPolygon.SupportInfillType
+    # Should be generated in better way, not hardcoded.
+    __is_infill_or_skin_type_map = numpy.array([0, 0, 0, 1, 0, 0, 1, 1, 0, 0], dtype=numpy.bool)
+
     # Should be generated in better way, not hardcoded.
     __color_map = numpy.array([
         [1.0, 1.0, 1.0, 1.0],
@@ -196,4 +316,4 @@ class LayerPolygon:
         [0.0, 1.0, 1.0, 1.0],
         [0.0, 0.0, 1.0, 1.0],
         [0.5, 0.5, 1.0, 1.0]
-    ])
\ No newline at end of file
+    ], dtype = numpy.float32)
\ No newline at end of file
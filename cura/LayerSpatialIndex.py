@@ -0,0 +1,170 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+##  A uniform grid over the extrusion segments of a layer, to quickly find
+#   the segment under a point.
+#
+#   Segments are split into pieces no longer than a grid cell, and each piece
+#   is stored in the cells its bounding box overlaps. The grid is stored
+#   sparsely: a sorted array with the keys of the used cells and the offsets
+#   of their segments. Travel moves are not indexed.
+#
+#   The index does not copy the points of the layer. A segment is stored as
+#   an int32 number of the segment in all segments of the layer, and its
+#   points and line width are looked up in the polygons when it is a
+#   candidate of a query.
+#
+#   All coordinates are in the local coordinates of the layer data, in which
+#   the X and Z axes span the build plate.
+class LayerSpatialIndex:
+    ##  Build the index for a layer.
+    #
+    #   \param polygons The LayerPolygons of the layer.
+    #   \param cell_size The size of a grid cell, in mm.
+    def __init__(self, polygons, cell_size = 2.0):
+        self._cell_size = cell_size
+        self._polygons = polygons
+
+        # The number of the first segment of each polygon in all segments of the layer, and the total at the end.
+        self._polygon_offsets = numpy.zeros(len(polygons) + 1, dtype = numpy.int32)
+        numpy.cumsum([len(polygon.types) for polygon in polygons], out = self._polygon_offsets[1:])
+
+        self._buildGrid()
+
+    ##  Find the extrusion segment under a point.
+    #
+    #   \param x The X coordinate of the point.
+    #   \param z The Z coordinate of the point.
+    #   \param margin Extra distance (in mm) beyond the edge of a line at which
+    #   the line is still found.
+    #   \return A dictionary with the polygon and segment index, the line
+    #   type, extruder and line width of the nearest segment, or None if there
+    #   is no segment under the point.
+    def findSegment(self, x, z, margin = 0.0):
+        if len(self._cell_keys) == 0:
+            return None
+
+        # The point can be within reach of segments in the neighbouring cells if it is near the edge of its cell.
+        reach = margin + self._max_line_width / 2
+        min_cell = numpy.floor((numpy.array([x, z]) - reach) / self._cell_size).astype(numpy.int64)
+        max_cell = numpy.floor((numpy.array([x, z]) + reach) / self._cell_size).astype(numpy.int64)
+        candidates = []
+        for cell_x in range(min_cell[0], max_cell[0] + 1):
+            for cell_z in range(min_cell[1], max_cell[1] + 1):
+                key = self._cellKey(cell_x, cell_z)
+                position = numpy.searchsorted(self._cell_keys, key)
+                if position < len(self._cell_keys) and self._cell_keys[position] == key:
+                    candidates.append(self._cell_segments[self._cell_offsets[position]:self._cell_offsets[position + 1]])
+        if not candidates:
+            return None
+        candidates = numpy.unique(numpy.concatenate(candidates))
+
+        # Look up the candidates in their polygons.
+        candidate_polygons = numpy.searchsorted(self._polygon_offsets, candidates, side = "right") - 1
+        segment_numbers = candidates - self._polygon_offsets[candidate_polygons]
+        starts = numpy.empty((len(candidates), 2), dtype = numpy.float32)
+        ends = numpy.empty((len(candidates), 2), dtype = numpy.float32)
+        widths = numpy.empty(len(candidates), dtype = numpy.float32)
+        for polygon_index in numpy.unique(candidate_polygons):
+            mask = candidate_polygons == polygon_index
+            polygon = self._polygons[polygon_index]
+            points = polygon.data[:, [0, 2]]
+            starts[mask] = points[segment_numbers[mask]]
+            ends[mask] = points[segment_numbers[mask] + 1]
+            widths[mask] = polygon.lineWidths.ravel()[segment_numbers[mask]]
+        distances = self._pointSegmentDistances(numpy.array([x, z], dtype = numpy.float32), starts, ends)
+
+        within_reach = distances <= widths / 2 + margin
+        if not numpy.any(within_reach):
+            return None
+
+        nearest = numpy.flatnonzero(within_reach)[numpy.argmin(distances[within_reach])]
+        polygon_index = int(candidate_polygons[nearest])
+        segment_number = int(segment_numbers[nearest])
+        polygon = self._polygons[polygon_index]
+        return {
+            "polygon": polygon_index,
+            "segment": segment_number,
+            "line_type": int(polygon.types[segment_number, 0]),
+            "extruder": polygon.extruder,
+            "line_width": float(polygon.lineWidths[segment_number, 0]),
+            "distance": float(distances[nearest])
+        }
+
+    def _buildGrid(self):
+        self._max_line_width = 0.0
+        keys = []
+        entries = []
+        for polygon_index, polygon in enumerate(self._polygons):
+            numbers = numpy.flatnonzero(numpy.logical_not(polygon.jumpMask.ravel()))
+            if len(numbers) == 0:
+                continue
+            points = polygon.data[:, [0, 2]]
+            self._max_line_width = max(self._max_line_width, float(numpy.max(polygon.lineWidths.ravel()[numbers])))
+            polygon_keys, polygon_entries = self._getCells(points[numbers], points[numbers + 1])
+            keys.append(polygon_keys)
+            entries.append(numbers[polygon_entries].astype(numpy.int32) + self._polygon_offsets[polygon_index])
+
+        if not keys:
+            self._cell_keys = numpy.empty(0, dtype = numpy.int64)
+            self._cell_offsets = numpy.zeros(1, dtype = numpy.int32)
+            self._cell_segments = numpy.empty(0, dtype = numpy.int32)
+            return
+
+        # Sort by cell, and remove duplicates of a segment in a cell.
+        keys = numpy.concatenate(keys)
+        entries = numpy.concatenate(entries)
+        order = numpy.lexsort((entries, keys))
+        keys = keys[order]
+        entries = entries[order]
+        unique = numpy.ones(len(keys), dtype = numpy.bool_)
+        unique[1:] = numpy.logical_or(keys[1:] != keys[:-1], entries[1:] != entries[:-1])
+        keys = keys[unique]
+        self._cell_segments = entries[unique]
+        self._cell_keys, first_entries = numpy.unique(keys, return_index = True)
+        self._cell_offsets = numpy.append(first_entries, len(keys)).astype(numpy.int32)
+
+    ##  Find the cells that segments pass through.
+    #
+    #   \param starts The start points of the segments.
+    #   \param ends The end points of the segments.
+    #   \return The keys of the cells, and for each key the index of the
+    #   segment in starts and ends.
+    def _getCells(self, starts, ends):
+        # Split each segment in pieces that are no longer than a cell, so that long (diagonal) lines only end up in
+        # the cells they actually pass through.
+        lengths = numpy.sqrt(numpy.sum((ends - starts) ** 2, axis = 1))
+        piece_counts = numpy.maximum(numpy.ceil(lengths / self._cell_size), 1).astype(numpy.int32)
+        segments = numpy.repeat(numpy.arange(len(starts), dtype = numpy.int32), piece_counts)
+        # The index of each piece within its segment.
+        piece_numbers = numpy.arange(len(segments), dtype = numpy.int32) - numpy.repeat(numpy.cumsum(piece_counts) - piece_counts, piece_counts)
+        directions = (ends - starts)[segments] / piece_counts[segments, numpy.newaxis]
+        piece_starts = starts[segments] + directions * piece_numbers[:, numpy.newaxis]
+        piece_ends = piece_starts + directions
+
+        min_cells = numpy.floor(numpy.minimum(piece_starts, piece_ends) / self._cell_size).astype(numpy.int64)
+        max_cells = numpy.floor(numpy.maximum(piece_starts, piece_ends) / self._cell_size).astype(numpy.int64)
+        # A piece is at most one cell long, so it overlaps at most 2 by 2 cells.
+        keys = []
+        entries = []
+        for offset_x in (0, 1):
+            for offset_z in (0, 1):
+                mask = numpy.logical_and(min_cells[:, 0] + offset_x <= max_cells[:, 0], min_cells[:, 1] + offset_z <= max_cells[:, 1])
+                keys.append(self._cellKey(min_cells[mask, 0] + offset_x, min_cells[mask, 1] + offset_z))
+                entries.append(segments[mask])
+        return numpy.concatenate(keys), numpy.concatenate(entries)
+
+    ##  Combine the two cell coordinates in a single key.
+    @staticmethod
+    def _cellKey(cell_x, cell_z):
+        return numpy.left_shift(numpy.int64(cell_x), 32) + (numpy.int64(cell_z) & 0xFFFFFFFF)
+
+    @staticmethod
+    def _pointSegmentDistances(point, starts, ends):
+        segments = ends - starts
+        offsets = point - starts
+        lengths_squared = numpy.sum(segments ** 2, axis = 1)
+        projections = numpy.clip(numpy.sum(segments * offsets, axis = 1) / numpy.maximum(lengths_squared, 1e-12), 0.0, 1.0)
+        return numpy.sqrt(numpy.sum((offsets - segments * projections[:, numpy.newaxis]) ** 2, axis = 1))
@@ -0,0 +1,258 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from .LayerPolygon import LayerPolygon
+
+import numpy
+
+##  A table with statistics of the paths in each layer of a sliced print.
+#
+#   For every layer and extruder this stores the extrusion length and volume
+#   of each line type, the travel length and the number of retractions. For
+#   every layer it stores the bounding box of the extrusions. The statistics
+#   are computed once, while the layers are processed, so nobody needs to walk
+#   the polygons again to get them.
+#
+#   Add the layers with addLayer(), in any order. The table is assembled when
+#   it is first queried.
+class LayerStatistics:
+    def __init__(self):
+        self._pending_layers = {}  # Per layer number, a dictionary with the statistics of each extruder in the layer.
+        self._pending_bounds = {}
+
+        self._layer_numbers = numpy.empty(0, dtype = numpy.int32)
+        self._extrusion_lengths = numpy.zeros((0, 0, self.__type_count), dtype = numpy.float32)
+        self._extrusion_volumes = numpy.zeros((0, 0, self.__type_count), dtype = numpy.float32)
+        self._travel_lengths = numpy.zeros((0, 0), dtype = numpy.float32)
+        self._retraction_counts = numpy.zeros((0, 0), dtype = numpy.int32)
+        self._bounds = numpy.zeros((0, 4), dtype = numpy.float32)
+
+        self._print_time = None
+        self._material_amounts = []
+
+    ##  Compute the statistics of a layer.
+    #
+    #   \param layer_number The number of the layer.
+    #   \param layer The Layer, with all its polygons.
+    def addLayer(self, layer_number, layer):
+        thickness = layer.thickness / 1000  # Layer thickness is in backend representation.
+        extruders = {}
+        bounds = []
+        for polygon in layer.polygons:
+            if polygon.extruder not in extruders:
+                extruders[polygon.extruder] = (numpy.zeros(self.__type_count), numpy.zeros(self.__type_count), [0.0], [0])
+            lengths, volumes, travel_length, retraction_count = extruders[polygon.extruder]
+
+            types = polygon.types.ravel()
+            data = polygon.data
+            segment_lengths = polygon.getSegmentLengths(data)
+            jump_mask = polygon.jumpMask.ravel()
+
+            lengths += numpy.bincount(types, weights = segment_lengths, minlength = self.__type_count)
+            volumes += numpy.bincount(types, weights = segment_lengths * polygon.lineWidths.ravel() * thickness, minlength = self.__type_count)
+            travel_length[0] += float(numpy.sum(segment_lengths[jump_mask]))
+            # Every run of retracted travel moves is one retraction.
+            is_retraction = types == LayerPolygon.MoveRetractionType
+            retraction_count[0] += int(numpy.count_nonzero(is_retraction[1:] & ~is_retraction[:-1])) + int(is_retraction[:1].sum())
+
+            extrusion_segments = numpy.flatnonzero(~jump_mask)
+            if len(extrusion_segments):
+                points = numpy.concatenate((data[extrusion_segments], data[extrusion_segments + 1]))[:, [0, 2]]
+                bounds.append(numpy.concatenate((points.min(axis = 0), points.max(axis = 0))))
+
+        for extruder, (lengths, volumes, travel_length, retraction_count) in extruders.items():
+            # Travel moves are in the travel length, not in the extrusion length.
+            lengths[self.__jump_types] = 0
+            volumes[self.__jump_types] = 0
+            extruders[extruder] = (lengths, volumes, travel_length[0], retraction_count[0])
+        self._pending_layers[layer_number] = extruders
+
+        if bounds:
+            bounds = numpy.array(bounds)
+            self._pending_bounds[layer_number] = numpy.concatenate((bounds[:, :2].min(axis = 0), bounds[:, 2:].max(axis = 0)))
+        else:
+            self._pending_bounds[layer_number] = numpy.full(4, numpy.nan)
+
+    ##  Set the estimated print time and material use of the whole print.
+    #
+    #   \param print_time The print time, in seconds.
+    #   \param material_amounts The volume of material of each extruder, in
+    #   mm^3.
+    def setPrintEstimate(self, print_time, material_amounts):
+        self._print_time = print_time
+        self._material_amounts = list(material_amounts)
+
+    ##  The estimated print time in seconds, or None if it is not known.
+    def getPrintTime(self):
+        return self._print_time
+
+    ##  The estimated volume of material of each extruder, in mm^3.
+    def getMaterialAmounts(self):
+        return self._material_amounts
+
+    ##  The numbers of the layers in the table, in ascending order.
+    def getLayerNumbers(self):
+        self._assemble()
+        return self._layer_numbers
+
+    ##  The number of extruders in the table.
+    def getExtruderCount(self):
+        self._assemble()
+        return self._travel_lengths.shape[1]
+
+    ##  Get the length of the extrusions, in mm.
+    #
+    #   \param layer_number The layer to get the length of, or None for all
+    #   layers.
+    #   \param extruder The extruder to get the length of, or None for all
+    #   extruders.
+    #   \param line_type The line type to get the length of, or None for all
+    #   line types.
+    def getExtrusionLength(self, layer_number = None, extruder = None, line_type = None):
+        self._assemble()
+        return self._sum(self._extrusion_lengths, layer_number, extruder, line_type)
+
+    ##  Get the volume of the extrusions, in mm^3.
+    #
+    #   The volume is computed as the length times the line width times the
+    #   layer thickness. See getExtrusionLength() for the parameters.
+    def getExtrusionVolume(self, layer_number = None, extruder = None, line_type = None):
+        self._assemble()
+        return self._sum(self._extrusion_volumes, layer_number, extruder, line_type)
+
+    ##  Get the length of the travel moves, in mm.
+    #
+    #   \param layer_number The layer, or None for all layers.
+    #   \param extruder The extruder, or None for all extruders.
+    def getTravelLength(self, layer_number = None, extruder = None):
+        self._assemble()
+        return self._sum(self._travel_lengths, layer_number, extruder)
+
+    ##  Get the number of retractions.
+    #
+    #   \param layer_number The layer, or None for all layers.
+    #   \param extruder The extruder, or None for all extruders.
+    def getRetractionCount(self, layer_number = None, extruder = None):
+        self._assemble()
+        return int(self._sum(self._retraction_counts, layer_number, extruder))
+
+    ##  Get the bounding box of the extrusions in a layer.
+    #
+    #   \param layer_number The layer, or None for the bounding box of all
+    #   layers.
+    #   \return A tuple (min_x, min_z, max_x, max_z) in the local coordinates of
+    #   the layer data, or None if there are no extrusions.
+    def getBoundingBox(self, layer_number = None):
+        self._assemble()
+        if layer_number is None:
+            bounds = self._bounds
+        else:
+            index = self._findLayer(layer_number)
+            if index is None:
+                return None
+            bounds = self._bounds[index:index + 1]
+
+        bounds = bounds[~numpy.isnan(bounds[:, 0])]
+        if len(bounds) == 0:
+            return None
+        return (float(bounds[:, 0].min()), float(bounds[:, 1].min()), float(bounds[:, 2].max()), float(bounds[:, 3].max()))
+
+    ##  Get all statistics of a layer.
+    #
+    #   \param layer_number The layer, or None for the totals of all layers.
+    #   \return A dictionary with the statistics, for use in QML.
+    def getSummary(self, layer_number = None):
+        self._assemble()
+        if layer_number is not None and self._findLayer(layer_number) is None:
+            return {}
+
+        extruders = []
+        for extruder in range(self.getExtruderCount()):
+            extruders.append({
+                "extrusion_length": self.getExtrusionLength(layer_number, extruder),
+                "extrusion_volume": self.getExtrusionVolume(layer_number, extruder),
+                "travel_length": self.getTravelLength(layer_number, extruder),
+                "retraction_count": self.getRetractionCount(layer_number, extruder)
+            })
+
+        return {
+            "extrusion_length": self.getExtrusionLength(layer_number),
+            "extrusion_volume": self.getExtrusionVolume(layer_number),
+            "travel_length": self.getTravelLength(layer_number),
+            "retraction_count": self.getRetractionCount(layer_number),
+            "extrusion_length_per_type": [float(length) for length in self._select(self._extrusion_lengths, layer_number, None).sum(axis = (0, 1))],
+            "bounding_box": list(self.getBoundingBox(layer_number) or []),
+            "extruders": extruders
+        }
+
+    def _sum(self, table, layer_number = None, extruder = None, line_type = None):
+        selection = self._select(table, layer_number, extruder)
+        if line_type is not None:
+            selection = selection[..., line_type]
+        return float(selection.sum())
+
+    def _select(self, table, layer_number, extruder):
+        if layer_number is not None:
+            index = self._findLayer(layer_number)
+            if index is None:
+                return table[0:0]
+            table = table[index:index + 1]
+        if extruder is not None:
+            if extruder >= table.shape[1]:
+                return table[:, 0:0]
+            table = table[:, extruder:extruder + 1]
+        return table
+
+    def _findLayer(self, layer_number):
+        index = int(numpy.searchsorted(self._layer_numbers, layer_number))
+        if index < len(self._layer_numbers) and self._layer_numbers[index] == layer_number:
+            return index
+        return None
+
+    ##  Merge the layers that were added since the last query into the table.
+    def _assemble(self):
+        if not self._pending_layers:
+            return
+
+        old_layer_numbers = [layer_number for layer_number in self._layer_numbers if layer_number not in self._pending_layers]
+        layer_numbers = numpy.array(sorted(old_layer_numbers + list(self._pending_layers.keys())), dtype = numpy.int32)
+        extruder_count = max([self._travel_lengths.shape[1]] + [max(extruders.keys()) + 1 for extruders in self._pending_layers.values() if extruders])
+
+        extrusion_lengths = numpy.zeros((len(layer_numbers), extruder_count, self.__type_count), dtype = numpy.float32)
+        extrusion_volumes = numpy.zeros_like(extrusion_lengths)
+        travel_lengths = numpy.zeros((len(layer_numbers), extruder_count), dtype = numpy.float32)
+        retraction_counts = numpy.zeros((len(layer_numbers), extruder_count), dtype = numpy.int32)
+        bounds = numpy.full((len(layer_numbers), 4), numpy.nan, dtype = numpy.float32)
+
+        # Copy the rows of the layers that were already in the table.
+        old_extruder_count = self._travel_lengths.shape[1]
+        for old_index, layer_number in enumerate(self._layer_numbers):
+            if layer_number in self._pending_layers:
+                continue
+            index = int(numpy.searchsorted(layer_numbers, layer_number))
+            extrusion_lengths[index, :old_extruder_count] = self._extrusion_lengths[old_index]
+            extrusion_volumes[index, :old_extruder_count] = self._extrusion_volumes[old_index]
+            travel_lengths[index, :old_extruder_count] = self._travel_lengths[old_index]
+            retraction_counts[index, :old_extruder_count] = self._retraction_counts[old_index]
+            bounds[index] = self._bounds[old_index]
+
+        for layer_number, extruders in self._pending_layers.items():
+            index = int(numpy.searchsorted(layer_numbers, layer_number))
+            for extruder, (lengths, volumes, travel_length, retraction_count) in extruders.items():
+                extrusion_lengths[index, extruder] = lengths
+                extrusion_volumes[index, extruder] = volumes
+                travel_lengths[index, extruder] = travel_length
+                retraction_counts[index, extruder] = retraction_count
+            bounds[index] = self._pending_bounds[layer_number]
+
+        self._layer_numbers = layer_numbers
+        self._extrusion_lengths = extrusion_lengths
+        self._extrusion_volumes = extrusion_volumes
+        self._travel_lengths = travel_lengths
+        self._retraction_counts = retraction_counts
+        self._bounds = bounds
+        self._pending_layers = {}
+        self._pending_bounds = {}
+
+    __jump_types = [LayerPolygon.NoneType, LayerPolygon.MoveCombingType, LayerPolygon.MoveRetractionType]
+    __type_count = LayerPolygon.MoveRetractionType + 1
@@ -0,0 +1,38 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from PyQt5.QtGui import QImage
+from PyQt5.QtQuick import QQuickImageProvider
+from PyQt5.QtCore import QSize
+
+from .LayerThumbnails import LayerThumbnails
+
+##  Provides the small images of the layers of the sliced print to QML.
+#
+#   The id of an image is "<key>/<layer number>" for the image of a layer, or
+#   "<key>/plate" for the image of the whole print, where the key is the key
+#   of the LayerThumbnails. The key makes sure images of an older slice are
+#   not reused from the QML image cache.
+class LayerThumbnailImageProvider(QQuickImageProvider):
+    def __init__(self):
+        QQuickImageProvider.__init__(self, QQuickImageProvider.Image)
+
+    ##  Request a new image.
+    def requestImage(self, id, size):
+        thumbnails = LayerThumbnails.getSceneThumbnails()
+        key, _, name = id.partition("/")
+        if not thumbnails or thumbnails.getKey() != key:
+            return QImage(), QSize(0, 0)
+
+        if name == "plate":
+            pixels = thumbnails.getPlateImage()
+        else:
+            try:
+                pixels = thumbnails.getLayerImage(int(name))
+            except ValueError:
+                pixels = None
+        if pixels is None:
+            return QImage(), QSize(0, 0)
+
+        image = LayerThumbnails.createQImage(pixels)
+        return image, image.size()
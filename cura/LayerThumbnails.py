@@ -0,0 +1,104 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from PyQt5.QtGui import QImage, qRgba
+
+from UM.Application import Application
+from UM.Logger import Logger
+from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
+
+from .LayerPolygon import LayerPolygon
+
+import numpy
+import os
+
+##  Small top-down images of every layer of a sliced print, and of the whole
+#   print as seen from above.
+#
+#   The pixels of the images are line types, so the images are indexed colour
+#   images with the colours of the line types. 0 is the background. The layer
+#   images are stored in a file, one file per slice, and read from it when
+#   they are needed. Use LayerThumbnailJob to create them.
+class LayerThumbnails:
+    ##  \param file_name The file with the layer images, a numpy array of shape
+    #   (layer count, size, size).
+    #   \param layer_numbers The number of the layer of each image in the file.
+    #   \param plate_image The image of the whole print.
+    def __init__(self, file_name, layer_numbers, plate_image):
+        self._file_name = file_name
+        self._layer_numbers = numpy.asarray(layer_numbers)
+        self._plate_image = plate_image
+        self._images = None
+
+    ##  A key that is unique for this slice, to tell images of different slices
+    #   apart.
+    def getKey(self):
+        return os.path.splitext(os.path.basename(self._file_name))[0]
+
+    ##  The width and height of the images, in pixels.
+    def getSize(self):
+        return self._plate_image.shape[0]
+
+    ##  Get the image of a layer.
+    #
+    #   \param layer_number The number of the layer.
+    #   \return An array of shape (size, size) with the line type of each pixel,
+    #   or None if there is no image of the layer.
+    def getLayerImage(self, layer_number):
+        index = int(numpy.searchsorted(self._layer_numbers, layer_number))
+        if index >= len(self._layer_numbers) or self._layer_numbers[index] != layer_number:
+            return None
+
+        if self._images is None:
+            try:
+                self._images = numpy.load(self._file_name, mmap_mode = "r")
+            except (OSError, ValueError) as e:
+                Logger.log("w", "Could not read layer thumbnails from %s: %s", self._file_name, str(e))
+                return None
+        return self._images[index]
+
+    ##  Get the image of the whole print, as seen from above.
+    def getPlateImage(self):
+        return self._plate_image
+
+    ##  Convert an image to a QImage, for showing it or saving it.
+    #
+    #   \param pixels An image as returned by getLayerImage() or
+    #   getPlateImage().
+    #   \return An indexed colour QImage, with a transparent background.
+    @classmethod
+    def createQImage(cls, pixels):
+        pixels = numpy.ascontiguousarray(pixels, dtype = numpy.uint8)
+        height, width = pixels.shape
+        image = QImage(pixels.data, width, height, width, QImage.Format_Indexed8)
+        image.setColorTable(cls.__getColorTable())
+        return image.copy()  # The QImage does not own the pixel data, so make a copy that does.
+
+    ##  Delete the file with the layer images.
+    def remove(self):
+        self._images = None
+        self._layer_numbers = self._layer_numbers[:0]
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    ##  Get the thumbnails of the print in the scene.
+    #
+    #   \return The LayerThumbnails of the current slice, or None if there are
+    #   none (yet).
+    @staticmethod
+    def getSceneThumbnails():
+        for node in DepthFirstIterator(Application.getInstance().getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data:
+                return layer_data.getThumbnails()
+        return None
+
+    @staticmethod
+    def __getColorTable():
+        color_map = (LayerPolygon.getColorMap() * 255).astype(numpy.int32)
+        color_table = [qRgba(0, 0, 0, 0)]
+        for color in color_map[1:]:
+            color_table.append(qRgba(color[0], color[1], color[2], color[3]))
+        return color_table
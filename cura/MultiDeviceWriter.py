@@ -0,0 +1,162 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+from UM.Logger import Logger
+from UM.Message import Message
+from UM.Signal import Signal
+from UM.OutputDevice import OutputDeviceError
+
+from cura.EncodedGCode import EncodedGCode
+from cura.ProgressWriteMeshJob import WriteProgressCallback
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+##  Writes the g-code of the scene to several output devices at once.
+#
+#   The g-code is written and post-processed once, into an EncodedGCode spool
+#   file. Then all devices write the spool file at the same time, each in its
+#   own job. The progress of encoding and of all devices is shown as one
+#   progress message, and when all devices are done a message tells which
+#   devices succeeded and which failed, and why.
+#
+#   Devices that can't write encoded g-code (that have no requestWriteEncoded
+#   method) are asked to write the scene themselves.
+class MultiDeviceWriter:
+    ##  \param devices The output devices to write to.
+    #   \param node The node to write, usually the root of the scene.
+    #   \param file_name The name of the file to write, without extension.
+    def __init__(self, devices, node, file_name):
+        self._devices = list(devices)
+        self._node = node
+        self._file_name = file_name
+        self._encoded_gcode = None
+        self._encode_progress = 0
+        self._device_progress = {}  # Per device ID, the progress in percent.
+        self._device_errors = {}  # Per device ID that failed, the error message.
+        self._done_devices = set()
+        self._message = None
+        self._finished = False
+
+    ##  Emitted when writing to all devices is done.
+    #
+    #   \param writer The MultiDeviceWriter.
+    finished = Signal()
+
+    ##  The errors of the devices that failed.
+    #
+    #   \return A dictionary with the error message per device ID.
+    def getErrors(self):
+        return dict(self._device_errors)
+
+    ##  Start encoding the g-code and writing it to the devices.
+    def start(self):
+        self._message = Message(catalog.i18nc("@info:progress", "Saving to {0} devices").format(len(self._devices)), 0, False, 0)
+        self._message.show()
+        job = EncodeGCodeJob(self._node)
+        job.progress.connect(self._onEncodeProgress)
+        job.finished.connect(self._onEncodeFinished)
+        job.start()
+
+    def _onEncodeProgress(self, job, progress):
+        self._encode_progress = progress
+        self._updateProgress()
+
+    def _onEncodeFinished(self, job):
+        self._encoded_gcode = job.getResult()
+        self._encode_progress = 100
+        if self._encoded_gcode is None:
+            for device in self._devices:
+                self._device_errors[device.getId()] = catalog.i18nc("@info:status", "There is no g-code to write")
+                self._done_devices.add(device.getId())
+            self._checkFinished()
+            return
+
+        for device in self._devices:
+            self._device_progress[device.getId()] = 0
+            device.writeProgress.connect(self._onWriteProgress)
+            device.writeSuccess.connect(self._onWriteSuccess)
+            device.writeError.connect(self._onWriteError)
+            try:
+                if hasattr(device, "requestWriteEncoded"):
+                    device.requestWriteEncoded(self._encoded_gcode, self._node, self._file_name)
+                else:
+                    device.requestWrite(self._node, self._file_name)
+            except OutputDeviceError.WriteRequestFailedError as e:
+                Logger.log("e", "Could not write to %s: %s", device.getId(), str(e))
+                self._setDeviceDone(device, str(e) or catalog.i18nc("@info:status", "The device could not write the file"))
+        self._checkFinished()
+
+    def _onWriteProgress(self, device, progress):
+        if device.getId() in self._device_progress:
+            self._device_progress[device.getId()] = progress
+            self._updateProgress()
+
+    def _onWriteSuccess(self, device):
+        self._setDeviceDone(device)
+        self._checkFinished()
+
+    def _onWriteError(self, device):
+        self._setDeviceDone(device, catalog.i18nc("@info:status", "The device could not write the file"))
+        self._checkFinished()
+
+    ##  Mark a device as done and stop listening to it.
+    #
+    #   \param error The error message if the device failed, or None if it
+    #   succeeded.
+    def _setDeviceDone(self, device, error = None):
+        if device.getId() in self._done_devices:
+            return
+        self._done_devices.add(device.getId())
+        self._device_progress[device.getId()] = 100
+        if error is not None:
+            self._device_errors[device.getId()] = error
+        device.writeProgress.disconnect(self._onWriteProgress)
+        device.writeSuccess.disconnect(self._onWriteSuccess)
+        device.writeError.disconnect(self._onWriteError)
+
+    ##  Show the progress of encoding and of all devices, encoding counting as
+    #   one more device.
+    def _updateProgress(self):
+        if self._message:
+            total = self._encode_progress + sum(self._device_progress.values())
+            self._message.setProgress(total / (len(self._devices) + 1))
+
+    def _checkFinished(self):
+        if self._finished or len(self._done_devices) < len(self._devices):
+            return
+        self._finished = True
+
+        if self._message:
+            self._message.hide()
+            self._message = None
+        if self._encoded_gcode:
+            self._encoded_gcode.remove()
+            self._encoded_gcode = None
+
+        lines = []
+        for device in self._devices:
+            error = self._device_errors.get(device.getId())
+            if error is None:
+                lines.append(catalog.i18nc("@info:status", "{0}: saved").format(device.getName()))
+            else:
+                lines.append(catalog.i18nc("@info:status", "{0}: failed, {1}").format(device.getName(), error))
+        Message("\n".join(lines)).show()
+        self.finished.emit(self)
+
+##  Job that encodes the g-code of the scene into an EncodedGCode.
+#
+#   The result of the job is the EncodedGCode, or None if there is no g-code.
+class EncodeGCodeJob(Job):
+    def __init__(self, node):
+        super().__init__()
+        self._node = node
+
+    def run(self):
+        Job.yieldThread()
+        try:
+            self.setResult(EncodedGCode.encode(self._node, WriteProgressCallback(self)))
+        except OSError as e:
+            Logger.log("e", "Could not encode the g-code: %s", str(e))
+            self.setResult(None)
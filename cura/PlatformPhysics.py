@@ -32,6 +32,15 @@ class PlatformPhysics:
 
         Preferences.getInstance().addPreference("physics/automatic_push_free", True)
 
+    ##  Whether a node was found outside the build volume, or overlapping one
+    #   of its disallowed areas, when the scene last changed.
+    #
+    #   \param node The scene node to check.
+    #   \return True if the node can't be printed where it is.
+    @staticmethod
+    def isOutsideBuildArea(node):
+        return getattr(node, "_outside_buildarea", False)
+
     def _onSceneChanged(self, source):
         self._change_timer.start()
 
@@ -44,6 +53,9 @@ class PlatformPhysics:
         for node in BreadthFirstIterator(root):
             if node is root or type(node) is not SceneNode or node.getBoundingBox() is None:
                 continue
+            # Layer data (e.g. of a g-code file) is not a physical object.
+            if node.callDecoration("getLayerData"):
+                continue
 
             bbox = node.getBoundingBox()
 
@@ -4,14 +4,19 @@
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtProperty, pyqtSlot
 
 from UM.Application import Application
+from UM.Backend.Backend import BackendState
+from UM.Logger import Logger
 from UM.Qt.Duration import Duration
 from UM.Preferences import Preferences
+from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
 
 import cura.Settings.ExtruderManager
+from cura.ProvisionalPrintEstimator import ProvisionalPrintEstimator
 
 import math
 import os.path
 import unicodedata
+from time import time
 
 ##  A class for processing and calculating minimum, current and maximum print time as well as managing the job name
 #
@@ -48,10 +53,15 @@ class PrintInformation(QObject):
 
         self._material_lengths = []
         self._material_weights = []
+        self._estimate_provisional = False
+        self._provisional_estimator = ProvisionalPrintEstimator()
 
         self._backend = Application.getInstance().getBackend()
         if self._backend:
             self._backend.printDurationMessage.connect(self._onPrintDurationMessage)
+            self._backend.slicingStarted.connect(self._onSlicingStarted)
+            self._backend.slicingCancelled.connect(self._clearProvisionalEstimate)
+            self._backend.backendStateChange.connect(self._onBackendStateChange)
 
         self._job_name = ""
         self._abbr_machine = ""
@@ -65,6 +75,12 @@ class PrintInformation(QObject):
     def currentPrintTime(self):
         return self._current_print_time
 
+    ##  Whether the print time and material are a quick estimate from the
+    #   meshes, shown until the engine has sliced the print.
+    @pyqtProperty(bool, notify = currentPrintTimeChanged)
+    def estimateProvisional(self):
+        return self._estimate_provisional
+
     materialLengthsChanged = pyqtSignal()
 
     @pyqtProperty("QVariantList", notify = materialLengthsChanged)
@@ -78,6 +94,17 @@ class PrintInformation(QObject):
         return self._material_weights
 
     def _onPrintDurationMessage(self, total_time, material_amounts):
+        self.setPrintDuration(total_time, material_amounts)
+
+    ##  Set the print time and the amounts of material of the current print.
+    #
+    #   \param total_time The print time, in seconds.
+    #   \param material_amounts The volume of material of each extruder, in
+    #   mm^3.
+    #   \param provisional Whether this is a quick estimate, that is replaced
+    #   when the print is sliced.
+    def setPrintDuration(self, total_time, material_amounts, provisional = False):
+        self._estimate_provisional = provisional
         self._current_print_time.setDuration(total_time)
         self.currentPrintTimeChanged.emit()
 
@@ -100,6 +127,61 @@ class PrintInformation(QObject):
         self.materialLengthsChanged.emit()
         self.materialWeightsChanged.emit()
 
+    ##  Show a quick estimate of the print while the engine slices it.
+    def _onSlicingStarted(self):
+        stack = Application.getInstance().getGlobalContainerStack()
+        if not stack:
+            return
+        start_time = time()
+        try:
+            print_time, material_amount = self._provisional_estimator.estimateScene(Application.getInstance().getController().getScene().getRoot(), stack)
+        except (TypeError, ValueError, ZeroDivisionError) as e:  # Settings that can't be used for an estimate.
+            Logger.log("w", "Could not estimate the print: %s", str(e))
+            return
+        if print_time <= 0:
+            return
+        self.setPrintDuration(print_time, [material_amount], provisional = True)
+        Logger.log("d", "Estimating the print took %s seconds", time() - start_time)
+
+    ##  Remove the quick estimate when the slice it was made for won't finish,
+    #   since no print duration message of the engine will replace it then.
+    def _clearProvisionalEstimate(self):
+        if self._estimate_provisional:
+            self.setPrintDuration(0, [0])
+
+    def _onBackendStateChange(self, state):
+        if state == BackendState.Error or state == BackendState.NotStarted:  # The slice could not be started.
+            self._clearProvisionalEstimate()
+
+    ##  Get the statistics of the paths in a layer of the sliced print.
+    #
+    #   The statistics are computed when the layers are processed, see
+    #   LayerStatistics.getSummary() for what they contain.
+    #
+    #   \param layer_number The number of the layer.
+    #   \return A map with the statistics, empty if there is no such layer.
+    @pyqtSlot(int, result = "QVariantMap")
+    def getLayerStatistics(self, layer_number):
+        statistics = self._getLayerStatistics()
+        if not statistics:
+            return {}
+        return statistics.getSummary(layer_number)
+
+    ##  Get the statistics of the paths in all layers of the sliced print.
+    @pyqtSlot(result = "QVariantMap")
+    def getPrintStatistics(self):
+        statistics = self._getLayerStatistics()
+        if not statistics:
+            return {}
+        return statistics.getSummary()
+
+    def _getLayerStatistics(self):
+        for node in DepthFirstIterator(Application.getInstance().getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data:
+                return layer_data.getStatistics()
+        return None
+
     @pyqtSlot(str)
     def setJobName(self, name):
         # Ensure that we don't use entire path but only filename
@@ -0,0 +1,130 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+##  Estimates how long the moves of a print take, with the motion planning
+#   model of the firmware.
+#
+#   Every move accelerates from its entry speed to its nominal speed, cruises
+#   and decelerates to its exit speed (a trapezoidal speed profile). The speed
+#   at the junction of two moves is limited by the jerk: the change of the
+#   velocity of each axis at the junction. Like in the firmware, the entry
+#   speeds are then lowered where a move is too short to decelerate to the
+#   entry speed of the next move (the backward pass), or to accelerate to its
+#   exit speed (the forward pass).
+#
+#   Both passes are done for all moves at once. In squared speeds every pass
+#   is a recurrence of the form v[i] = min(limit[i], v[i + 1] + 2 * a * length),
+#   which is a cumulative minimum of the limits plus the cumulative sum of the
+#   lengths. So the estimate needs no loop over the moves.
+#
+#   Moves can be estimated in consecutive batches with estimate(): the velocity
+#   at the end of a batch is kept for the junction with the next batch.
+class PrintTimeEstimator:
+    ##  \param max_feedrates The maximum speed of the X, Y, Z and E axes, in
+    #   mm/s.
+    #   \param max_accelerations The maximum acceleration of the X, Y, Z and E
+    #   axes, in mm/s^2.
+    #   \param acceleration The acceleration of moves, in mm/s^2.
+    #   \param max_jerks The maximum change of speed at a junction in the
+    #   horizontal plane, of the Z axis and of the E axis, in mm/s.
+    #   \param minimum_feedrate The minimum speed of moves, in mm/s.
+    def __init__(self, max_feedrates = (500, 500, 5, 25), max_accelerations = (9000, 9000, 100, 10000), acceleration = 4000, max_jerks = (20, 0.4, 5), minimum_feedrate = 0):
+        self._max_feedrates = numpy.array(max_feedrates, dtype = numpy.float64)
+        self._max_accelerations = numpy.array(max_accelerations, dtype = numpy.float64)
+        self._acceleration = float(acceleration)
+        self._max_jerks = numpy.array(max_jerks, dtype = numpy.float64)
+        self._minimum_feedrate = float(minimum_feedrate)
+        self.reset()
+
+    ##  Create an estimator with the motion settings of a machine.
+    #
+    #   \param stack The global container stack of the machine.
+    @classmethod
+    def fromSettings(cls, stack):
+        def value(key):
+            return float(stack.getProperty(key, "value"))
+        return cls(max_feedrates = [value("machine_max_feedrate_" + axis) for axis in "xyze"],
+                   max_accelerations = [value("machine_max_acceleration_" + axis) for axis in "xyze"],
+                   acceleration = value("machine_acceleration"),
+                   max_jerks = [value("machine_max_jerk_xy"), value("machine_max_jerk_z"), value("machine_max_jerk_e")],
+                   minimum_feedrate = value("machine_minimum_feedrate"))
+
+    ##  Forget the moves that were estimated, to start a new print.
+    def reset(self):
+        self._previous_velocity = numpy.zeros(4)  # The print head starts standing still.
+        self._previous_nominal_speed = numpy.inf
+
+    ##  Estimate the duration of moves.
+    #
+    #   \param deltas An array of shape (n, 4) with the distance that each move
+    #   moves the X, Y, Z and E axes, in mm.
+    #   \param feedrates An array with the requested speed of each move, in
+    #   mm/s.
+    #   \return An array with the duration of each move, in seconds.
+    def estimate(self, deltas, feedrates):
+        deltas = numpy.asarray(deltas, dtype = numpy.float64)
+        durations = numpy.zeros(len(deltas))
+        # Like in the firmware the length of a move is the length in XYZ, or of the filament if the head doesn't move.
+        lengths = numpy.sqrt(numpy.sum(deltas[:, :3] ** 2, axis = 1))
+        lengths = numpy.where(lengths > 0, lengths, numpy.abs(deltas[:, 3]))
+        moves = numpy.flatnonzero(lengths > 0)
+        if len(moves) == 0:
+            return durations
+        lengths = lengths[moves]
+        axis_fractions = numpy.abs(deltas[moves]) / lengths[:, numpy.newaxis]
+
+        # The speed and acceleration of a move are limited by the limits of each axis.
+        with numpy.errstate(divide = "ignore"):
+            nominal_speeds = numpy.maximum(numpy.asarray(feedrates, dtype = numpy.float64)[moves], self._minimum_feedrate)
+            nominal_speeds = numpy.minimum(nominal_speeds, numpy.min(self._max_feedrates / axis_fractions, axis = 1))
+            nominal_speeds = numpy.maximum(nominal_speeds, 1e-3)
+            accelerations = numpy.minimum(self._acceleration, numpy.min(self._max_accelerations / axis_fractions, axis = 1))
+
+        velocities = deltas[moves] / lengths[:, numpy.newaxis] * nominal_speeds[:, numpy.newaxis]
+        previous_velocities = numpy.concatenate((self._previous_velocity[numpy.newaxis, :], velocities[:-1]))
+        previous_nominal_speeds = numpy.concatenate(([self._previous_nominal_speed], nominal_speeds[:-1]))
+
+        # The squared speed limits at the start of every move, and at the end of the last move.
+        entry_limits = (numpy.minimum(nominal_speeds, previous_nominal_speeds) * self._getJerkFactors(velocities - previous_velocities)) ** 2
+        exit_limit = (nominal_speeds[-1] * self._getJerkFactors(velocities[-1:])[0]) ** 2  # As if the head stops after the last move.
+        limits = numpy.append(entry_limits, exit_limit)
+
+        # The squared speed that can be gained or lost in each move, and the sum of it over all moves before each junction.
+        speed_changes = 2 * accelerations * lengths
+        cumulative_changes = numpy.concatenate(([0.0], numpy.cumsum(speed_changes)))
+
+        # Backward pass: every move must be able to decelerate to the speed at its end.
+        squared_speeds = numpy.minimum.accumulate((limits + cumulative_changes)[::-1])[::-1] - cumulative_changes
+        # Forward pass: every move must be able to accelerate to the speed at its end.
+        squared_speeds = numpy.minimum.accumulate(squared_speeds - cumulative_changes) + cumulative_changes
+        speeds = numpy.sqrt(numpy.maximum(squared_speeds, 0.0))
+        entry_speeds = numpy.minimum(speeds[:-1], nominal_speeds)
+        exit_speeds = numpy.minimum(speeds[1:], nominal_speeds)
+
+        # The distance it takes to accelerate and decelerate to the nominal speed.
+        acceleration_lengths = (nominal_speeds ** 2 - entry_speeds ** 2) / (2 * accelerations)
+        deceleration_lengths = (nominal_speeds ** 2 - exit_speeds ** 2) / (2 * accelerations)
+        cruise_lengths = lengths - acceleration_lengths - deceleration_lengths
+        # Moves that are too short to reach the nominal speed accelerate to a lower peak speed.
+        peak_speeds = numpy.where(cruise_lengths >= 0, nominal_speeds,
+                                  numpy.sqrt(numpy.maximum((speed_changes + entry_speeds ** 2 + exit_speeds ** 2) / 2, 0.0)))
+        peak_speeds = numpy.maximum(peak_speeds, numpy.maximum(entry_speeds, exit_speeds))
+        durations[moves] = ((peak_speeds - entry_speeds) + (peak_speeds - exit_speeds)) / accelerations + numpy.maximum(cruise_lengths, 0.0) / nominal_speeds
+
+        self._previous_velocity = velocities[-1]
+        self._previous_nominal_speed = nominal_speeds[-1]
+        return durations
+
+    ##  Get the factor with which the speeds at junctions must be scaled so
+    #   that the jerk of every axis stays within the limits.
+    #
+    #   \param velocity_changes An array of shape (n, 4) with the change of
+    #   the velocity of the X, Y, Z and E axes at each junction, at the nominal
+    #   speeds of the moves.
+    def _getJerkFactors(self, velocity_changes):
+        jerks = numpy.column_stack((numpy.sqrt(velocity_changes[:, 0] ** 2 + velocity_changes[:, 1] ** 2), numpy.abs(velocity_changes[:, 2]), numpy.abs(velocity_changes[:, 3])))
+        # An axis of which the velocity doesn't change doesn't limit the speed, also if its jerk is 0.
+        factors = numpy.divide(self._max_jerks, jerks, out = numpy.full(jerks.shape, numpy.inf), where = jerks > 0)
+        return numpy.minimum(1.0, numpy.min(factors, axis = 1))
@@ -0,0 +1,48 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Mesh.WriteMeshJob import WriteMeshJob
+from UM.Job import Job
+
+##  A job that writes a node with a mesh writer, and reports the progress of
+#   writing if the writer can tell it.
+#
+#   Writers that can report their progress have a writeWithProgress() method
+#   that takes the same arguments as write(), and a callback that is called
+#   with the number of bytes written and the total number of bytes. The
+#   progress is emitted with the progress signal of the job, in percent.
+class ProgressWriteMeshJob(WriteMeshJob):
+    def __init__(self, writer, stream, node, mode):
+        super().__init__(writer, stream, node, mode)
+        self._progress_writer = writer
+        self._progress_stream = stream
+        self._progress_node = node
+        self._progress_mode = mode
+
+    def run(self):
+        write_with_progress = getattr(self._progress_writer, "writeWithProgress", None)
+        if write_with_progress is None:
+            super().run()
+            return
+
+        Job.yieldThread()
+        self.setResult(write_with_progress(self._progress_stream, self._progress_node, self._progress_mode, WriteProgressCallback(self)))
+
+##  A callback for writing that emits the progress of a job.
+#
+#   It is called with the number of bytes written and the total number of
+#   bytes, and emits the progress signal of the job in percent. The signal is
+#   only emitted when the percentage changes, since the progress is shown in
+#   messages. Writing yields to other threads after each call.
+class WriteProgressCallback:
+    ##  \param job The job to emit the progress of.
+    def __init__(self, job):
+        self._job = job
+        self._last_progress = -1
+
+    def __call__(self, written_size, total_size):
+        progress = int(100 * written_size / total_size) if total_size else 100
+        if progress != self._last_progress:
+            self._last_progress = progress
+            self._job.progress.emit(self._job, progress)
+        Job.yieldThread()
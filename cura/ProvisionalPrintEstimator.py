@@ -0,0 +1,133 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Scene.SceneNode import SceneNode
+from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
+
+from cura.PlatformPhysics import PlatformPhysics
+
+import numpy
+import weakref
+
+##  Makes a quick estimate of the print time and material of the objects in
+#   the scene, from the volume and surface area of their meshes.
+#
+#   This estimate is shown while the engine is slicing, until the estimate of
+#   the engine arrives. The shell of an object is estimated from the surface
+#   area: the walls from the area of the sides and the top and bottom skin
+#   from the area of the faces that point up or down. The rest of the volume
+#   is filled with infill of the infill density. The print time is the length
+#   of the lines divided by their speed, plus a fixed share for travel moves
+#   and acceleration.
+#
+#   The volume and face normals of each mesh are computed once and cached.
+#   For a transformed object the volume is scaled with the determinant of the
+#   transformation and the normals are transformed with its cofactor matrix,
+#   so changing the transformation needs no new pass over the vertices.
+class ProvisionalPrintEstimator:
+    def __init__(self):
+        self._mesh_properties = weakref.WeakKeyDictionary()  # Per MeshData, a tuple with the volume and the face normals.
+
+    ##  Estimate the print time and material of the printable objects in a
+    #   scene.
+    #
+    #   \param root The root node of the scene.
+    #   \param stack The global container stack with the settings to print
+    #   with.
+    #   \return A tuple with the print time in seconds and the volume of
+    #   material in mm^3.
+    def estimateScene(self, root, stack):
+        volume = 0.0
+        side_area = 0.0
+        flat_area = 0.0
+        for node in DepthFirstIterator(root):
+            if type(node) is not SceneNode or not node.getMeshData() or node.getMeshData().getVertices() is None:
+                continue
+            if PlatformPhysics.isOutsideBuildArea(node):
+                continue
+            node_volume, node_side_area, node_flat_area = self.getNodeProperties(node)
+            volume += node_volume
+            side_area += node_side_area
+            flat_area += node_flat_area
+        return self.estimate(volume, side_area, flat_area, stack)
+
+    ##  Estimate the print time and material of an object.
+    #
+    #   \param volume The volume of the object, in mm^3.
+    #   \param side_area The area of the sides of the object, in mm^2.
+    #   \param flat_area The area of the faces that point up or down, in mm^2.
+    #   \param stack The global container stack with the settings to print
+    #   with.
+    #   \return A tuple with the print time in seconds and the volume of
+    #   material in mm^3.
+    def estimate(self, volume, side_area, flat_area, stack):
+        def value(key):
+            return float(stack.getProperty(key, "value"))
+        layer_height = value("layer_height")
+        wall_line_width = value("wall_line_width_x")
+        skin_line_width = value("skin_line_width")
+        infill_line_width = value("infill_line_width")
+
+        wall_volume = side_area * value("wall_line_count") * wall_line_width
+        skin_volume = flat_area * value("top_bottom_thickness")
+        shell_volume = wall_volume + skin_volume
+        if shell_volume > volume > 0:
+            # Thin objects are all shell.
+            wall_volume *= volume / shell_volume
+            skin_volume *= volume / shell_volume
+            shell_volume = volume
+        infill_volume = max(volume - shell_volume, 0.0) * value("infill_sparse_density") / 100
+
+        # The length of the lines follows from the volume of the material in them.
+        print_time = (wall_volume / (wall_line_width * layer_height) / value("speed_wall")
+                      + skin_volume / (skin_line_width * layer_height) / value("speed_topbottom")
+                      + infill_volume / (infill_line_width * layer_height) / value("speed_infill"))
+        return print_time * self.__overhead_factor, wall_volume + skin_volume + infill_volume
+
+    ##  Get the volume and surface area of the mesh of a node, as it is placed
+    #   in the scene.
+    #
+    #   \return A tuple with the volume, the area of the sides and the area of
+    #   the faces that point up or down.
+    def getNodeProperties(self, node):
+        local_volume, local_normals = self.getMeshProperties(node.getMeshData())
+        transformation = node.getWorldTransformation().getData()[:3, :3]
+        determinant = numpy.linalg.det(transformation)
+        if determinant == 0 or len(local_normals) == 0:
+            return 0.0, 0.0, 0.0
+
+        # The cross product of two transformed edges is the cofactor matrix times the cross product of the edges.
+        cofactors = determinant * numpy.linalg.inv(transformation).T
+        normals = local_normals.dot(cofactors.T.astype(numpy.float32))
+        areas = numpy.sqrt(numpy.sum(normals ** 2, axis = 1)) / 2
+        # Y is up in the scene.
+        is_flat = numpy.abs(normals[:, 1]) > self.__flat_threshold * areas * 2
+        flat_area = float(numpy.sum(areas[is_flat]))
+        return float(abs(determinant) * local_volume), float(numpy.sum(areas)) - flat_area, flat_area
+
+    ##  Get the volume and face normals of a mesh, from the cache if possible.
+    #
+    #   \return A tuple with the volume of the mesh, and an array of shape
+    #   (faces, 3) with the normal of every face, with a length of twice the
+    #   area of the face.
+    def getMeshProperties(self, mesh_data):
+        properties = self._mesh_properties.get(mesh_data)
+        if properties is None:
+            vertices = numpy.asarray(mesh_data.getVertices(), dtype = numpy.float64)
+            indices = mesh_data.getIndices()
+            if indices is not None:
+                triangles = vertices[numpy.asarray(indices).reshape((-1, 3))]
+            else:
+                triangles = vertices[:len(vertices) // 3 * 3].reshape((-1, 3, 3))
+
+            normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+            # The volume is the sum of the signed volumes of the tetrahedrons of the faces and the origin.
+            volume = abs(float(numpy.sum(normals * triangles[:, 0]))) / 6
+            properties = (volume, normals.astype(numpy.float32))
+            self._mesh_properties[mesh_data] = properties
+        return properties
+
+    # Faces of which the normal is closer to vertical than this (the cosine of the angle) are top or bottom faces.
+    __flat_threshold = 0.7
+    # The print time of the lines is increased by this factor for travel moves, acceleration and retractions.
+    __overhead_factor = 1.25
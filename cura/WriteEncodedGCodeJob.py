@@ -0,0 +1,40 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+from cura.ProgressWriteMeshJob import WriteProgressCallback
+
+##  A job that writes encoded g-code to a stream.
+#
+#   This is the counterpart of ProgressWriteMeshJob for g-code that is
+#   already encoded, see EncodedGCode. It has the same interface, so output
+#   devices can handle both jobs the same way.
+class WriteEncodedGCodeJob(Job):
+    ##  \param encoded_gcode The EncodedGCode to write.
+    #   \param stream The binary stream to write to.
+    #   \param mime_type The MIME type to write the g-code as.
+    def __init__(self, encoded_gcode, stream, mime_type):
+        super().__init__()
+        self._encoded_gcode = encoded_gcode
+        self._stream = stream
+        self._mime_type = mime_type
+        self._file_name = ""
+
+    def getStream(self):
+        return self._stream
+
+    def setFileName(self, file_name):
+        self._file_name = file_name
+
+    def getFileName(self):
+        return self._file_name
+
+    def run(self):
+        Job.yieldThread()
+        try:
+            encoded_gcode = self._encoded_gcode.getAs([self._mime_type])
+            self.setResult(encoded_gcode is not None and encoded_gcode.copyTo(self._stream, WriteProgressCallback(self)))
+        except OSError as e:
+            self.setError(e)
+            self.setResult(False)
@@ -93,7 +93,7 @@ class CuraEngineBackend(Backend):
         self._restart = False  # Back-end is currently restarting?
         self._enabled = True  # Should we be slicing? Slicing might be paused when, for instance, the user is dragging the mesh around.
         self._always_restart = True  # Always restart the engine when starting a new slice. Don't keep the process running. TODO: Fix engine statelessness.
-        self._process_layers_job = None  # The currently active job to process layers, or None if it is not processing layers.
+        self._process_layers_job = None  # The last job to process layers. It also keeps the job that draws their thumbnails.
 
         self._backend_log_max_lines = 20000  # Maximum number of lines to buffer
         self._error_message = None  # Pop-up message that shows errors.
@@ -150,7 +150,7 @@ class CuraEngineBackend(Backend):
         if self._slicing:  # We were already slicing. Stop the old job.
             self._terminate()
 
-        if self._process_layers_job:  # We were processing layers. Stop that, the layers are going to change soon.
+        if self._process_layers_job:  # We were processing layers or drawing their thumbnails. Stop that, the layers are going to change soon.
             self._process_layers_job.abort()
             self._process_layers_job = None
 
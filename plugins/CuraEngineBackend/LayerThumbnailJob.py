@@ -0,0 +1,116 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+from UM.Logger import Logger
+
+from cura.LayerThumbnails import LayerThumbnails
+
+import numpy
+import os
+import tempfile
+from time import time
+
+##  Job that draws a small top-down image of every layer of the layer data.
+#
+#   The paths are rasterized on the CPU: every extrusion segment is sampled
+#   about once per pixel and the line type of the segment is written to the
+#   pixels of the samples. This is done for all segments of a layer at once
+#   with numpy, which is much faster than rendering the layers with OpenGL.
+#   The result of the job is a LayerThumbnails.
+class LayerThumbnailJob(Job):
+    ##  \param layer_data The LayerData to draw the layers of.
+    #   \param size The width and height of the images, in pixels.
+    def __init__(self, layer_data, size = 64):
+        super().__init__()
+        self._layer_data = layer_data
+        self._size = size
+        self._abort_requested = False
+
+    ##  The LayerData the images are drawn of.
+    def getLayerData(self):
+        return self._layer_data
+
+    ##  Aborts drawing the layers, on a best-effort basis.
+    def abort(self):
+        self._abort_requested = True
+
+    def run(self):
+        start_time = time()
+        layer_numbers = sorted(self._layer_data.getLayers().keys())
+        bounds = self._getBounds(layer_numbers)
+        if bounds is None:
+            return
+
+        # Scale the print to fit the images, keeping its aspect ratio and centering it.
+        origin = numpy.array(bounds[:2], dtype = numpy.float32)
+        extent = numpy.array(bounds[2:], dtype = numpy.float32) - origin
+        scale = (self._size - 1) / max(float(extent.max()), 1e-3)
+        origin -= ((self._size - 1) / scale - extent) / 2
+
+        handle, file_name = tempfile.mkstemp(prefix = "cura_layer_thumbnails_", suffix = ".npy")
+        os.close(handle)
+        images = numpy.lib.format.open_memmap(file_name, mode = "w+", dtype = numpy.uint8, shape = (len(layer_numbers), self._size, self._size))
+        plate_image = numpy.zeros((self._size, self._size), dtype = numpy.uint8)
+
+        for index, layer_number in enumerate(layer_numbers):
+            image = images[index]
+            for polygon in self._layer_data.getLayer(layer_number).polygons:
+                self._drawPolygon(image, polygon, origin, scale)
+
+            # Seen from above, every layer covers the layers below it.
+            covered = image != 0
+            plate_image[covered] = image[covered]
+
+            if self._abort_requested:
+                del image, images
+                os.remove(file_name)
+                return
+            Job.yieldThread()
+
+        images.flush()
+        del images
+        self.setResult(LayerThumbnails(file_name, layer_numbers, plate_image))
+        Logger.log("d", "Drawing %s layer thumbnails took %s seconds", len(layer_numbers), time() - start_time)
+
+    ##  Get the area to draw, from the layer statistics if available.
+    #
+    #   \return A tuple (min_x, min_z, max_x, max_z), or None if there is
+    #   nothing to draw.
+    def _getBounds(self, layer_numbers):
+        statistics = self._layer_data.getStatistics()
+        if statistics:
+            return statistics.getBoundingBox()
+
+        minimum = numpy.full(2, numpy.inf)
+        maximum = numpy.full(2, -numpy.inf)
+        for layer_number in layer_numbers:
+            for polygon in self._layer_data.getLayer(layer_number).polygons:
+                points = polygon.data[:, [0, 2]]
+                minimum = numpy.minimum(minimum, points.min(axis = 0))
+                maximum = numpy.maximum(maximum, points.max(axis = 0))
+        if not numpy.all(numpy.isfinite(minimum)):
+            return None
+        return (minimum[0], minimum[1], maximum[0], maximum[1])
+
+    ##  Draw the extrusions of a polygon in an image.
+    #
+    #   Later segments are drawn over earlier ones, like they are printed.
+    def _drawPolygon(self, image, polygon, origin, scale):
+        segments = numpy.flatnonzero(numpy.logical_not(polygon.jumpMask.ravel()))
+        if len(segments) == 0:
+            return
+
+        data = polygon.data
+        starts = (data[segments][:, [0, 2]] - origin) * scale
+        ends = (data[segments + 1][:, [0, 2]] - origin) * scale
+
+        # Sample each segment at least once per pixel.
+        sample_counts = numpy.ceil(numpy.abs(ends - starts).max(axis = 1)).astype(numpy.int64) + 1
+        sample_segments = numpy.repeat(numpy.arange(len(segments)), sample_counts)
+        sample_numbers = numpy.arange(len(sample_segments)) - numpy.repeat(numpy.cumsum(sample_counts) - sample_counts, sample_counts)
+        fractions = sample_numbers / numpy.maximum(sample_counts[sample_segments] - 1, 1)
+        samples = starts[sample_segments] + (ends - starts)[sample_segments] * fractions[:, numpy.newaxis]
+
+        pixels = numpy.clip(numpy.rint(samples).astype(numpy.int64), 0, self._size - 1)
+        image[pixels[:, 1], pixels[:, 0]] = polygon.types.ravel()[segments][sample_segments]
@@ -10,12 +10,17 @@ from UM.Mesh.MeshData import MeshData
 from UM.Message import Message
 from UM.i18n import i18nCatalog
 from UM.Logger import Logger
+from UM.Preferences import Preferences
 
 from UM.Math.Vector import Vector
 
 from cura import LayerDataBuilder
 from cura import LayerDataDecorator
 from cura import LayerPolygon
+from cura.LayerStatistics import LayerStatistics
+
+from . import LayerThumbnailJob
+from cura.CompactPointData import CompactPointData
 
 import numpy
 from time import time
@@ -29,6 +34,7 @@ class ProcessSlicedLayersJob(Job):
         self._scene = Application.getInstance().getController().getScene()
         self._progress = None
         self._abort_requested = False
+        self._thumbnail_job = None  # Draws the layer thumbnails after the layers are processed.
 
     ##  Aborts the processing of layers.
     #
@@ -36,8 +42,13 @@ class ProcessSlicedLayersJob(Job):
     #   job thread will check once in a while to see whether an abort is
     #   requested and then stop processing by itself. There is no guarantee
     #   that the abort will stop the job any time soon or even at all.
+    #
+    #   If the layers were processed already, the drawing of their thumbnails
+    #   is aborted.
     def abort(self):
         self._abort_requested = True
+        if self._thumbnail_job:
+            self._thumbnail_job.abort()
 
     def run(self):
         start_time = time()
@@ -56,8 +67,10 @@ class ProcessSlicedLayersJob(Job):
 
         ## Remove old layer data (if any)
         for node in DepthFirstIterator(self._scene.getRoot()):
-            if node.callDecoration("getLayerData"):
+            old_layer_data = node.callDecoration("getLayerData")
+            if old_layer_data:
                 node.getParent().removeChild(node)
+                old_layer_data.removeThumbnails()
                 break
             if self._abort_requested:
                 if self._progress:
@@ -77,6 +90,9 @@ class ProcessSlicedLayersJob(Job):
                 min_layer_number = layer.id
 
         current_layer = 0
+        line_type_speeds = self._getLineTypeSpeeds()
+        layer_statistics = LayerStatistics()
+        compact_layer_data = bool(Preferences.getInstance().getValue("view/compact_layer_data"))
 
         for layer in self._layers:
             abs_layer_number = layer.id + abs(min_layer_number)
@@ -116,12 +132,23 @@ class ProcessSlicedLayersJob(Job):
                     new_points[:, 1] = points[:, 2]
                     new_points[:, 2] = -points[:, 1]
 
+                if compact_layer_data:
+                    # Store the points as quantized integers if that can be done without any loss.
+                    compact_points = CompactPointData.encode(new_points)
+                    if compact_points is not None:
+                        new_points = compact_points
+
                 this_poly = LayerPolygon.LayerPolygon(layer_data, extruder, line_types, new_points, line_widths)
                 this_poly.buildCache()
                 
                 this_layer.polygons.append(this_poly)
 
                 Job.yieldThread()
+
+            # Index the segments so LayerView can quickly find when they are printed. The spatial index is built
+            # when the layer is first picked.
+            this_layer.buildTimeIndex(line_type_speeds)
+            layer_statistics.addLayer(abs_layer_number, this_layer)
             Job.yieldThread()
             current_layer += 1
             progress = (current_layer / layer_count) * 99
@@ -136,7 +163,10 @@ class ProcessSlicedLayersJob(Job):
                 self._progress.setProgress(progress)
 
         # We are done processing all the layers we got from the engine, now create a mesh out of the data
-        layer_mesh = layer_data.build()
+        # Lower layers are simplified if needed to keep huge prints within the vertex budget.
+        layer_data.setStatistics(layer_statistics)
+        vertex_budget = int(Preferences.getInstance().getValue("view/layer_line_mesh_vertex_budget"))
+        layer_mesh = layer_data.build(vertex_budget)
 
         if self._abort_requested:
             if self._progress:
@@ -158,6 +188,13 @@ class ProcessSlicedLayersJob(Job):
         if not settings.getProperty("machine_center_is_zero", "value"):
             new_node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
 
+        # Draw the layer thumbnails in the background, they are not needed to show the layers.
+        # The job is kept before checking for an abort, so an abort at any time stops it.
+        self._thumbnail_job = LayerThumbnailJob.LayerThumbnailJob(layer_mesh, int(Preferences.getInstance().getValue("view/layer_thumbnail_size")))
+        self._thumbnail_job.finished.connect(self._onThumbnailJobFinished)
+        if not self._abort_requested:
+            self._thumbnail_job.start()
+
         if self._progress:
             self._progress.setProgress(100)
 
@@ -173,6 +210,52 @@ class ProcessSlicedLayersJob(Job):
 
         Logger.log("d", "Processing layers took %s seconds", time() - start_time)
 
+    def _onThumbnailJobFinished(self, job):
+        thumbnails = job.getResult()
+        if not thumbnails:
+            return
+
+        for node in DepthFirstIterator(self._scene.getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data is job.getLayerData():
+                layer_data.setThumbnails(thumbnails)
+                view = Application.getInstance().getController().getActiveView()
+                if view.getPluginId() == "LayerView":
+                    view.layerThumbnailsChanged.emit()
+                return
+
+        # The layers were replaced by a newer slice while drawing.
+        thumbnails.remove()
+
+    ##  Get the print speed of each line type from the active machine.
+    #
+    #   \return An array with the speed (in mm/s) of each line type, indexed by
+    #   the line type.
+    def _getLineTypeSpeeds(self):
+        settings = Application.getInstance().getGlobalContainerStack()
+        speeds = numpy.ones(len(self._line_type_speed_settings), dtype = numpy.float32)
+        for line_type, setting_key in self._line_type_speed_settings.items():
+            speed = settings.getProperty(setting_key, "value") if settings else None
+            if speed:
+                speeds[line_type] = max(float(speed), 1.0)
+            else:
+                speeds[line_type] = 60.0
+        return speeds
+
+    ##  The setting with the speed of each line type.
+    _line_type_speed_settings = {
+        LayerPolygon.LayerPolygon.NoneType: "speed_travel",
+        LayerPolygon.LayerPolygon.Inset0Type: "speed_wall_0",
+        LayerPolygon.LayerPolygon.InsetXType: "speed_wall_x",
+        LayerPolygon.LayerPolygon.SkinType: "speed_topbottom",
+        LayerPolygon.LayerPolygon.SupportType: "speed_support",
+        LayerPolygon.LayerPolygon.SkirtType: "skirt_brim_speed",
+        LayerPolygon.LayerPolygon.InfillType: "speed_infill",
+        LayerPolygon.LayerPolygon.SupportInfillType: "speed_support_infill",
+        LayerPolygon.LayerPolygon.MoveCombingType: "speed_travel",
+        LayerPolygon.LayerPolygon.MoveRetractionType: "speed_travel"
+    }
+
     def _onActiveViewChanged(self):
         if self.isRunning():
             if Application.getInstance().getController().getActiveView().getPluginId() == "LayerView":
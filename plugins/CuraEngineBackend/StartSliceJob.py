@@ -90,8 +90,10 @@ class StartSliceJob(Job):
         with self._scene.getSceneLock():
             # Remove old layer data.
             for node in DepthFirstIterator(self._scene.getRoot()):
-                if node.callDecoration("getLayerData"):
+                old_layer_data = node.callDecoration("getLayerData")
+                if old_layer_data:
                     node.getParent().removeChild(node)
+                    old_layer_data.removeThumbnails()
                     break
 
             # Get the objects in their groups to print.
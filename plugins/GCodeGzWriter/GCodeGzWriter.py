@@ -0,0 +1,45 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Mesh.MeshWriter import MeshWriter
+from UM.Logger import Logger
+from UM.PluginRegistry import PluginRegistry
+
+import gzip
+
+##  Writes g-code to a gzip compressed file.
+#
+#   The g-code is produced by the g-code writer and compressed while it is
+#   written, so the uncompressed g-code is never stored in full. G-code
+#   compresses very well, so much less has to be written to slow media.
+class GCodeGzWriter(MeshWriter):
+    def __init__(self):
+        super().__init__()
+
+    def write(self, stream, node, mode = MeshWriter.OutputMode.BinaryMode):
+        return self.writeWithProgress(stream, node, mode)
+
+    ##  Write the compressed g-code to a stream, reporting the progress.
+    #
+    #   \param stream A binary stream to write to.
+    #   \param node Not used, the g-code of the entire scene is written.
+    #   \param mode The output mode, must be binary.
+    #   \param progress_callback Called with the number of uncompressed bytes
+    #   written and the total number of uncompressed bytes.
+    #   \return True if the g-code was written, or False otherwise.
+    def writeWithProgress(self, stream, node, mode = MeshWriter.OutputMode.BinaryMode, progress_callback = None):
+        if mode != MeshWriter.OutputMode.BinaryMode:
+            Logger.log("e", "Compressed G-code Writer does not support text mode.")
+            return False
+
+        gcode_writer = PluginRegistry.getInstance().getPluginObject("GCodeWriter")
+        if not gcode_writer:
+            Logger.log("e", "The GCodeWriter plug-in is needed to write compressed g-code.")
+            return False
+
+        # Closing the gzip stream finishes the compressed data, but leaves the stream itself open.
+        with gzip.GzipFile(fileobj = stream, mode = "wb", compresslevel = self.__compress_level) as gzip_stream:
+            return gcode_writer.writeWithProgress(gzip_stream, node, MeshWriter.OutputMode.BinaryMode, progress_callback)
+
+    # Level 6 compresses g-code nearly as well as level 9, in much less time.
+    __compress_level = 6
@@ -0,0 +1,30 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from . import GCodeGzWriter
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+def getMetaData():
+    return {
+        "plugin": {
+            "name": catalog.i18nc("@label", "Compressed G-code Writer"),
+            "author": "Ultimaker",
+            "version": "1.0",
+            "description": catalog.i18nc("@info:whatsthis", "Writes g-code to a compressed file."),
+            "api": 3
+        },
+
+        "mesh_writer": {
+            "output": [{
+                "extension": "gcode.gz",
+                "description": catalog.i18nc("@item:inlistbox", "Compressed G-code File"),
+                "mime_type": "application/gzip",
+                "mode": GCodeGzWriter.GCodeGzWriter.OutputMode.BinaryMode
+            }]
+        }
+    }
+
+def register(app):
+    return { "mesh_writer": GCodeGzWriter.GCodeGzWriter() }
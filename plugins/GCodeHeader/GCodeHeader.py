@@ -0,0 +1,32 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Preferences import Preferences
+
+from cura.GCodePostProcessor import GCodePostProcessor
+
+##  Adds custom lines to the start of the g-code.
+#
+#   The lines are in the preference "post_processing/header", separated by
+#   "\n" (a backslash and an n, so the preference fits on one line).
+class GCodeHeader(GCodePostProcessor):
+    def __init__(self):
+        super().__init__()
+        Preferences.getInstance().addPreference("post_processing/header", "")
+
+    def isEnabled(self):
+        return bool(self._getHeader())
+
+    def getOrder(self):
+        return 30  # The header is not changed by other stages.
+
+    def process(self, lines):
+        for line in self._getHeader():
+            yield line + "\n"
+        yield from lines
+
+    def _getHeader(self):
+        header = Preferences.getInstance().getValue("post_processing/header")
+        if not header:
+            return []
+        return header.replace("\\n", "\n").split("\n")
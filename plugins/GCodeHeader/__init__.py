@@ -0,0 +1,21 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from . import GCodeHeader
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+def getMetaData():
+    return {
+        "plugin": {
+            "name": catalog.i18nc("@label", "G-code Header"),
+            "author": "Ultimaker",
+            "version": "1.0",
+            "description": catalog.i18nc("@info:whatsthis", "Adds custom lines to the start of the g-code."),
+            "api": 3
+        }
+    }
+
+def register(app):
+    return { "gcode_post_processor": GCodeHeader.GCodeHeader() }
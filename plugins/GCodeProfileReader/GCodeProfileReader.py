@@ -3,6 +3,7 @@
 
 import re #Regular expressions for parsing escape characters in the settings.
 import json
+import gzip
 
 from UM.Settings.InstanceContainer import InstanceContainer
 from UM.Logger import Logger
@@ -45,25 +46,17 @@ class GCodeProfileReader(ProfileReader):
     #   specified file was no g-code or contained no parsable profile, \code
     #   None \endcode is returned.
     def read(self, file_name):
-        if file_name.split(".")[-1] != "gcode":
+        if not file_name.endswith(".gcode") and not file_name.endswith(".gcode.gz"):
             return None
 
-        prefix = ";SETTING_" + str(GCodeProfileReader.version) + " "
-        prefix_length = len(prefix)
-
-        # Loading all settings from the file.
-        # They are all at the end, but Python has no reverse seek any more since Python3.
-        # TODO: Consider moving settings to the start?
-        serialized = ""  # Will be filled with the serialized profile.
         try:
-            with open(file_name) as f:
-                for line in f:
-                    if line.startswith(prefix):
-                        # Remove the prefix and the newline from the line and add it to the rest.
-                        serialized += line[prefix_length : -1]
+            serialized = readSerializedSettings(file_name)
         except IOError as e:
             Logger.log("e", "Unable to open file %s for reading: %s", file_name, str(e))
             return None
+        if serialized is None:
+            Logger.log("w", "No profile found in %s", file_name)
+            return None
 
         serialized = unescapeGcodeComment(serialized)
         Logger.log("i", "Serialized the following from %s: %s" %(file_name, repr(serialized)))
@@ -75,6 +68,109 @@ class GCodeProfileReader(ProfileReader):
 
         return [readQualityProfileFromString(profile_string) for profile_string in profile_strings]
 
+##  Read the serialized settings at the end of a g-code file.
+#
+#   The settings are the last lines of the file. Only the end of the file is
+#   read: if the file ends with the index line that the g-code writer adds,
+#   the settings are read directly, otherwise the file is read backwards in
+#   blocks until all lines with settings are found. Compressed files can't be
+#   read backwards, so they are read from the start.
+#
+#   \param file_name The name of the g-code file.
+#   \return The serialized settings, still escaped, or None if the file has no
+#   settings near its end.
+def readSerializedSettings(file_name):
+    prefix = (";SETTING_" + str(GCodeProfileReader.version) + " ").encode("utf-8")
+    with open(file_name, "rb") as f:
+        if f.read(2) == b"\x1f\x8b":  # The magic number of gzip.
+            f.seek(0)
+            with gzip.GzipFile(fileobj = f, mode = "rb") as gzip_file:
+                lines = [line for line in gzip_file if line.startswith(prefix)]
+        else:
+            f.seek(0, 2)
+            size = f.tell()
+            lines = _readIndexedSettings(f, size, prefix)
+            if lines is None:
+                lines = _readSettingsBackwards(f, size, prefix)
+
+    if not lines:
+        return None
+    # Remove the prefix and the newline from the lines and join them.
+    return "".join(line[len(prefix):].rstrip(b"\r\n").decode("utf-8") for line in lines)
+
+##  Read the settings with the index line at the end of the file.
+#
+#   \return The lines with settings, or None if the file has no valid index.
+def _readIndexedSettings(f, size, prefix):
+    index_prefix = prefix[:-1] + b"_INDEX "
+    tail_size = min(size, _index_tail_size)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    index_start = tail.rfind(b"\n" + index_prefix) + 1
+    if index_start <= 0:
+        return None
+    try:
+        settings_size = int(tail[index_start + len(index_prefix):].strip())
+    except ValueError:
+        return None
+
+    settings_end = size - tail_size + index_start
+    settings_start = settings_end - settings_size
+    if settings_size <= 0 or settings_start < 0:
+        return None
+    f.seek(max(settings_start - 1, 0))
+    data = f.read(settings_end - max(settings_start - 1, 0))
+    if settings_start > 0:
+        # The settings must start at the start of a line.
+        if data[:1] != b"\n":
+            return None
+        data = data[1:]
+
+    lines = data.splitlines(True)
+    if not all(line.startswith(prefix) for line in lines):
+        return None  # The file was changed after it was written.
+    return lines
+
+##  Read the file backwards in blocks until all lines with settings are
+#   found.
+#
+#   Lines without settings after the settings are skipped, but the settings
+#   are not searched for further than _settings_search_size from the end.
+#
+#   \return The lines with settings, in the order of the file.
+def _readSettingsBackwards(f, size, prefix):
+    lines = []
+    rest = b""  # The start of the first line of the last block read, which may continue in the block before it.
+    position = size
+    while position > 0:
+        block_size = min(_block_size, position)
+        position -= block_size
+        f.seek(position)
+        block_lines = (f.read(block_size) + rest).split(b"\n")
+        if position > 0:
+            rest = block_lines.pop(0)
+
+        for line in reversed(block_lines):
+            if line.startswith(prefix):
+                lines.append(line)
+            elif lines:
+                # All settings are together, so the settings are complete.
+                lines.reverse()
+                return lines
+
+        if not lines and size - position >= _settings_search_size:
+            return []
+
+    lines.reverse()
+    return lines
+
+# The size of the blocks in which a g-code file is read backwards.
+_block_size = 64 * 1024
+# How far from the end of a g-code file the settings are searched for.
+_settings_search_size = 4 * 1024 * 1024
+# How far from the end of a g-code file the index line is searched for.
+_index_tail_size = 256
+
 ##  Unescape a string which has been escaped for use in a gcode comment.
 #
 #   \param string The string to unescape.
@@ -0,0 +1,503 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from cura.LayerPolygon import LayerPolygon
+from cura.PrintTimeEstimator import PrintTimeEstimator
+
+import gzip
+import math
+import mmap
+import numpy
+
+##  Parses g-code files into the layers and paths of LayerPolygons.
+#
+#   The file is memory mapped (or decompressed, if it is compressed with gzip)
+#   and parsed in large chunks. Within a chunk all
+#   lines are tokenized at once with numpy: the lines are found from the
+#   positions of the newlines, the commands from the first characters of each
+#   line and the X, Y, Z, E and F parameters by decoding the digits after each
+#   of these letters in bulk. The state of the printer (position, extrusion
+#   mode, line type, extruder, layer) is then propagated over the lines with
+#   cumulative numpy operations instead of a loop over the lines.
+#
+#   Moves are classified into the LayerPolygon line types: extrusions get the
+#   type of the last ;TYPE: comment, moves without extrusion are travels, or
+#   retracted travels if the filament is retracted. Layers are started by
+#   Cura's ;LAYER: comments. If there is no such comment before the first
+#   extrusion, a new layer is started whenever the extrusions go up.
+#
+#   The duration of the moves is estimated with a PrintTimeEstimator, and the
+#   filament that is used is counted per extruder.
+class GCodeParser:
+    ##  \param filament_diameter The diameter of the filament, in mm, to compute
+    #   the width of the extruded lines.
+    #   \param default_line_width The line width to use when it can not be
+    #   computed from the extrusion.
+    #   \param chunk_size The approximate number of bytes to parse at once.
+    #   \param estimator The PrintTimeEstimator to estimate the duration of the
+    #   moves with, or None to use one with default machine settings.
+    def __init__(self, filament_diameter = 2.85, default_line_width = 0.4, chunk_size = 16 * 1024 * 1024, estimator = None):
+        self._filament_area = math.pi * (filament_diameter / 2) ** 2
+        self._default_line_width = default_line_width
+        self._chunk_size = chunk_size
+        self._estimator = estimator or PrintTimeEstimator()
+        self._resetState()
+
+    ##  Parse a g-code file.
+    #
+    #   This is a generator: the layers are produced while the file is parsed,
+    #   as soon as they are complete.
+    #
+    #   \param file_name The g-code file to parse.
+    #   \param progress_callback Called with the fraction (0 - 1) of the file
+    #   that is parsed, after every chunk.
+    #   \return Generates a tuple for every layer, with the layer number, the
+    #   height and thickness of the layer in mm, a list of tuples (extruder,
+    #   line types, points, line widths) with the arrays for the LayerPolygons
+    #   and an array with the duration of each segment in seconds.
+    def parse(self, file_name, progress_callback = None):
+        self._resetState()
+        for data, start, end, progress in self._readChunks(file_name):
+            moves = self._parseChunk(data, start, end)
+            for layer in self._addMoves(moves):
+                yield layer
+
+            if progress_callback:
+                progress_callback(progress)
+
+        for layer in self._addMoves(None, is_last = True):
+            yield layer
+
+    ##  The estimated time it takes to print the file that was parsed, in
+    #   seconds.
+    def getPrintTime(self):
+        return self._print_time
+
+    ##  The length of filament that the file that was parsed uses, in mm.
+    #
+    #   \return A list with the length for each extruder.
+    def getFilamentLengths(self):
+        return [float(length) for length in self._filament_lengths]
+
+    ##  The volume of filament that the file that was parsed uses, in mm^3.
+    #
+    #   \return A list with the volume for each extruder.
+    def getMaterialAmounts(self):
+        return [length * self._filament_area for length in self.getFilamentLengths()]
+
+    ##  Read a g-code file in chunks of whole lines.
+    #
+    #   Uncompressed files are memory mapped. Files that are compressed with
+    #   gzip are decompressed one chunk at a time.
+    #
+    #   \return Generates tuples with a buffer, the start and end of the chunk
+    #   in the buffer, and the fraction of the file that is read.
+    def _readChunks(self, file_name):
+        with open(file_name, "rb") as f:
+            is_compressed = f.read(2) == b"\x1f\x8b"  # The magic number of gzip.
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(0)
+            if size == 0:
+                return
+
+            if is_compressed:
+                with gzip.GzipFile(fileobj = f, mode = "rb") as gzip_file:
+                    rest = b""
+                    while True:
+                        block = gzip_file.read(self._chunk_size)
+                        data = rest + block
+                        if not block:
+                            if data:
+                                yield data, 0, len(data), 1.0
+                            return
+
+                        # Only parse whole lines, the rest goes in the next chunk.
+                        end = data.rfind(b"\n") + 1
+                        rest = data[end:]
+                        if end > 0:
+                            yield data, 0, end, f.tell() / size
+                return
+
+            mapped_file = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                start = 0
+                while start < size:
+                    end = min(start + self._chunk_size, size)
+                    if end < size:
+                        newline = mapped_file.rfind(b"\n", start, end)
+                        if newline >= 0:
+                            end = newline + 1
+
+                    yield mapped_file, start, end, end / size
+                    start = end
+            finally:
+                mapped_file.close()
+
+    def _resetState(self):
+        self._position = numpy.zeros(3)
+        self._e = 0.0
+        self._relative_e = 0.0
+        self._relative_xyz = 0.0
+        self._retracted = 0.0
+        self._feedrate = 60.0  # mm/s.
+        self._line_type = float(LayerPolygon.InfillType)
+        self._extruder = 0.0
+        self._layer = numpy.nan  # Moves before the first layer (start g-code) are not shown.
+        self._layer_offset = None
+        self._use_layer_comments = None
+        self._max_extrusion_z = -numpy.inf
+        self._height_layer = -1
+        self._pending_moves = None  # The moves of the layer that is being parsed.
+        self._previous_layer_height = 0.0
+        self._print_time = 0.0
+        self._filament_lengths = numpy.zeros(0)
+        self._pending_duration = 0.0  # The duration of moves of only the filament at the end of the last chunk.
+        self._estimator.reset()
+
+    ##  Tokenize a chunk of the file and propagate the state over its lines.
+    #
+    #   \return A dictionary with arrays with the start and end position, line
+    #   type, extruder, layer, extruded length of filament and duration of
+    #   each move that changes the position.
+    def _parseChunk(self, buffer, start, end):
+        data = numpy.frombuffer(buffer, dtype = numpy.uint8, count = end - start, offset = start)
+        # Padding, so the characters of a number after the end of the data can always be read.
+        padded = numpy.concatenate((data, numpy.zeros(self.__max_number_length + 1, dtype = numpy.uint8)))
+
+        newlines = numpy.flatnonzero(data == ord("\n"))
+        line_starts = numpy.concatenate(([0], newlines + 1))
+        line_ends = numpy.concatenate((newlines, [len(data)]))
+        if line_starts[-1] == len(data):
+            line_starts = line_starts[:-1]
+            line_ends = line_ends[:-1]
+        # Commands may be indented: a line starts at its first character that is not a space or tab.
+        non_blanks = numpy.flatnonzero((data != ord(" ")) & (data != ord("\t")))
+        non_blanks = numpy.append(non_blanks, len(data))
+        line_starts = numpy.minimum(non_blanks[numpy.searchsorted(non_blanks, line_starts)], line_ends)
+
+        # The code of a line ends at the start of its comment.
+        semicolons = numpy.flatnonzero(data == ord(";"))
+        semicolons = numpy.append(semicolons, len(data))
+        code_ends = numpy.minimum(semicolons[numpy.searchsorted(semicolons, line_starts)], line_ends)
+
+        characters = [padded[line_starts + i] for i in range(4)]
+        is_move = (characters[0] == ord("G")) & ((characters[1] == ord("0")) | (characters[1] == ord("1"))) & self._isCodeEnd(characters[2])
+        is_set_position = self._isCommand(characters, b"G92")
+        is_retract = self._isCommand(characters, b"G10")
+        is_unretract = self._isCommand(characters, b"G11")
+        is_absolute = self._isCommand(characters, b"G90")
+        is_relative = self._isCommand(characters, b"G91")
+        is_absolute_e = self._isCommand(characters, b"M82")
+        is_relative_e = self._isCommand(characters, b"M83")
+        is_tool = (characters[0] == ord("T")) & (characters[1] >= ord("0")) & (characters[1] <= ord("9"))
+        is_comment = characters[0] == ord(";")
+
+        # The comments with line types and layer numbers, and the tool changes, are rare enough to decode one by one.
+        type_values = numpy.full(len(line_starts), numpy.nan)
+        layer_values = numpy.full(len(line_starts), numpy.nan)
+        for line in numpy.flatnonzero(is_comment & ((characters[1] == ord("T")) | (characters[1] == ord("L")))):
+            text = bytes(data[line_starts[line]:line_ends[line]]).strip()
+            if text.startswith(b";TYPE:"):
+                type_values[line] = self.__type_names.get(text[6:], LayerPolygon.InfillType)
+            elif text.startswith(b";LAYER:"):
+                try:
+                    layer_values[line] = int(text[7:])
+                except ValueError:
+                    pass
+        tool_values = numpy.full(len(line_starts), numpy.nan)
+        for line in numpy.flatnonzero(is_tool):
+            try:
+                tool_values[line] = int(bytes(data[line_starts[line] + 1:code_ends[line]]).strip())
+            except ValueError:
+                pass
+
+        parameters = self._parseParameters(data, padded, line_starts, code_ends, is_move | is_set_position)
+
+        # Only the lines that change the state of the printer are of interest from here on.
+        lines = numpy.flatnonzero(is_move | is_set_position | is_retract | is_unretract | is_absolute | is_relative | is_absolute_e | is_relative_e | is_tool
+                                  | ~numpy.isnan(type_values) | ~numpy.isnan(layer_values))
+        is_move = is_move[lines]
+        is_set_position = is_set_position[lines]
+        parameters = {letter: values[lines] for letter, values in parameters.items()}
+
+        feedrates = self._forwardFill(parameters["F"] / 60, self._feedrate)
+        line_types = self._forwardFill(type_values[lines], self._line_type)
+        extruders = self._forwardFill(tool_values[lines], self._extruder)
+        layers = self._forwardFill(layer_values[lines], self._layer)
+        relative_xyz = self._forwardFill(numpy.where(is_relative[lines], 1.0, numpy.where(is_absolute[lines], 0.0, numpy.nan)), self._relative_xyz)
+        relative_e = self._forwardFill(numpy.where(is_relative_e[lines], 1.0, numpy.where(is_absolute_e[lines], 0.0, numpy.nan)), self._relative_e)
+
+        # Like in the firmware, G91 makes the moves of all axes relative, also of the extruder.
+        is_relative_move = is_move & (relative_xyz == 1)
+        is_relative_e_move = is_move & ((relative_xyz == 1) | (relative_e == 1))
+        positions = numpy.empty((len(lines), 3))
+        for axis, letter in enumerate("XYZ"):
+            positions[:, axis] = self._accumulate(parameters[letter], is_set_position | (is_move & ~is_relative_move), is_relative_move, self._position[axis])
+        e_positions = self._accumulate(parameters["E"], is_set_position | (is_move & ~is_relative_e_move), is_relative_e_move, self._e)
+        extruded = numpy.diff(numpy.concatenate(([self._e], e_positions)))
+        extruded[is_set_position] = 0.0
+
+        # The filament is retracted after a move that retracts it, until a move that pushes it back.
+        retracted = self._forwardFill(numpy.where(is_retract[lines] | (extruded < 0), 1.0,
+                                                  numpy.where(is_unretract[lines] | (extruded > 0), 0.0, numpy.nan)), self._retracted)
+
+        previous_positions = numpy.concatenate((self._position[numpy.newaxis, :], positions[:-1]))
+        if len(lines):
+            self._position = positions[-1].copy()
+            self._e = e_positions[-1]
+            self._relative_e = relative_e[-1]
+            self._relative_xyz = relative_xyz[-1]
+            self._retracted = retracted[-1]
+            self._feedrate = feedrates[-1]
+            self._line_type = line_types[-1]
+            self._extruder = extruders[-1]
+            self._layer = layers[-1]
+
+        # G92 changes the position without moving.
+        moved = is_move & numpy.any(positions != previous_positions, axis = 1)
+        durations = self._estimateDurations(positions - previous_positions, extruded, feedrates, extruders, is_move, moved)
+        starts = previous_positions[moved]
+        ends = positions[moved]
+        extruded = extruded[moved]
+        is_extrusion = (extruded > 0) & numpy.any(ends[:, :2] != starts[:, :2], axis = 1)
+        line_types = numpy.where(is_extrusion, line_types[moved],
+                                 numpy.where(retracted[moved] == 1, LayerPolygon.MoveRetractionType, LayerPolygon.MoveCombingType))
+
+        if self._use_layer_comments is None:
+            # Decide how to find the layers, from the first layer comment or the first extrusion.
+            if numpy.any(~numpy.isnan(layer_values)):
+                self._use_layer_comments = True
+                # Raft layers have negative numbers, offset all layers so that the lowest layer is 0.
+                self._layer_offset = max(0, -int(layer_values[~numpy.isnan(layer_values)][0]))
+            elif numpy.any(is_extrusion):
+                self._use_layer_comments = False
+
+        if self._use_layer_comments:
+            layers = layers[moved] + self._layer_offset
+        elif self._use_layer_comments is None:
+            layers = numpy.full(len(ends), numpy.nan)
+        else:
+            layers = self._getLayersFromHeight(ends[:, 2], is_extrusion)
+
+        return {
+            "starts": starts,
+            "ends": ends,
+            "line_types": line_types.astype(numpy.uint8),
+            "extruders": extruders[moved].astype(numpy.int32),
+            "layers": layers,
+            "extruded": numpy.where(is_extrusion, extruded, 0.0),
+            "durations": durations
+        }
+
+    ##  Estimate the duration of the moves of a chunk, and count the filament
+    #   that they use.
+    #
+    #   Moves of only the filament (retractions) are not shown, so their time
+    #   is added to the next move that is shown.
+    #
+    #   \return The duration of each move that changes the position.
+    def _estimateDurations(self, deltas, extruded, feedrates, extruders, is_move, moved):
+        is_motion = is_move & (moved | (extruded != 0))
+        extruded = extruded[is_motion]
+        motion_durations = self._estimator.estimate(numpy.column_stack((deltas[is_motion], extruded)), feedrates[is_motion])
+        self._print_time += float(numpy.sum(motion_durations))
+
+        motion_extruders = extruders[is_motion].astype(numpy.int64)
+        if len(motion_extruders):
+            filament_lengths = numpy.bincount(motion_extruders, weights = extruded, minlength = len(self._filament_lengths))
+            filament_lengths[:len(self._filament_lengths)] += self._filament_lengths
+            self._filament_lengths = filament_lengths
+
+        # The end times of the moves, of which the moves that are shown take the time since the last move that is shown.
+        end_times = numpy.cumsum(motion_durations) + self._pending_duration
+        shown_end_times = end_times[moved[is_motion]]
+        durations = numpy.diff(numpy.concatenate(([0.0], shown_end_times)))
+        if len(end_times):
+            self._pending_duration = end_times[-1] - (shown_end_times[-1] if len(shown_end_times) else 0.0)
+        return durations
+
+    ##  Decode the values of the X, Y, Z, E and F parameters of lines.
+    #
+    #   \return A dictionary with an array for each parameter, with the value
+    #   of the parameter on each line or NaN if the line does not have it.
+    def _parseParameters(self, data, padded, line_starts, code_ends, line_mask):
+        parameters = {}
+        for letter in "XYZEF":
+            positions = numpy.flatnonzero(data == ord(letter))
+            lines = numpy.searchsorted(line_starts, positions, side = "right") - 1
+            # Parameters don't need a space before them, like in G1X10Y5. The letter of the command is not one of them.
+            valid = lines >= 0
+            valid[valid] &= line_mask[lines[valid]] & (positions[valid] > line_starts[lines[valid]]) & (positions[valid] < code_ends[lines[valid]])
+            positions = positions[valid]
+            lines = lines[valid]
+
+            values = numpy.full(len(line_starts), numpy.nan)
+            number_values, is_number = self._parseNumbers(padded, positions + 1)
+            values[lines[is_number]] = number_values
+            parameters[letter] = values
+        return parameters
+
+    ##  Decode the decimal numbers that start at positions in the data, all at
+    #   once.
+    #
+    #   The numbers are decoded one column of characters at a time: first the
+    #   first character of every number, then the second, until all numbers
+    #   have ended.
+    #
+    #   \return A tuple with an array with the numbers, and a mask of the
+    #   positions at which there is a valid number.
+    @classmethod
+    def _parseNumbers(cls, padded, positions):
+        signs = padded[positions]
+        is_negative = signs == ord("-")
+        positions = positions + (is_negative | (signs == ord("+")))
+
+        mantissas = numpy.zeros(len(positions), dtype = numpy.int64)
+        decimals = numpy.zeros(len(positions), dtype = numpy.int64)
+        has_point = numpy.zeros(len(positions), dtype = bool)
+        is_number = numpy.zeros(len(positions), dtype = bool)
+        active = numpy.ones(len(positions), dtype = bool)  # The numbers that are not finished.
+        for column in range(cls.__max_number_length):
+            characters = padded[positions + column]
+            is_digit = (characters >= ord("0")) & (characters <= ord("9"))
+            is_point = (characters == ord(".")) & ~has_point
+            # A number ends at the first character that is not part of it.
+            active &= is_digit | is_point
+            if not numpy.any(active):
+                break
+            is_digit &= active
+            mantissas = numpy.where(is_digit, mantissas * 10 + (characters - ord("0")), mantissas)
+            decimals += is_digit & has_point
+            has_point |= active & is_point
+            is_number |= is_digit
+
+        values = mantissas[is_number] / numpy.power(10.0, decimals[is_number])
+        return numpy.where(is_negative[is_number], -values, values), is_number
+
+    ##  Number the layers from the heights of the moves, for g-code without
+    #   layer comments: every time an extrusion is higher than all extrusions
+    #   before it, a new layer starts.
+    def _getLayersFromHeight(self, heights, is_extrusion):
+        extrusion_heights = numpy.maximum.accumulate(numpy.where(is_extrusion, heights, -numpy.inf))
+        extrusion_heights = numpy.maximum(extrusion_heights, self._max_extrusion_z)
+        previous_heights = numpy.concatenate(([self._max_extrusion_z], extrusion_heights[:-1]))
+        layers = self._height_layer + numpy.cumsum(extrusion_heights > previous_heights)
+        if len(heights):
+            self._max_extrusion_z = extrusion_heights[-1]
+            self._height_layer = int(layers[-1])
+        # Moves before the first extrusion are not in a layer.
+        return numpy.where(numpy.isinf(extrusion_heights), numpy.nan, layers)
+
+    ##  Collect the moves into layers.
+    #
+    #   \param moves The moves of a chunk, or None if there are no more moves.
+    #   \param is_last Whether these are the last moves of the file, so the last
+    #   layer is complete too.
+    #   \return Generates the layers that are complete.
+    def _addMoves(self, moves, is_last = False):
+        if moves is not None:
+            keep = ~numpy.isnan(moves["layers"])
+            moves = {key: values[keep] for key, values in moves.items()}
+            if self._pending_moves is not None:
+                moves = {key: numpy.concatenate((self._pending_moves[key], values)) for key, values in moves.items()}
+        else:
+            moves = self._pending_moves
+        self._pending_moves = None
+        if moves is None or len(moves["layers"]) == 0:
+            return
+
+        layer_starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(moves["layers"])) + 1, [len(moves["layers"])]))
+        complete_count = len(layer_starts) - 1 if is_last else len(layer_starts) - 2
+        for index in range(complete_count):
+            start, end = layer_starts[index], layer_starts[index + 1]
+            yield self._createLayer({key: values[start:end] for key, values in moves.items()})
+
+        if not is_last:
+            # The last layer may continue in the next chunk.
+            self._pending_moves = {key: values[layer_starts[-2]:] for key, values in moves.items()}
+
+    ##  Create the polygons of a layer from its moves.
+    def _createLayer(self, moves):
+        layer_number = int(moves["layers"][0])
+        starts = moves["starts"]
+        ends = moves["ends"]
+        is_extrusion = moves["extruded"] > 0
+
+        height = float(numpy.min(ends[is_extrusion, 2])) if numpy.any(is_extrusion) else float(numpy.min(ends[:, 2]))
+        thickness = height - self._previous_layer_height
+        if thickness <= 0:
+            thickness = height if height > 0 else self._default_line_width / 2
+        self._previous_layer_height = height
+
+        # The width of a line follows from the volume of the extruded filament.
+        lengths = numpy.sqrt(numpy.sum((ends - starts) ** 2, axis = 1))
+        line_widths = numpy.full(len(lengths), self.__travel_line_width, dtype = numpy.float32)
+        line_widths[is_extrusion] = numpy.clip(moves["extruded"][is_extrusion] * self._filament_area / (lengths[is_extrusion] * thickness),
+                                               self._default_line_width / 4, self._default_line_width * 4)
+
+        # Every series of moves with the same extruder is a polygon.
+        polygon_starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(moves["extruders"])) + 1, [len(lengths)]))
+        polygons = []
+        for index in range(len(polygon_starts) - 1):
+            start, end = polygon_starts[index], polygon_starts[index + 1]
+            points = numpy.empty((end - start + 1, 3), dtype = numpy.float32)
+            path = numpy.concatenate((starts[start:start + 1], ends[start:end]))
+            points[:, 0] = path[:, 0]
+            points[:, 1] = path[:, 2]
+            points[:, 2] = -path[:, 1]
+            polygons.append((int(moves["extruders"][start]), moves["line_types"][start:end].reshape((-1, 1)), points, line_widths[start:end].reshape((-1, 1))))
+
+        return (layer_number, height, thickness, polygons, moves["durations"].astype(numpy.float32))
+
+    ##  The position of an axis after every line.
+    #
+    #   The position is set by absolute moves and G92, and changed by relative
+    #   moves. It is the value of the last line that set it, plus the sum of
+    #   all relative moves since then.
+    #   \param values The value of the axis on every line, or NaN.
+    #   \param is_set Which lines set the position to their value.
+    #   \param is_step Which lines move the axis by their value.
+    #   \param initial The position before the first line.
+    @staticmethod
+    def _accumulate(values, is_set, is_step, initial):
+        has_value = ~numpy.isnan(values)
+        steps = numpy.cumsum(numpy.where(is_step & has_value, values, 0.0))
+        last_set = numpy.maximum.accumulate(numpy.where(is_set & has_value, numpy.arange(len(values)), -1))
+        safe_last_set = numpy.maximum(last_set, 0)
+        return numpy.where(last_set >= 0, values[safe_last_set] - steps[safe_last_set], initial) + steps
+
+    @staticmethod
+    def _forwardFill(values, initial):
+        indices = numpy.maximum.accumulate(numpy.where(numpy.isnan(values), -1, numpy.arange(len(values))))
+        return numpy.where(indices >= 0, values[numpy.maximum(indices, 0)], initial)
+
+    ##  Whether the characters end the number of a command, so "G1" is not
+    #   read as the start of "G10". Parameters may follow without a space.
+    @staticmethod
+    def _isCodeEnd(characters):
+        return ((characters < ord("0")) | (characters > ord("9"))) & (characters != ord("."))
+
+    @classmethod
+    def _isCommand(cls, characters, command):
+        result = cls._isCodeEnd(characters[len(command)])
+        for index, character in enumerate(command):
+            result &= characters[index] == character
+        return result
+
+    # The maximum number of characters of a number in the g-code.
+    __max_number_length = 16
+
+    __travel_line_width = 0.1
+
+    # The line types of the names in Cura's ;TYPE: comments.
+    __type_names = {
+        b"WALL-OUTER": LayerPolygon.Inset0Type,
+        b"WALL-INNER": LayerPolygon.InsetXType,
+        b"SKIN": LayerPolygon.SkinType,
+        b"SUPPORT": LayerPolygon.SupportType,
+        b"SKIRT": LayerPolygon.SkirtType,
+        b"FILL": LayerPolygon.InfillType,
+        b"SUPPORT-INFILL": LayerPolygon.SupportInfillType,
+        b"SUPPORT-INTERFACE": LayerPolygon.SupportType
+    }
@@ -0,0 +1,161 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Mesh.MeshReader import MeshReader
+from UM.Mesh.MeshData import MeshData
+from UM.Application import Application
+from UM.Preferences import Preferences
+from UM.Message import Message
+from UM.Logger import Logger
+from UM.Job import Job
+from UM.Math.AxisAlignedBox import AxisAlignedBox
+from UM.Math.Vector import Vector
+from UM.Scene.SceneNode import SceneNode
+from UM.Scene.Iterator.DepthFirstIterator import DepthFirstIterator
+from UM.i18n import i18nCatalog
+
+from cura import LayerDataBuilder
+from cura import LayerDataDecorator
+from cura import LayerPolygon
+from cura.LayerStatistics import LayerStatistics
+from cura.PrintTimeEstimator import PrintTimeEstimator
+
+from . import GCodeParser
+
+from time import time
+catalog = i18nCatalog("cura")
+
+##  Reads g-code files into layer data, to show them in the layer view like
+#   the result of a slice.
+#
+#   The layers are shown while the file is being read: every so often the
+#   layers that are read so far are shown on the build plate. Because
+#   building the layer mesh takes longer as more layers are read, the time
+#   between these updates doubles every time.
+class GCodeReader(MeshReader):
+    def __init__(self):
+        super().__init__()
+        self._supported_extensions = [".gcode", ".g", ".gcode.gz"]
+        self._preview_node = None
+
+    ##  Whether the file is a g-code file, by its extension.
+    #
+    #   Only the last extension is compared by default, which would make this
+    #   reader claim every .gz file.
+    def acceptsFile(self, file_name):
+        return file_name.lower().endswith(tuple(self._supported_extensions))
+
+    def read(self, file_name):
+        start_time = time()
+        scene = Application.getInstance().getController().getScene()
+        settings = Application.getInstance().getGlobalContainerStack()
+        filament_diameter = settings.getProperty("material_diameter", "value") if settings else None
+        line_width = settings.getProperty("line_width", "value") if settings else None
+        estimator = PrintTimeEstimator.fromSettings(settings) if settings else None
+        parser = GCodeParser.GCodeParser(filament_diameter or 2.85, line_width or 0.4, estimator = estimator)
+
+        progress = Message(catalog.i18nc("@info:status", "Parsing G-code"), 0, False, 0)
+        progress.show()
+
+        # The layers of the file replace the result of the last slice.
+        for node in DepthFirstIterator(scene.getRoot()):
+            old_layer_data = node.callDecoration("getLayerData")
+            if old_layer_data:
+                node.getParent().removeChild(node)
+                old_layer_data.removeThumbnails()
+                break
+
+        layers = []
+        preview_interval = self.__first_preview_interval
+        preview_time = time() + preview_interval
+        try:
+            for layer in parser.parse(file_name, lambda fraction: progress.setProgress(fraction * 99)):
+                layers.append(layer)
+                if time() > preview_time:
+                    self._showPreview(self._buildLayerData(layers, for_preview = True))
+                    preview_interval *= 2
+                    preview_time = time() + preview_interval
+                Job.yieldThread()
+        except OSError as e:
+            Logger.log("e", "Unable to read g-code file %s: %s", file_name, str(e))
+            return None
+        finally:
+            self._showPreview(None)
+            progress.hide()
+
+        if not layers:
+            Logger.log("w", "No moves found in g-code file %s", file_name)
+            return None
+
+        layer_data = self._buildLayerData(layers)
+        layer_data.getStatistics().setPrintEstimate(parser.getPrintTime(), parser.getMaterialAmounts())
+        node = self._createNode(layer_data)
+        # The file is read on its own and not sliced, the bounding box of the paths is used to check its size.
+        bounds = layer_data.getStatistics().getBoundingBox()
+        if bounds:
+            heights = [layer[1] for layer in layers]
+            node.callDecoration("setLayerBoundingBox", AxisAlignedBox(minimum = Vector(bounds[0], min(heights), bounds[1]), maximum = Vector(bounds[2], max(heights), bounds[3])))
+
+        Logger.log("d", "Reading %s layers of g-code took %s seconds", len(layers), time() - start_time)
+        return node
+
+    ##  Create the layer data of the layers that are read.
+    #
+    #   \param layers The layers, as created by GCodeParser.
+    #   \param for_preview If True, only the layer mesh is built, without the
+    #   information that is only used once the file is completely read.
+    def _buildLayerData(self, layers, for_preview = False):
+        builder = LayerDataBuilder.LayerDataBuilder()
+        statistics = LayerStatistics()
+        for layer_number, height, thickness, polygons, durations in layers:
+            builder.addLayer(layer_number)
+            # Layer heights are stored in the representation of the backend, in microns.
+            builder.setLayerHeight(layer_number, height * 1000)
+            builder.setLayerThickness(layer_number, thickness * 1000)
+            layer = builder.getLayer(layer_number)
+            for extruder, line_types, points, line_widths in polygons:
+                polygon = LayerPolygon.LayerPolygon(builder, extruder, line_types, points, line_widths)
+                polygon.buildCache()
+                layer.polygons.append(polygon)
+
+            if not for_preview:
+                layer.setSegmentDurations(durations)
+                statistics.addLayer(layer_number, layer)
+
+        if not for_preview:
+            builder.setStatistics(statistics)
+        return builder.build(int(Preferences.getInstance().getValue("view/layer_line_mesh_vertex_budget")))
+
+    ##  Create a node that shows layer data, like the result of a slice.
+    def _createNode(self, layer_data):
+        node = SceneNode()
+        decorator = LayerDataDecorator.LayerDataDecorator()
+        decorator.setLayerData(layer_data)
+        node.addDecorator(decorator)
+        node.setMeshData(MeshData())
+
+        settings = Application.getInstance().getGlobalContainerStack()
+        if settings and not settings.getProperty("machine_center_is_zero", "value"):
+            node.setPosition(Vector(-settings.getProperty("machine_width", "value") / 2, 0.0, settings.getProperty("machine_depth", "value") / 2))
+        return node
+
+    ##  Show the layers that are read so far on the build plate.
+    #
+    #   \param layer_data The layer data to show, or None to remove the layers
+    #   that are shown.
+    def _showPreview(self, layer_data):
+        if self._preview_node:
+            self._preview_node.getParent().removeChild(self._preview_node)
+            self._preview_node = None
+        if layer_data is None:
+            return
+
+        self._preview_node = self._createNode(layer_data)
+        self._preview_node.setParent(Application.getInstance().getBuildVolume())
+
+        view = Application.getInstance().getController().getActiveView()
+        if view.getPluginId() == "LayerView":
+            view.resetLayerData()
+
+    # Seconds after which the layers that are read so far are shown for the first time.
+    __first_preview_interval = 2.0
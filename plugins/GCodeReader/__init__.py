@@ -0,0 +1,35 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from . import GCodeReader
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+def getMetaData():
+    return {
+        "plugin": {
+            "name": catalog.i18nc("@label", "G-code Reader"),
+            "author": "Ultimaker",
+            "version": "1.0",
+            "description": catalog.i18nc("@info:whatsthis", "Allows loading and displaying G-code files."),
+            "api": 3
+        },
+        "mesh_reader": [
+            {
+                "extension": "gcode",
+                "description": catalog.i18nc("@item:inlistbox", "G-code File")
+            },
+            {
+                "extension": "g",
+                "description": catalog.i18nc("@item:inlistbox", "G File")
+            },
+            {
+                "extension": "gcode.gz",
+                "description": catalog.i18nc("@item:inlistbox", "Compressed G-code File")
+            }
+        ]
+    }
+
+def register(app):
+    return { "mesh_reader": GCodeReader.GCodeReader() }
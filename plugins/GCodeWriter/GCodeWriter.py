@@ -7,12 +7,14 @@ from UM.Application import Application
 import UM.Settings.ContainerRegistry
 
 from cura.CuraApplication import CuraApplication
+from cura.GCodePostProcessingPipeline import GCodePostProcessingPipeline
 from cura.Settings.ExtruderManager import ExtruderManager
 
 from UM.Settings.InstanceContainer import InstanceContainer
 
 import re #For escaping characters in the settings.
 import json
+import itertools
 
 ##  Writes g-code to a file.
 #
@@ -47,21 +49,71 @@ class GCodeWriter(MeshWriter):
         super().__init__()
 
     def write(self, stream, node, mode = MeshWriter.OutputMode.TextMode):
-        if mode != MeshWriter.OutputMode.TextMode:
-            Logger.log("e", "GCode Writer does not support non-text mode.")
+        return self.writeWithProgress(stream, node, mode)
+
+    ##  Write the g-code to a stream, reporting the progress while writing.
+    #
+    #   The g-code is post-processed while it is written, see
+    #   GCodePostProcessingPipeline. The g-code is joined into large chunks
+    #   before writing, so slow devices get few large writes. In binary mode
+    #   the chunks are encoded here, so no newline translation is done by the
+    #   stream.
+    #
+    #   \param stream The stream to write to. A text stream in text mode, a
+    #   binary stream in binary mode.
+    #   \param node Not used, the g-code of the entire scene is written.
+    #   \param mode The output mode, text or binary.
+    #   \param progress_callback Called after every chunk with the number of
+    #   bytes written and the total number of bytes to write. Post-processing
+    #   may change the size of the g-code, so the total is an estimate.
+    #   \return True if the g-code was written, or False if there is no g-code.
+    def writeWithProgress(self, stream, node, mode = MeshWriter.OutputMode.TextMode, progress_callback = None):
+        if mode != MeshWriter.OutputMode.TextMode and mode != MeshWriter.OutputMode.BinaryMode:
+            Logger.log("e", "GCode Writer does not support this output mode.")
             return False
 
         scene = Application.getInstance().getController().getScene()
         gcode_list = getattr(scene, "gcode_list")
-        if gcode_list:
-            for gcode in gcode_list:
-                stream.write(gcode)
-            # Serialise the current container stack and put it at the end of the file.
-            settings = self._serialiseSettings(Application.getInstance().getGlobalContainerStack())
-            stream.write(settings)
-            return True
+        if not gcode_list:
+            return False
 
-        return False
+        # Serialise the current container stack and put it at the end of the file.
+        settings = self._serialiseSettings(Application.getInstance().getGlobalContainerStack())
+        # G-code and the serialised settings are ASCII, so the number of characters is the number of bytes.
+        total_size = sum(len(gcode) for gcode in gcode_list) + len(settings)
+
+        written_size = 0
+        chunk = []
+        chunk_size = 0
+        gcode = GCodePostProcessingPipeline.getInstance().process(gcode_list)
+        for gcode in itertools.chain(gcode, [settings]):
+            chunk.append(gcode)
+            chunk_size += len(gcode)
+            if chunk_size >= self.__chunk_size:
+                written_size += self._writeChunk(stream, chunk, mode)
+                chunk = []
+                chunk_size = 0
+                if progress_callback:
+                    progress_callback(min(written_size, total_size), total_size)
+        if chunk:
+            written_size += self._writeChunk(stream, chunk, mode)
+        if progress_callback:
+            progress_callback(total_size, total_size)
+        return True
+
+    ##  Write a list of strings to the stream as one chunk.
+    #
+    #   \return The number of characters that were written.
+    def _writeChunk(self, stream, chunk, mode):
+        data = "".join(chunk)
+        if mode == MeshWriter.OutputMode.BinaryMode:
+            stream.write(data.encode("utf-8"))
+        else:
+            stream.write(data)
+        return len(data)
+
+    # The minimum number of characters to write at once.
+    __chunk_size = 1024 * 1024
 
     ##  Create a new container with container 2 as base and container 1 written over it.
     def _createFlattenedContainerInstance(self, instance_container1, instance_container2):
@@ -81,7 +133,8 @@ class GCodeWriter(MeshWriter):
     #   g-code.
     #
     #   The settings are serialised, and special characters (including newline)
-    #   are escaped.
+    #   are escaped. The settings are followed by a line with the size of the
+    #   serialised settings.
     #
     #   \param settings A container stack to serialise.
     #   \return A serialised string of the settings.
@@ -118,9 +171,8 @@ class GCodeWriter(MeshWriter):
         escaped_string = pattern.sub(lambda m: GCodeWriter.escape_characters[re.escape(m.group(0))], json_string)
 
         # Introduce line breaks so that each comment is no longer than 80 characters. Prepend each line with the prefix.
-        result = ""
-
         # Lines have 80 characters, so the payload of each line is 80 - prefix.
-        for pos in range(0, len(escaped_string), 80 - prefix_length):
-            result += prefix + escaped_string[pos : pos + 80 - prefix_length] + "\n"
-        return result
+        lines = [prefix + escaped_string[pos : pos + 80 - prefix_length] + "\n" for pos in range(0, len(escaped_string), 80 - prefix_length)]
+        serialised = "".join(lines)
+        # End with the size of the settings in bytes, so readers can seek to them from the end of the file.
+        return serialised + ";SETTING_" + str(GCodeWriter.version) + "_INDEX " + str(len(serialised)) + "\n"
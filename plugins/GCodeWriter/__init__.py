@@ -21,7 +21,7 @@ def getMetaData():
                 "extension": "gcode",
                 "description": catalog.i18nc("@item:inlistbox", "GCode File"),
                 "mime_type": "text/x-gcode",
-                "mode": GCodeWriter.GCodeWriter.OutputMode.TextMode
+                "mode": GCodeWriter.GCodeWriter.OutputMode.BinaryMode
             }]
         }
     }
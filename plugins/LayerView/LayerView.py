@@ -17,6 +17,7 @@ from UM.View.RenderBatch import RenderBatch
 from UM.View.GL.OpenGL import OpenGL
 
 from cura.ConvexHullNode import ConvexHullNode
+from cura.LayerPolygon import LayerPolygon
 
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QApplication
@@ -42,6 +43,7 @@ class LayerView(View):
         self._current_layer_num = 0
         self._current_layer_mesh = None
         self._current_layer_jumps = None
+        self._current_layer_ranges = {}
         self._top_layers_job = None
         self._activity = False
         self._old_max_layers = 0
@@ -54,6 +56,21 @@ class LayerView(View):
         self._only_show_top_layers = bool(Preferences.getInstance().getValue("view/only_show_top_layers"))
         self._busy = False
 
+        # Travels are not shown by default, except for the jumps of the current layer.
+        self._visible_line_types = set(LayerPolygon.LineMeshTypeOrder) - {LayerPolygon.MoveCombingType, LayerPolygon.MoveRetractionType, LayerPolygon.NoneType}
+
+        # Playing back the print over time. During playback the layers below the current one are drawn from the line
+        # mesh and the current layer from a mesh in print order, of which only the printed range is drawn.
+        self._simulation_timer = QTimer()
+        self._simulation_timer.setInterval(33)  # About 30 frames per second.
+        self._simulation_timer.timeout.connect(self._onSimulationTimer)
+        self._simulation_time = 0.0
+        self._simulation_speed = 60.0  # Seconds of print time per second of playback.
+        self._simulation_layer_number = None
+        self._simulation_mesh = None
+        self._simulation_face_offsets = None
+        self._simulation_range_end = 0
+
     def getActivity(self):
         return self._activity
 
@@ -79,6 +96,169 @@ class LayerView(View):
     def resetLayerData(self):
         self._current_layer_mesh = None
         self._current_layer_jumps = None
+        self._current_layer_ranges = {}
+
+    lineTypeVisibilityChanged = Signal()
+
+    def isLineTypeVisible(self, line_type):
+        return line_type in self._visible_line_types
+
+    ##  Show or hide all lines of a line type.
+    #
+    #   The layer meshes are ordered by line type, so this only changes which
+    #   ranges of the meshes are drawn. Nothing needs to be rebuilt.
+    #
+    #   \param line_type The line type, one of the types in LayerPolygon.
+    #   \param visible Whether the lines of the line type should be shown.
+    def setLineTypeVisible(self, line_type, visible):
+        if visible == (line_type in self._visible_line_types):
+            return
+
+        if visible:
+            self._visible_line_types.add(line_type)
+        else:
+            self._visible_line_types.discard(line_type)
+
+        self.lineTypeVisibilityChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._controller.getScene().getRoot())
+
+    ##  Find the extrusion segment under a point in a layer.
+    #
+    #   This is meant for tooltips and measurement tools, and is fast enough to
+    #   call on every mouse move.
+    #
+    #   \param layer_number The number of the layer to look in.
+    #   \param position A Vector with the point in scene coordinates. Only the X
+    #   and Z coordinates are used.
+    #   \param margin Extra distance (in mm) beyond the edge of a line at which
+    #   the line is still found.
+    #   \return A dictionary with the polygon and segment index, the line type,
+    #   extruder and line width of the segment, or None if there is no segment
+    #   at the position.
+    def getSegmentAt(self, layer_number, position, margin = 0.0):
+        for node in DepthFirstIterator(self.getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if not layer_data:
+                continue
+
+            layer = layer_data.getLayer(layer_number)
+            if layer is None:
+                return None
+
+            local_position = position - node.getWorldPosition()
+            return layer.findSegment(local_position.x, local_position.z, margin)
+
+        return None
+
+    simulationChanged = Signal()
+
+    def isSimulating(self):
+        return self._simulation_timer.isActive()
+
+    ##  Start playing back the print from the current simulation time.
+    def startSimulation(self):
+        if self._simulation_timer.isActive():
+            return
+
+        layer_data = self._getLayerData()
+        if not layer_data:
+            return
+        if self._simulation_time >= layer_data.getPrintDuration():
+            self._simulation_time = 0.0
+
+        self._simulation_timer.start()
+        self.simulationChanged.emit()
+
+    ##  Stop playing back the print, and show the layers as usual again.
+    def stopSimulation(self):
+        if not self._simulation_timer.isActive():
+            return
+
+        self._simulation_timer.stop()
+        self._simulation_layer_number = None
+        self._simulation_mesh = None
+        self._simulation_face_offsets = None
+        self.simulationChanged.emit()
+        self._controller.getScene().sceneChanged.emit(self._controller.getScene().getRoot())
+
+    def getSimulationTime(self):
+        return self._simulation_time
+
+    ##  Jump to a time in the print.
+    #
+    #   \param time The time since the start of the print, in seconds.
+    def setSimulationTime(self, time):
+        self._simulation_time = max(0.0, time)
+        if self._simulation_timer.isActive():
+            self._updateSimulation()
+
+    def getSimulationSpeed(self):
+        return self._simulation_speed
+
+    ##  Set how fast the print is played back.
+    #
+    #   \param speed The number of seconds of print time per second of playback.
+    def setSimulationSpeed(self, speed):
+        self._simulation_speed = max(0.0, speed)
+
+    def _onSimulationTimer(self):
+        self._simulation_time += self._simulation_speed * self._simulation_timer.interval() / 1000
+        self._updateSimulation()
+
+    ##  Find what is being printed at the simulation time and select the range
+    #   of the current layer to draw. Only when the layer changes is a mesh
+    #   created, otherwise nothing but the range changes.
+    def _updateSimulation(self):
+        layer_data = self._getLayerData()
+        if not layer_data:
+            self.stopSimulation()
+            return
+
+        if self._simulation_time >= layer_data.getPrintDuration():
+            self._simulation_time = layer_data.getPrintDuration()
+            self.stopSimulation()
+            return
+
+        layer_number, segment_number = layer_data.findSegmentAtTime(self._simulation_time)
+        if layer_number != self._simulation_layer_number:
+            self._simulation_layer_number = layer_number
+            self._simulation_mesh, self._simulation_face_offsets = layer_data.getLayer(layer_number).createPlaybackMesh()
+            self.setLayer(layer_number)
+
+        segment_number = min(segment_number, len(self._simulation_face_offsets) - 1)
+        self._simulation_range_end = int(self._simulation_face_offsets[segment_number]) * 3
+        self._controller.getScene().sceneChanged.emit(self._controller.getScene().getRoot())
+
+    ##  Emitted when the small images of the layers are drawn.
+    layerThumbnailsChanged = Signal()
+
+    ##  Get the key of the small images of the layers, for the
+    #   "layer_thumbnails" image provider.
+    #
+    #   \return The key, or an empty string if there are no images (yet).
+    def getLayerThumbnailsKey(self):
+        layer_data = self._getLayerData()
+        if not layer_data or not layer_data.getThumbnails():
+            return ""
+        return layer_data.getThumbnails().getKey()
+
+    ##  Get the statistics of the paths in a layer.
+    #
+    #   \param layer_number The number of the layer.
+    #   \return A dictionary with the statistics (see
+    #   LayerStatistics.getSummary()), or None if there is no such layer.
+    def getLayerStatistics(self, layer_number):
+        layer_data = self._getLayerData()
+        if not layer_data or not layer_data.getStatistics():
+            return None
+        return layer_data.getStatistics().getSummary(layer_number) or None
+
+    def _getLayerData(self):
+        for node in DepthFirstIterator(self.getController().getScene().getRoot()):
+            layer_data = node.callDecoration("getLayerData")
+            if layer_data:
+                return layer_data
+        return None
 
     def beginRendering(self):
         scene = self.getController().getScene()
@@ -102,25 +282,41 @@ class LayerView(View):
                     if not layer_data:
                         continue
 
+                    if self._simulation_mesh:
+                        self._renderSimulation(renderer, node, layer_data)
+                        continue
+
                     # Render all layers below a certain number as line mesh instead of vertices.
                     if self._current_layer_num - self._solid_layers > -1 and not self._only_show_top_layers:
-                        start = 0
-                        end = 0
-                        element_counts = layer_data.getElementCounts()
-                        for layer, counts in element_counts.items():
-                            if layer + self._solid_layers > self._current_layer_num:
-                                break
-                            end += counts
+                        for line_type in LayerPolygon.LineMeshTypeOrder:
+                            if line_type not in self._visible_line_types:
+                                continue
 
-                        # This uses glDrawRangeElements internally to only draw a certain range of lines.
-                        renderer.queueNode(node, mesh = layer_data, mode = RenderBatch.RenderMode.Lines, range = (start, end))
+                            start, end = layer_data.getElementRange(line_type, self._current_layer_num - self._solid_layers)
+                            if end > start:
+                                # This uses glDrawRangeElements internally to only draw a certain range of lines.
+                                renderer.queueNode(node, mesh = layer_data, mode = RenderBatch.RenderMode.Lines, range = (start, end))
 
                     if self._current_layer_mesh:
-                        renderer.queueNode(node, mesh = self._current_layer_mesh)
+                        for line_type, (start, end) in self._current_layer_ranges.items():
+                            if line_type in self._visible_line_types and end > start:
+                                renderer.queueNode(node, mesh = self._current_layer_mesh, range = (start, end))
 
                     if self._current_layer_jumps:
                         renderer.queueNode(node, mesh = self._current_layer_jumps)
 
+    def _renderSimulation(self, renderer, node, layer_data):
+        for line_type in LayerPolygon.LineMeshTypeOrder:
+            if line_type not in self._visible_line_types:
+                continue
+
+            start, end = layer_data.getElementRange(line_type, self._simulation_layer_number - 1)
+            if end > start:
+                renderer.queueNode(node, mesh = layer_data, mode = RenderBatch.RenderMode.Lines, range = (start, end))
+
+        if self._simulation_range_end > 0:
+            renderer.queueNode(node, mesh = self._simulation_mesh, range = (0, self._simulation_range_end))
+
     def setLayer(self, value):
         if self._current_layer_num != value:
             self._current_layer_num = value
@@ -203,6 +399,7 @@ class LayerView(View):
         self.resetLayerData()  # Reset the layer data only when job is done. Doing it now prevents "blinking" data.
         self._current_layer_mesh = job.getResult().get("layers")
         self._current_layer_jumps = job.getResult().get("jumps")
+        self._current_layer_ranges = job.getResult().get("ranges")
         self._controller.getScene().sceneChanged.emit(self._controller.getScene().getRoot())
 
         self._top_layers_job = None
@@ -236,35 +433,53 @@ class _CreateTopLayersJob(Job):
         if self._cancel or not layer_data:
             return
 
-        layer_mesh = MeshBuilder()
+        layer_meshes = []  # Tuples of the layer, its mesh and the brightness to draw it with.
         for i in range(self._solid_layers):
             layer_number = self._layer_number - i
             if layer_number < 0:
                 continue
 
             try:
-                layer = layer_data.getLayer(layer_number).createMesh()
+                layer = layer_data.getLayer(layer_number)
+                mesh = layer.createMesh()
             except Exception:
                 Logger.logException("w", "An exception occurred while creating layer mesh.")
                 return
 
-            if not layer or layer.getVertices() is None:
+            if not mesh or mesh.getVertices() is None:
                 continue
 
-            layer_mesh.addIndices(layer_mesh.getVertexCount() + layer.getIndices())
-            layer_mesh.addVertices(layer.getVertices())
-
             # Scale layer color by a brightness factor based on the current layer number
             # This will result in a range of 0.5 - 1.0 to multiply colors by.
             brightness = numpy.ones((1, 4), dtype=numpy.float32) * (2.0 - (i / self._solid_layers)) / 2.0
             brightness[0, 3] = 1.0
-            layer_mesh.addColors(layer.getColors() * brightness)
+            layer_meshes.append((layer, mesh, brightness))
 
             if self._cancel:
                 return
 
             Job.yieldThread()
 
+        # The faces of each layer mesh are ordered by line type. Combine them ordered by line type first and by
+        # layer second, so the lines of one line type in all layers are a single range of elements.
+        layer_mesh = MeshBuilder()
+        ranges = {}
+        line_offsets = [0] * len(layer_meshes)
+        for line_type in LayerPolygon.LineMeshTypeOrder:
+            range_start = layer_mesh.getFaceCount() * 3
+            for j, (layer, mesh, brightness) in enumerate(layer_meshes):
+                line_start = line_offsets[j]
+                line_end = line_start + layer.meshLineCount(line_type)
+                line_offsets[j] = line_end
+                if line_end == line_start:
+                    continue
+
+                # Each line has 4 vertices and 2 faces.
+                layer_mesh.addIndices(layer_mesh.getVertexCount() - 4 * line_start + mesh.getIndices()[2 * line_start:2 * line_end])
+                layer_mesh.addVertices(mesh.getVertices()[4 * line_start:4 * line_end])
+                layer_mesh.addColors(mesh.getColors()[4 * line_start:4 * line_end] * brightness)
+            ranges[line_type] = (range_start, layer_mesh.getFaceCount() * 3)
+
         if self._cancel:
             return
 
@@ -273,7 +488,7 @@ class _CreateTopLayersJob(Job):
         if not jump_mesh or jump_mesh.getVertices() is None:
             jump_mesh = None
 
-        self.setResult({"layers": layer_mesh.build(), "jumps": jump_mesh})
+        self.setResult({"layers": layer_mesh.build(), "jumps": jump_mesh, "ranges": ranges})
 
     def cancel(self):
         self._cancel = True
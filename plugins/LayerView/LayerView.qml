@@ -94,6 +94,96 @@ Item
         }
     }
 
+    Column
+    {
+        id: lineTypeToggles
+        anchors.top: parent.bottom
+        anchors.topMargin: UM.Theme.getSize("default_margin").height * 2
+        anchors.left: parent.left
+        spacing: UM.Theme.getSize("default_lining").height
+
+        Button
+        {
+            text: UM.LayerView.simulating ? catalog.i18nc("@action:button", "Stop") : catalog.i18nc("@action:button", "Play")
+            onClicked: UM.LayerView.simulating ? UM.LayerView.stopSimulation() : UM.LayerView.startSimulation()
+        }
+
+        // The line type values match the types in LayerPolygon.
+        Repeater
+        {
+            // A list instead of a ListModel, as a ListElement can't hold translated strings.
+            model: [
+                { label: catalog.i18nc("@option:check", "Outer wall"), lineType: 1 },
+                { label: catalog.i18nc("@option:check", "Inner walls"), lineType: 2 },
+                { label: catalog.i18nc("@option:check", "Skin"), lineType: 3 },
+                { label: catalog.i18nc("@option:check", "Support"), lineType: 4 },
+                { label: catalog.i18nc("@option:check", "Skirt"), lineType: 5 },
+                { label: catalog.i18nc("@option:check", "Infill"), lineType: 6 },
+                { label: catalog.i18nc("@option:check", "Support infill"), lineType: 7 },
+                { label: catalog.i18nc("@option:check", "Travels"), lineType: 8 }
+            ]
+
+            CheckBox
+            {
+                text: modelData.label
+                checked: UM.LayerView.isLineTypeVisible(modelData.lineType)
+                onClicked:
+                {
+                    UM.LayerView.setLineTypeVisible(modelData.lineType, checked);
+                    // Retractions are shown together with the other travels.
+                    if(modelData.lineType == 8)
+                    {
+                        UM.LayerView.setLineTypeVisible(9, checked);
+                    }
+                }
+            }
+        }
+
+        // A filmstrip with small images of the layers around the current layer, to scrub through the layers.
+        ListView
+        {
+            id: layerThumbnails
+            width: UM.Theme.getSize("button").width * 4
+            height: UM.Theme.getSize("button").height
+            orientation: ListView.Horizontal
+            spacing: UM.Theme.getSize("default_lining").width
+            clip: true
+            visible: UM.LayerView.layerThumbnailsKey != ""
+
+            model: UM.LayerView.layerThumbnailsKey != "" ? UM.LayerView.numLayers + 1 : 0
+            currentIndex: UM.LayerView.currentLayer
+            highlightFollowsCurrentItem: true
+            highlightMoveDuration: 0
+            preferredHighlightBegin: (width - height) / 2
+            preferredHighlightEnd: (width + height) / 2
+            highlightRangeMode: ListView.ApplyRange
+
+            delegate: Rectangle
+            {
+                width: layerThumbnails.height
+                height: layerThumbnails.height
+                color: UM.Theme.getColor("tool_panel_background")
+                border.width: UM.Theme.getSize("default_lining").width
+                border.color: index == UM.LayerView.currentLayer ? UM.Theme.getColor("slider_groove_border") : UM.Theme.getColor("lining")
+
+                Image
+                {
+                    anchors.fill: parent
+                    anchors.margins: parent.border.width
+                    source: "image://layer_thumbnails/" + UM.LayerView.layerThumbnailsKey + "/" + index
+                    asynchronous: true
+                    smooth: false
+                }
+
+                MouseArea
+                {
+                    anchors.fill: parent
+                    onClicked: UM.LayerView.setCurrentLayer(index)
+                }
+            }
+        }
+    }
+
     Rectangle {
         anchors.left: parent.left
         anchors.verticalCenter: parent.verticalCenter
@@ -113,4 +203,6 @@ Item
             }
         }
     }
+
+    UM.I18nCatalog { id: catalog; name: "cura" }
 }
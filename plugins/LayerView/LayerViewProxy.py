@@ -1,5 +1,6 @@
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, pyqtProperty
 from UM.Application import Application
+from UM.Math.Vector import Vector
 
 import LayerView
 
@@ -49,6 +50,91 @@ class LayerViewProxy(QObject):
         if type(active_view) == LayerView.LayerView.LayerView:
             active_view.setLayer(layer_num)
 
+    ##  Get the line type, extruder and line width of the extrusion segment
+    #   under a point in a layer, for tooltips and measurements.
+    #
+    #   \return A map with the segment information, empty if there is no
+    #   segment at the position.
+    @pyqtSlot(int, float, float, result = "QVariantMap")
+    def getSegmentAt(self, layer_num, x, z):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            segment = active_view.getSegmentAt(layer_num, Vector(x, 0, z))
+            if segment:
+                return segment
+
+        return {}
+
+    ##  Get the statistics of the paths in a layer.
+    #
+    #   \param layer_num The number of the layer.
+    #   \return A map with the statistics, empty if there is no such layer.
+    @pyqtSlot(int, result = "QVariantMap")
+    def getLayerStatistics(self, layer_num):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            statistics = active_view.getLayerStatistics(layer_num)
+            if statistics:
+                return statistics
+
+        return {}
+
+    layerThumbnailsChanged = pyqtSignal()
+
+    ##  The key of the small images of the layers. The image of a layer is
+    #   "image://layer_thumbnails/<key>/<layer number>".
+    @pyqtProperty(str, notify = layerThumbnailsChanged)
+    def layerThumbnailsKey(self):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            return active_view.getLayerThumbnailsKey()
+
+        return ""
+
+    simulationChanged = pyqtSignal()
+
+    @pyqtProperty(bool, notify = simulationChanged)
+    def simulating(self):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            return active_view.isSimulating()
+
+        return False
+
+    @pyqtSlot()
+    def startSimulation(self):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            active_view.startSimulation()
+
+    @pyqtSlot()
+    def stopSimulation(self):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            active_view.stopSimulation()
+
+    @pyqtSlot(float)
+    def setSimulationSpeed(self, speed):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            active_view.setSimulationSpeed(speed)
+
+    lineTypeVisibilityChanged = pyqtSignal()
+
+    @pyqtSlot(int, result = bool)
+    def isLineTypeVisible(self, line_type):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            return active_view.isLineTypeVisible(line_type)
+
+        return False
+
+    @pyqtSlot(int, bool)
+    def setLineTypeVisible(self, line_type, visible):
+        active_view = self._controller.getActiveView()
+        if type(active_view) == LayerView.LayerView.LayerView:
+            active_view.setLineTypeVisible(line_type, visible)
+
     def _layerActivityChanged(self):
         self.activityChanged.emit()
             
@@ -61,6 +147,15 @@ class LayerViewProxy(QObject):
 
     def _onBusyChanged(self):
         self.busyChanged.emit()
+
+    def _onLineTypeVisibilityChanged(self):
+        self.lineTypeVisibilityChanged.emit()
+
+    def _onSimulationChanged(self):
+        self.simulationChanged.emit()
+
+    def _onLayerThumbnailsChanged(self):
+        self.layerThumbnailsChanged.emit()
         
     def _onActiveViewChanged(self):
         active_view = self._controller.getActiveView()
@@ -68,3 +163,6 @@ class LayerViewProxy(QObject):
             active_view.currentLayerNumChanged.connect(self._onLayerChanged)
             active_view.maxLayersChanged.connect(self._onMaxLayersChanged)
             active_view.busyChanged.connect(self._onBusyChanged)
+            active_view.lineTypeVisibilityChanged.connect(self._onLineTypeVisibilityChanged)
+            active_view.simulationChanged.connect(self._onSimulationChanged)
+            active_view.layerThumbnailsChanged.connect(self._onLayerThumbnailsChanged)
@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Preferences import Preferences
+
+from cura.GCodePostProcessor import GCodePostProcessor
+
+##  Pauses the print when it reaches a height, for example to change the
+#   filament.
+#
+#   The pause is added before the first move to a height of at least
+#   "post_processing/pause_at_height" mm after the first layer has started, so
+#   the moves of the start g-code (which often lift the nozzle) are never
+#   taken for a layer. A height of 0 disables the stage. The filament is
+#   retracted and the nozzle is lifted during the pause.
+class PauseAtHeight(GCodePostProcessor):
+    def __init__(self):
+        super().__init__()
+        Preferences.getInstance().addPreference("post_processing/pause_at_height", 0.0)
+
+    def isEnabled(self):
+        return float(Preferences.getInstance().getValue("post_processing/pause_at_height")) > 0
+
+    def getOrder(self):
+        return 20
+
+    def process(self, lines):
+        pause_height = float(Preferences.getInstance().getValue("post_processing/pause_at_height"))
+        lines = iter(lines)
+        z = 0.0
+        relative_extrusion = False
+        in_layers = False  # Whether the first layer has started.
+        for line in lines:
+            if line.startswith(("G0 ", "G1 ")):
+                if " Z" in line:
+                    new_z = self._getValue(line, "Z")
+                    if in_layers and new_z is not None and new_z >= pause_height and new_z > z:
+                        yield from self._createPause(z, relative_extrusion)
+                        yield line
+                        break
+                    if new_z is not None:
+                        z = new_z
+            elif line.startswith("M82"):
+                relative_extrusion = False
+            elif line.startswith("M83"):
+                relative_extrusion = True
+            elif line.startswith(";LAYER:"):
+                in_layers = True
+            yield line
+
+        # After the pause nothing needs to change any more.
+        yield from lines
+
+    ##  Create the g-code of the pause.
+    #
+    #   The filament is retracted in relative extrusion mode, so the position
+    #   of the extruder doesn't need to be known.
+    #
+    #   \param z The height of the nozzle before the pause.
+    #   \param relative_extrusion Whether the g-code uses relative extrusion.
+    def _createPause(self, z, relative_extrusion):
+        pause = [
+            ";Pause at height\n",
+            "M83\n",
+            "G1 F1500 E%.5f\n" % -self.__retraction_distance,
+            "G0 F300 Z%.3f\n" % (z + self.__lift_distance),
+            "M0\n",
+            "G0 F300 Z%.3f\n" % z,
+            "G1 F1500 E%.5f\n" % self.__retraction_distance
+        ]
+        if not relative_extrusion:
+            pause.append("M82\n")
+        return pause
+
+    ##  Get the value of a parameter of a g-code command.
+    #
+    #   \return The value, or None if the command doesn't have the parameter.
+    def _getValue(self, line, parameter):
+        position = line.find(" " + parameter)
+        if position < 0:
+            return None
+        comment = line.find(";")
+        if 0 <= comment < position:
+            return None
+        value = line[position + 2:].split(";", 1)[0].split(None, 1)
+        try:
+            return float(value[0]) if value else None
+        except ValueError:
+            return None
+
+    # The filament is retracted this far during the pause, in mm.
+    __retraction_distance = 1.0
+    # The nozzle is lifted this far during the pause, in mm.
+    __lift_distance = 10.0
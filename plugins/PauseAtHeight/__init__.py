@@ -0,0 +1,21 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from . import PauseAtHeight
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+def getMetaData():
+    return {
+        "plugin": {
+            "name": catalog.i18nc("@label", "Pause at Height"),
+            "author": "Ultimaker",
+            "version": "1.0",
+            "description": catalog.i18nc("@info:whatsthis", "Pauses the print at a height, for example to change filament."),
+            "api": 3
+        }
+    }
+
+def register(app):
+    return { "gcode_post_processor": PauseAtHeight.PauseAtHeight() }
@@ -3,12 +3,14 @@ import os.path
 from UM.Application import Application
 from UM.Logger import Logger
 from UM.Message import Message
-from UM.Mesh.WriteMeshJob import WriteMeshJob
 from UM.Mesh.MeshWriter import MeshWriter
 from UM.Scene.Iterator.BreadthFirstIterator import BreadthFirstIterator
 from UM.OutputDevice.OutputDevice import OutputDevice
 from UM.OutputDevice import OutputDeviceError
 
+from cura.ProgressWriteMeshJob import ProgressWriteMeshJob
+from cura.WriteEncodedGCodeJob import WriteEncodedGCodeJob
+
 from UM.i18n import i18nCatalog
 catalog = i18nCatalog("cura")
 
@@ -29,6 +31,42 @@ class RemovableDriveOutputDevice(OutputDevice):
         if self._writing:
             raise OutputDeviceError.DeviceBusyError()
 
+        file_formats = self._getFileFormats(filter_by_machine)
+        # Take the first file format available, the one the machine prefers.
+        writer = Application.getInstance().getMeshFileHandler().getWriterByMimeType(file_formats[0]["mime_type"])
+        mode = file_formats[0].get("mode", MeshWriter.OutputMode.TextMode)
+        file_name = self._getFileName(node, file_name, file_formats[0]["extension"])
+
+        def createJob(stream):
+            return ProgressWriteMeshJob(writer, stream, node, mode)
+        self._startWrite(file_name, mode, createJob)
+
+    ##  Write g-code that is already encoded, see EncodedGCode.
+    #
+    #   This is used to write the same g-code to several devices, without
+    #   writing the g-code again for every device.
+    #
+    #   \param encoded_gcode The EncodedGCode to write.
+    #   \param node The node that was encoded, to get a file name from.
+    #   \param file_name The name of the file to write, without extension.
+    def requestWriteEncoded(self, encoded_gcode, node, file_name = None):
+        if self._writing:
+            raise OutputDeviceError.DeviceBusyError()
+
+        # The encoded g-code can be written as is or compressed.
+        file_formats = [file_format for file_format in self._getFileFormats(True) if file_format["mime_type"] in self.__encoded_mime_types]
+        if not file_formats:
+            Logger.log("e", "The machine does not accept g-code files")
+            raise OutputDeviceError.WriteRequestFailedError()
+        mime_type = file_formats[0]["mime_type"]
+        file_name = self._getFileName(node, file_name, file_formats[0]["extension"])
+
+        def createJob(stream):
+            return WriteEncodedGCodeJob(encoded_gcode, stream, mime_type)
+        self._startWrite(file_name, MeshWriter.OutputMode.BinaryMode, createJob)
+
+    ##  Get the file formats that can be written, in order of preference.
+    def _getFileFormats(self, filter_by_machine):
         # Formats supported by this application (File types that we can actually write)
         file_formats = Application.getInstance().getMeshFileHandler().getSupportedFileTypesWrite()
         if filter_by_machine:
@@ -37,17 +75,17 @@ class RemovableDriveOutputDevice(OutputDevice):
             # Create a list from supported file formats string
             machine_file_formats = [file_type.strip() for file_type in container.getMetaDataEntry("file_formats").split(";")]
 
-            # Take the intersection between file_formats and machine_file_formats.
+            # Take the intersection between file_formats and machine_file_formats, in the order of preference of the machine.
             file_formats = list(filter(lambda file_format: file_format["mime_type"] in machine_file_formats, file_formats))
+            file_formats.sort(key = lambda file_format: machine_file_formats.index(file_format["mime_type"]))
 
         if len(file_formats) == 0:
             Logger.log("e", "There are no file formats available to write with!")
             raise OutputDeviceError.WriteRequestFailedError()
+        return file_formats
 
-        # Just take the first file format available.
-        writer = Application.getInstance().getMeshFileHandler().getWriterByMimeType(file_formats[0]["mime_type"])
-        extension = file_formats[0]["extension"]
-
+    ##  Get the path of the file to write on the drive.
+    def _getFileName(self, node, file_name, extension):
         if file_name is None:
             for n in BreadthFirstIterator(node):
                 if n.getMeshData():
@@ -61,17 +99,25 @@ class RemovableDriveOutputDevice(OutputDevice):
 
         if extension:  # Not empty string.
             extension = "." + extension
-        file_name = os.path.join(self.getId(), os.path.splitext(file_name)[0] + extension)
+        return os.path.join(self.getId(), os.path.splitext(file_name)[0] + extension)
 
+    ##  Open the file and start the job that writes to it.
+    #
+    #   \param create_job A function that creates the job, from the stream to
+    #   write to.
+    def _startWrite(self, file_name, mode, create_job):
         try:
             Logger.log("d", "Writing to %s", file_name)
-            stream = open(file_name, "wt")
-            job = WriteMeshJob(writer, stream, node, MeshWriter.OutputMode.TextMode)
+            if mode == MeshWriter.OutputMode.BinaryMode:
+                stream = open(file_name, "wb")
+            else:
+                stream = open(file_name, "wt")
+            job = create_job(stream)
             job.setFileName(file_name)
             job.progress.connect(self._onProgress)
             job.finished.connect(self._onFinished)
 
-            message = Message(catalog.i18nc("@info:progress", "Saving to Removable Drive <filename>{0}</filename>").format(self.getName()), 0, False, -1)
+            message = Message(catalog.i18nc("@info:progress", "Saving to Removable Drive <filename>{0}</filename>").format(self.getName()), 0, False, 0)
             message.show()
 
             self.writeStarted.emit(self)
@@ -114,3 +160,5 @@ class RemovableDriveOutputDevice(OutputDevice):
         if action == "eject":
             Application.getInstance().getOutputDeviceManager().getOutputDevicePlugin("RemovableDriveOutputDevice").ejectDevice(self)
 
+    # The MIME types that encoded g-code can be written as.
+    __encoded_mime_types = ["text/x-gcode", "application/gzip"]
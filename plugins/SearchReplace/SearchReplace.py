@@ -0,0 +1,41 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Preferences import Preferences
+from UM.Logger import Logger
+
+from cura.GCodePostProcessor import GCodePostProcessor
+
+import json
+
+##  Replaces text in the g-code.
+#
+#   The replacements are a JSON list of [search, replace] pairs in the
+#   preference "post_processing/search_replace". The text is replaced within
+#   lines, so the text to search can't span multiple lines.
+class SearchReplace(GCodePostProcessor):
+    def __init__(self):
+        super().__init__()
+        Preferences.getInstance().addPreference("post_processing/search_replace", "[]")
+
+    def isEnabled(self):
+        return bool(self._getReplacements())
+
+    def getOrder(self):
+        return 0  # Replace text before other stages add their g-code.
+
+    def process(self, lines):
+        replacements = self._getReplacements()
+        for line in lines:
+            for search, replace in replacements:
+                if search in line:
+                    line = line.replace(search, replace)
+            yield line
+
+    def _getReplacements(self):
+        try:
+            replacements = json.loads(Preferences.getInstance().getValue("post_processing/search_replace"))
+            return [(str(search), str(replace)) for search, replace in replacements if search]
+        except (TypeError, ValueError) as e:
+            Logger.log("w", "Invalid g-code replacements: %s", str(e))
+            return []
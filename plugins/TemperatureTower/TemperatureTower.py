@@ -0,0 +1,45 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Preferences import Preferences
+
+from cura.GCodePostProcessor import GCodePostProcessor
+
+##  Changes the temperature of the nozzle every number of layers, to print a
+#   temperature tower.
+#
+#   The temperature starts at "post_processing/temperature_tower_start" and
+#   changes by "post_processing/temperature_tower_step" every
+#   "post_processing/temperature_tower_layers" layers. A start temperature of
+#   0 disables the stage.
+class TemperatureTower(GCodePostProcessor):
+    def __init__(self):
+        super().__init__()
+        Preferences.getInstance().addPreference("post_processing/temperature_tower_start", 0)
+        Preferences.getInstance().addPreference("post_processing/temperature_tower_step", -5)
+        Preferences.getInstance().addPreference("post_processing/temperature_tower_layers", 25)
+
+    def isEnabled(self):
+        return float(Preferences.getInstance().getValue("post_processing/temperature_tower_start")) > 0
+
+    def getOrder(self):
+        return 10
+
+    def process(self, lines):
+        preferences = Preferences.getInstance()
+        start_temperature = float(preferences.getValue("post_processing/temperature_tower_start"))
+        step = float(preferences.getValue("post_processing/temperature_tower_step"))
+        layers_per_step = max(int(preferences.getValue("post_processing/temperature_tower_layers")), 1)
+
+        for line in lines:
+            yield line
+            if not line.startswith(";LAYER:"):
+                continue
+            try:
+                layer_number = int(line[len(";LAYER:"):])
+            except ValueError:
+                continue
+            # Raft layers have negative numbers, they are printed at the start temperature.
+            if layer_number >= 0 and layer_number % layers_per_step == 0:
+                temperature = start_temperature + step * (layer_number // layers_per_step)
+                yield "M104 S%d ;Temperature tower\n" % round(temperature)
@@ -0,0 +1,21 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from . import TemperatureTower
+
+from UM.i18n import i18nCatalog
+catalog = i18nCatalog("cura")
+
+def getMetaData():
+    return {
+        "plugin": {
+            "name": catalog.i18nc("@label", "Temperature Tower"),
+            "author": "Ultimaker",
+            "version": "1.0",
+            "description": catalog.i18nc("@info:whatsthis", "Changes the nozzle temperature every number of layers, to print temperature towers."),
+            "api": 3
+        }
+    }
+
+def register(app):
+    return { "gcode_post_processor": TemperatureTower.TemperatureTower() }
@@ -32,16 +32,21 @@ UM.Dialog
             }
 
             text: {
-                if (manager.progress == 0)
+                if (manager.firmwareUpdateState == "failed")
                 {
                     //: Firmware update status label
-                    return catalog.i18nc("@label","Starting firmware update, this may take a while.")
+                    return catalog.i18nc("@label","Firmware update failed. Check the connection with the printer and try again.")
                 }
-                else if (manager.progress > 99)
+                else if (manager.firmwareUpdateState == "completed")
                 {
                     //: Firmware update status label
                     return catalog.i18nc("@label","Firmware update completed.")
                 }
+                else if (manager.progress == 0)
+                {
+                    //: Firmware update status label
+                    return catalog.i18nc("@label","Starting firmware update, this may take a while.")
+                }
                 else
                 {
                     //: Firmware update status label
@@ -55,10 +60,10 @@ UM.Dialog
         ProgressBar
         {
             id: prog
-            value: manager.progress
+            value: manager.firmwareUpdateState == "updating" ? manager.progress : (manager.firmwareUpdateState == "completed" ? 100 : 0)
             minimumValue: 0
             maximumValue: 100
-            indeterminate: manager.progress < 100
+            indeterminate: manager.firmwareUpdateState == "updating"
             anchors
             {
                 left: parent.left;
@@ -79,7 +84,7 @@ UM.Dialog
         Button
         {
             text: catalog.i18nc("@action:button","Close");
-            enabled: manager.progress >= 100;
+            enabled: manager.firmwareUpdateState != "updating";
             onClicked: base.visible = false;
         }
     ]
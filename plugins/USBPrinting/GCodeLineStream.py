@@ -0,0 +1,134 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+
+import array
+import bisect
+import mmap
+import numpy
+import re
+import tempfile
+
+##  G-code of a print job, encoded once into the lines that are sent to the
+#   printer.
+#
+#   Every line is stripped of comments and whitespace, numbered and
+#   checksummed, and stored as the exact bytes to send. Empty lines are left
+#   out. Next to the lines the stream keeps the byte offset of every line, for
+#   the progress of the print, and the heights that the print head moves to.
+#   Sending a line is then only a lookup, so the listen thread does no
+#   per-line processing while printing.
+#
+#   The encoded lines are written to a temporary spool file in chunks and read
+#   back through a memory map, so the memory that is used doesn't grow with
+#   the size of the job, apart from the index of line offsets.
+#
+#   The line numbers are the indices of the lines, so a resend request of the
+#   printer is the index of the line to send again.
+class GCodeLineStream:
+    ##  \param lines The g-code lines to send, as strings. This can be a
+    #   generator, it is consumed once.
+    def __init__(self, lines = ()):
+        # Stored as arrays of the standard library, which are compact and faster to index one element at a time than numpy arrays.
+        self._offsets = array.array("q", [0])
+        self._z_indices = array.array("q")  # The indices of the lines that move in Z, and the heights they move to.
+        self._z_heights = array.array("d")
+
+        self._spool_file = tempfile.TemporaryFile(prefix = "cura_usb_")
+        chunk = []
+        for line in lines:
+            if ";" in line:
+                line = line[:line.find(";")]
+            line = line.strip()
+            if not line:
+                continue
+            if line == "M0" or line == "M1":
+                line = "M105"  # Don't send the M0 or M1 to the machine, as M0 and M1 are handled as an LCD menu pause.
+            elif "Z" in line and (line.startswith("G0") or line.startswith("G1")):
+                match = self.__z_regex.search(line)
+                try:
+                    self._z_heights.append(float(match.group(1)))
+                    self._z_indices.append(len(self._offsets) - 1 + len(chunk))
+                except ValueError:
+                    pass  # A Z without a number.
+            chunk.append(line)
+            if len(chunk) >= self.__chunk_size:
+                self._appendLines(chunk)
+                chunk = []
+        self._appendLines(chunk)
+
+        self._spool_file.flush()
+        self._total_size = self._offsets[-1]
+        if self._total_size > 0:
+            self._data = mmap.mmap(self._spool_file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self._data = b""  # An empty file can't be mapped.
+
+    ##  Number, checksum and encode lines and write them to the spool file.
+    #
+    #   \param lines The stripped lines to append, as strings.
+    def _appendLines(self, lines):
+        if not lines:
+            return
+        first_number = len(self._offsets) - 1
+        numbered_lines = [("N%d%s" % (number, line)).encode() for number, line in enumerate(lines, first_number)]
+
+        # The checksum is the XOR of all bytes of the numbered line, computed for all lines at once.
+        lengths = numpy.fromiter(map(len, numbered_lines), dtype = numpy.int64, count = len(numbered_lines))
+        starts = numpy.concatenate(([0], numpy.cumsum(lengths[:-1])))
+        checksums = numpy.bitwise_xor.reduceat(numpy.frombuffer(b"".join(numbered_lines), dtype = numpy.uint8), starts).tolist()
+
+        self._spool_file.write(b"".join([b"%s*%d\n" % line for line in zip(numbered_lines, checksums)]))
+        # Each line ends with "*", the checksum and a newline.
+        line_lengths = lengths + [len(str(checksum)) + 2 for checksum in checksums]
+        offsets = self._offsets[-1] + numpy.cumsum(line_lengths)
+        self._offsets.frombytes(offsets.astype(numpy.int64).tobytes())
+
+    ##  The number of lines.
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    ##  Get a line, ready to send.
+    #
+    #   \param index The index of the line, which is also its line number.
+    #   \return The bytes of the line, including line number, checksum and
+    #   newline.
+    def getLine(self, index):
+        return self._data[self._offsets[index]:self._offsets[index + 1]]
+
+    ##  Get the size of a line in bytes, as it is sent.
+    def getLineSize(self, index):
+        return self._offsets[index + 1] - self._offsets[index]
+
+    ##  Get the height of the print head after a line is executed.
+    def getZ(self, index):
+        z_index = bisect.bisect_right(self._z_indices, index) - 1
+        return self._z_heights[z_index] if z_index >= 0 else 0.0
+
+    ##  Get the progress of the print after a number of lines are sent.
+    #
+    #   \param index The number of lines that are sent.
+    #   \return The part of the bytes of the job that is sent, from 0 to 1.
+    def getProgress(self, index):
+        if self._total_size == 0:
+            return 1.0
+        return self._offsets[min(index, len(self))] / self._total_size
+
+    __z_regex = re.compile("Z([0-9\.]*)")
+    # The number of lines to encode at once.
+    __chunk_size = 65536
+
+##  Job that encodes g-code into a GCodeLineStream in the background.
+#
+#   The result of the job is the GCodeLineStream.
+class GCodeLineStreamJob(Job):
+    ##  \param lines The g-code lines to encode. This can be a generator, it is
+    #   consumed in the job.
+    def __init__(self, lines):
+        super().__init__()
+        self._lines = lines
+
+    def run(self):
+        Job.yieldThread()
+        self.setResult(GCodeLineStream(self._lines))
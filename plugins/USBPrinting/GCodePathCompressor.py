@@ -0,0 +1,291 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+import collections
+import math
+import re
+
+# A G1 move of a run: where it starts and ends, its length, how much it extrudes, its feedrate and the original line.
+_Move = collections.namedtuple("_Move", ["start_x", "start_y", "x", "y", "length", "extrusion", "feedrate", "line", "e_token", "f_token"])
+
+##  Rewrites g-code with fewer lines before it is sent to a printer.
+#
+#   Curved models are sliced into many tiny moves, and sent over a serial
+#   connection every move is a line. The connection or the firmware can't
+#   always keep up with them, and then the print head stutters. The
+#   compressor replaces runs of G1 moves by one move if that changes the path
+#   by no more than a tolerance:
+#
+#   - Moves in the same direction become one G1 move.
+#   - If the firmware supports arcs, moves along a circle become one G2 or G3
+#     move.
+#
+#   The moves of a run must have the same feedrate and extrude at the same
+#   rate, so the same amount of material ends up in the same place. Moves with
+#   a Z, retractions and moves in relative coordinates are never merged.
+#
+#   The compressor works on a stream of lines and only keeps the moves of the
+#   current run, so it can be chained into the lines that are encoded to send
+#   to the printer. It must not be used for g-code that is saved. Comments and
+#   empty lines are left out, as they are not sent anyway.
+class GCodePathCompressor:
+    ##  \param arcs Whether the firmware supports G2 and G3 arcs.
+    #   \param tolerance The distance in mm that the new path may deviate from
+    #   the original path.
+    def __init__(self, arcs = False, tolerance = 0.01):
+        self._arcs = arcs
+        self._tolerance = tolerance
+
+        # The position after the lines that were read. None if it is not known, like after homing.
+        self._x = None
+        self._y = None
+        self._e = None
+        self._feedrate = None
+        self._absolute = True
+        self._absolute_extrusion = True
+
+        self._run = []
+        self._statistics = {"moves": 0, "lines": 0, "merged_moves": 0, "arcs": 0}
+
+    ##  Compress g-code.
+    #
+    #   \param lines The g-code lines, as strings. This can be a generator, it
+    #   is consumed once.
+    #   \return A generator of the compressed lines.
+    def compress(self, lines):
+        for line in lines:
+            line = line.split(";", 1)[0].strip()
+            if not line:
+                continue
+            for output_line in self._processLine(line):
+                self._statistics["lines"] += 1
+                yield output_line
+        for output_line in self._flushRun():
+            self._statistics["lines"] += 1
+            yield output_line
+        Logger.log("i", "Compressed %d moves into %d lines, merging %d moves of which %d into arcs", self._statistics["moves"], self._statistics["lines"],
+                   self._statistics["merged_moves"], self._statistics["arcs"])
+
+    ##  The counters of the compression so far.
+    #
+    #   The keys are the "moves" that were read, the "lines" that were written,
+    #   the "merged_moves" that were replaced and the "arcs" that were written.
+    def getStatistics(self):
+        return dict(self._statistics)
+
+    ##  Handle a line without comment.
+    #   \return The lines to write.
+    def _processLine(self, line):
+        if line.startswith("G1") and (len(line) == 2 or not line[2].isdigit()):
+            self._statistics["moves"] += 1
+            move = self._parseMove(line)
+            if move is not None:
+                return self._addMove(move)
+
+        output = self._flushRun()
+        self._updatePosition(line)
+        output.append(line)
+        return output
+
+    ##  Read a G1 move, and update the position if it may be merged.
+    #   \return The _Move, or None if the move can't be merged.
+    def _parseMove(self, line):
+        parameters = dict(self.__parameter_regex.findall(line[2:].upper()))
+        if not parameters.keys() <= self.__mergeable_parameters or ("X" not in parameters and "Y" not in parameters):
+            return None
+        if not self._absolute or self._x is None or self._y is None or (self._absolute_extrusion and "E" in parameters and self._e is None):
+            return None
+
+        try:
+            x = float(parameters.get("X", self._x))
+            y = float(parameters.get("Y", self._y))
+            e = float(parameters["E"]) if "E" in parameters else None
+            feedrate = float(parameters["F"]) if "F" in parameters else self._feedrate
+        except ValueError:
+            return None
+
+        extrusion = 0.0
+        if e is not None:
+            extrusion = e - self._e if self._absolute_extrusion else e
+            if self._absolute_extrusion:
+                self._e = e
+        move = _Move(self._x, self._y, x, y, math.hypot(x - self._x, y - self._y), extrusion, feedrate, line, parameters.get("E"), parameters.get("F"))
+        self._x, self._y, self._feedrate = x, y, feedrate
+        return move
+
+    ##  Update the position and the modes after a line that is not merged.
+    def _updatePosition(self, line):
+        match = self.__code_regex.match(line.upper())
+        if not match:
+            return
+        code = match.group(1) + str(int(match.group(2)))
+        parameters = dict(self.__parameter_regex.findall(line[match.end():].upper()))
+        try:
+            values = {key: float(value) for key, value in parameters.items()}
+        except ValueError:
+            values = {}
+            self._x = self._y = self._e = None  # Not sure where the head is.
+
+        if code in ("G0", "G1", "G2", "G3"):
+            if "X" in values:
+                self._x = values["X"] if self._absolute else (self._x + values["X"] if self._x is not None else None)
+            if "Y" in values:
+                self._y = values["Y"] if self._absolute else (self._y + values["Y"] if self._y is not None else None)
+            if "E" in values and self._absolute_extrusion:
+                self._e = values["E"]
+            if "F" in values:
+                self._feedrate = values["F"]
+        elif code == "G28":
+            self._x = self._y = None
+        elif code == "G92":
+            if not values:
+                self._x = self._y = self._e = 0.0
+            self._x = values.get("X", self._x)
+            self._y = values.get("Y", self._y)
+            self._e = values.get("E", self._e)
+        elif code == "G90":
+            self._absolute = True
+        elif code == "G91":
+            self._absolute = False
+        elif code == "M82":
+            self._absolute_extrusion = True
+        elif code == "M83":
+            self._absolute_extrusion = False
+
+    ##  Add a move to the current run, or start a new run with it.
+    #   \return The lines to write.
+    def _addMove(self, move):
+        if self._run and len(self._run) < self.__max_run_length and self._canExtendRun(move):
+            self._run.append(move)
+            return []
+        output = self._flushRun()
+        self._run = [move]
+        return output
+
+    def _canExtendRun(self, move):
+        first = self._run[0]
+        if move.feedrate != first.feedrate or (move.extrusion > 0) != (first.extrusion > 0) or move.extrusion < 0:
+            return False
+        moves = self._run + [move]
+        if not self._hasEvenExtrusion(moves):
+            return False
+        return self._isStraight(moves) or (self._arcs and self._fitArc(moves) is not None)
+
+    ##  Whether all moves extrude at the same rate, within 5%.
+    def _hasEvenExtrusion(self, moves):
+        if min(move.length for move in moves) <= 0:
+            return False
+        total_extrusion = sum(move.extrusion for move in moves)
+        if total_extrusion == 0:
+            return True
+        rate = total_extrusion / sum(move.length for move in moves)
+        return all(abs(move.extrusion / move.length - rate) <= 0.05 * rate for move in moves)
+
+    ##  Whether the moves are in one direction, so they can be one move.
+    def _isStraight(self, moves):
+        start_x, start_y = moves[0].start_x, moves[0].start_y
+        direction_x, direction_y = moves[-1].x - start_x, moves[-1].y - start_y
+        length = math.hypot(direction_x, direction_y)
+        if length <= self._tolerance:
+            return False
+        previous_distance = 0
+        for move in moves[:-1]:
+            offset_x, offset_y = move.x - start_x, move.y - start_y
+            if abs(direction_x * offset_y - direction_y * offset_x) / length > self._tolerance:
+                return False  # Too far from the line.
+            distance = (direction_x * offset_x + direction_y * offset_y) / length
+            if distance < previous_distance - self._tolerance or distance > length + self._tolerance:
+                return False  # Going back.
+            previous_distance = distance
+        return True
+
+    ##  Fit the moves to an arc.
+    #
+    #   The arc goes through the start, the middle and the end of the moves.
+    #   All moves must end within the tolerance of the arc, turn the same way
+    #   and be short enough to not deviate from the arc between their ends.
+    #   The firmware draws an arc with short straight moves, which must not
+    #   deviate from the arc either.
+    #   \return The center of the arc and whether it is clockwise, or None if
+    #   the moves don't fit an arc.
+    def _fitArc(self, moves):
+        if len(moves) < 2:
+            return None
+        start_x, start_y = moves[0].start_x, moves[0].start_y
+        middle_x, middle_y = moves[len(moves) // 2 - 1].x, moves[len(moves) // 2 - 1].y
+        end_x, end_y = moves[-1].x, moves[-1].y
+
+        # The center of the circle through the three points.
+        determinant = 2 * ((middle_x - start_x) * (end_y - start_y) - (middle_y - start_y) * (end_x - start_x))
+        if abs(determinant) < 1e-9:
+            return None
+        middle_square = (middle_x - start_x) ** 2 + (middle_y - start_y) ** 2
+        end_square = (end_x - start_x) ** 2 + (end_y - start_y) ** 2
+        center_x = start_x + ((end_y - start_y) * middle_square - (middle_y - start_y) * end_square) / determinant
+        center_y = start_y + ((middle_x - start_x) * end_square - (end_x - start_x) * middle_square) / determinant
+        radius = math.hypot(start_x - center_x, start_y - center_y)
+        if radius > self.__max_arc_radius or radius <= self.__firmware_arc_segment_length / 2:
+            return None
+        if radius - math.sqrt(radius ** 2 - (self.__firmware_arc_segment_length / 2) ** 2) > self._tolerance:
+            return None
+
+        clockwise = None
+        total_angle = 0
+        for move in moves:
+            if abs(math.hypot(move.x - center_x, move.y - center_y) - radius) > self._tolerance:
+                return None
+            if move.length >= 2 * radius or radius - math.sqrt(radius ** 2 - (move.length / 2) ** 2) > self._tolerance:
+                return None
+            cross = (move.start_x - center_x) * (move.y - center_y) - (move.start_y - center_y) * (move.x - center_x)
+            if clockwise is None:
+                clockwise = cross < 0
+            elif clockwise != (cross < 0):
+                return None
+            total_angle += 2 * math.asin(move.length / (2 * radius))
+        if total_angle >= 2 * math.pi - 0.1:
+            return None  # The firmware would make an arc that ends where it starts into a full circle, or nothing.
+        return center_x, center_y, clockwise
+
+    ##  Write the current run as one move if possible.
+    #   \return The lines to write.
+    def _flushRun(self):
+        run = self._run
+        self._run = []
+        if len(run) < 2:
+            return [move.line for move in run]
+
+        arc = None
+        if not self._isStraight(run):
+            arc = self._fitArc(run) if self._arcs and len(run) >= self.__min_arc_length else None
+            if arc is None:
+                return [move.line for move in run]
+
+        last = run[-1]
+        parts = ["G1" if arc is None else ("G2" if arc[2] else "G3")]
+        if run[0].f_token is not None:
+            parts.append("F" + run[0].f_token)
+        parts.append("X%.3f Y%.3f" % (last.x, last.y))
+        if arc is not None:
+            parts.append("I%.3f J%.3f" % (arc[0] - run[0].start_x, arc[1] - run[0].start_y))
+        if last.e_token is not None:
+            parts.append("E" + last.e_token if self._absolute_extrusion else "E%.5f" % sum(move.extrusion for move in run))
+
+        self._statistics["merged_moves"] += len(run)
+        if arc is not None:
+            self._statistics["arcs"] += 1
+        return [" ".join(parts)]
+
+    __code_regex = re.compile("([GM])([0-9]+)")
+    __parameter_regex = re.compile("([A-Z])\s*([-+]?[0-9]*\.?[0-9]+)")
+    __mergeable_parameters = {"X", "Y", "E", "F"}
+
+    # The most moves to merge into one, which limits the work of checking a run.
+    __max_run_length = 32
+    # The fewest moves to replace by an arc.
+    __min_arc_length = 4
+    # Arcs with a larger radius in mm are nearly straight, and are left to the straight moves.
+    __max_arc_radius = 1000
+    # The length in mm of the straight moves that the firmware draws arcs with (MM_PER_ARC_SEGMENT of Marlin).
+    __firmware_arc_segment_length = 1.0
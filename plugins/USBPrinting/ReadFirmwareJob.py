@@ -0,0 +1,29 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Job import Job
+from UM.Logger import Logger
+
+from .avr_isp import intelHex
+
+##  Job that reads a firmware file in the background.
+#
+#   The result of the job is the contents of the file as read by
+#   intelHex.readHex, or None if the file could not be read.
+class ReadFirmwareJob(Job):
+    ##  \param file_name The path of the Intel hex file to read.
+    def __init__(self, file_name):
+        super().__init__()
+        self._file_name = file_name
+
+    def getFileName(self):
+        return self._file_name
+
+    def run(self):
+        Job.yieldThread()
+        try:
+            self.setResult(intelHex.readHex(self._file_name))
+        except Exception as e:  # intelHex raises a plain Exception for a malformed file.
+            Logger.log("e", "Could not read firmware file %s: %s", self._file_name, str(e))
+            self.setError(e)
+            self.setResult(None)
@@ -0,0 +1,359 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+import asyncio
+import fcntl
+import os
+import platform
+import re
+import threading
+
+import serial
+
+##  One event loop that handles the serial connections of all USB printers.
+#
+#   Without it, every USBPrinterOutputDevice has its own threads that block
+#   on reading its serial port. With many printers that is many threads
+#   waiting on timeouts and contending for the interpreter lock. The event
+#   loop runs in a single thread and only wakes up when a port can be read or
+#   written, or when a timer expires.
+#
+#   Every printer gets a SerialConnection, which connects, detects the baud
+#   rate and then passes every received line to the device. The devices emit
+#   their signals from the thread of the event loop, like they do from their
+#   own threads; Qt queues them to the thread of the receivers.
+class SerialEventLoop:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+
+    ##  Whether the event loop can handle serial ports on this platform.
+    #
+    #   It waits for the file descriptors of the ports, which Windows doesn't
+    #   support for serial ports.
+    @classmethod
+    def isSupported(cls):
+        return platform.system() != "Windows"
+
+    ##  Start the thread of the event loop.
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    ##  Stop the event loop and wait for its thread to end.
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        Logger.log("i", "Serial event loop started")
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+        Logger.log("i", "Serial event loop stopped")
+
+    ##  Whether the caller runs in the thread of the event loop.
+    def isInLoopThread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    ##  Call a function in the thread of the event loop.
+    #
+    #   If the caller already runs in that thread, the function is called
+    #   immediately.
+    def callSoon(self, callback, *args):
+        if self.isInLoopThread():
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def getLoop(self):
+        return self._loop
+
+    ##  Start connecting a device to its serial port.
+    #
+    #   \param device The USBPrinterOutputDevice to connect.
+    #   \param baud_rates The baud rates to try, in order.
+    #   \param required_responses The number of temperature responses needed
+    #   to accept a baud rate.
+    #   \param remembered_baud_rate The baud rate that worked last time, which
+    #   is probed longer than the others.
+    #   \return The SerialConnection of the device.
+    def connect(self, device, baud_rates, required_responses, remembered_baud_rate = None):
+        connection = SerialConnection(self, device, baud_rates, required_responses, remembered_baud_rate)
+        self.callSoon(connection.start)
+        return connection
+
+
+##  The serial connection of one printer in the SerialEventLoop.
+#
+#   The connection goes through the states "connecting" (opening the port and
+#   detecting the baud rate), "connected" and "closed". While connecting it
+#   tries every baud rate until the printer answers temperature requests.
+#   When connected every received line is passed to the device, and when
+#   nothing was received for a while the device is told so with an empty
+#   line, like a read timeout of the threaded connection.
+#
+#   It has the write() and close() methods of a serial port, so the device
+#   can use it in place of one. Both can be called from any thread.
+class SerialConnection:
+    def __init__(self, event_loop, device, baud_rates, required_responses, remembered_baud_rate = None):
+        self._event_loop = event_loop
+        self._device = device
+        self._baud_rates = list(baud_rates)
+        self._required_responses = required_responses
+        self._remembered_baud_rate = remembered_baud_rate
+        self._baud_rate = None
+        self._state = "connecting"
+        self._serial = None
+        self._file_descriptor = None
+        self._read_buffer = b""
+        self._write_buffer = bytearray()
+        self._error_line = None  # The first part of an error message that is split over two lines.
+        self._timer = None
+        self._detecting = False  # Whether the answers to temperature requests are being counted.
+        self._detection_end_time = 0
+        self._probe_read_timeout = 0  # Seconds to wait for an answer to a temperature request.
+        self._successful_responses = 0
+        self._last_receive_time = 0
+
+    def getState(self):
+        return self._state
+
+    ##  The baud rate that is being probed, or that the printer is connected at.
+    def getBaudRate(self):
+        return self._baud_rate
+
+    ##  Start connecting. Must be called in the thread of the event loop.
+    def start(self):
+        Logger.log("d", "Attempting to connect to %s", self._device.getSerialPort())
+        self._tryNextBaudRate()
+
+    ##  Write data to the printer.
+    #   \param data bytes to write
+    def write(self, data):
+        self._event_loop.callSoon(self._write, bytes(data))
+
+    ##  Close the connection.
+    def close(self):
+        self._event_loop.callSoon(self._close)
+
+    ##  Open the port with the next baud rate to try, or give up if all baud
+    #   rates were tried.
+    def _tryNextBaudRate(self):
+        self._detecting = False
+        if self._state != "connecting":
+            return
+        while self._baud_rates:
+            baud_rate = self._baud_rates.pop(0)
+            Logger.log("d", "Attempting to connect to printer with serial %s on baud rate %s", self._device.getSerialPort(), baud_rate)
+            self._baud_rate = baud_rate
+            if self._serial is not None:
+                # Changing the baud rate of an open port doesn't reset the board, so there is no bootloader to wait for.
+                try:
+                    self._serial.baudrate = baud_rate
+                    self._startDetection()
+                    return
+                except (serial.SerialException, ValueError):
+                    continue
+            if self._open(baud_rate):
+                self._setTimer(1.5, self._startDetection)  # Ensure that we are not talking to the bootloader.
+                return
+
+        Logger.log("e", "Baud rate detection for %s failed", self._device.getSerialPort())
+        self._closeSerial()
+        self._state = "closed"
+        self._device._onAsyncConnectFailed(self)
+
+    ##  Start counting the answers to temperature requests.
+    def _startDetection(self):
+        self._detecting = True
+        self._successful_responses = 0
+        if self._remembered_baud_rate is None:
+            # Nothing is known about the printer, so every baud rate gets the time it always got.
+            probe_time, self._probe_read_timeout = self.__probe_time, self.__read_timeout
+        elif self._baud_rate == self._remembered_baud_rate:
+            probe_time, self._probe_read_timeout = self.__probe_time, self.__short_read_timeout
+        else:
+            # Other baud rates than the one that worked last time are probed briefly.
+            probe_time, self._probe_read_timeout = self.__short_probe_time, self.__short_read_timeout
+        self._detection_end_time = self._event_loop.getLoop().time() + probe_time
+        self._requestTemperature()
+
+    ##  Request the temperature, as this should (if the baud rate is correct)
+    #   result in an answer with "T:" in it, and wait for the answer.
+    def _requestTemperature(self):
+        remaining_time = self._detection_end_time - self._event_loop.getLoop().time()
+        if remaining_time <= 0:
+            self._tryNextBaudRate()
+            return
+        self._write(b"\nM105\n")
+        self._setTimer(min(self._probe_read_timeout, remaining_time), self._requestTemperature)
+
+    ##  Handle a line that was received while detecting the baud rate.
+    def _onDetectionLine(self, line):
+        if not self._detecting:
+            return  # Still talking to the bootloader.
+        if b"T:" in line:
+            self._successful_responses += 1
+            if self._successful_responses >= self._required_responses:
+                self._onConnected()
+                return
+        self._requestTemperature()  # Send M105 as long as we are listening, otherwise we end up in an undefined state
+
+    def _setTimer(self, delay, callback):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._event_loop.getLoop().call_later(delay, callback)
+
+    ##  Open the serial port, without blocking reads and writes.
+    #   \return True if the port was opened.
+    def _open(self, baud_rate):
+        self._closeSerial()
+        try:
+            self._serial = serial.Serial(str(self._device.getSerialPort()), baud_rate, timeout = 0)
+            self._file_descriptor = self._serial.fileno()
+            flags = fcntl.fcntl(self._file_descriptor, fcntl.F_GETFL)
+            fcntl.fcntl(self._file_descriptor, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        except (serial.SerialException, OSError, ValueError):
+            Logger.log("d", "Could not open port %s", self._device.getSerialPort())
+            self._closeSerial()
+            return False
+        self._read_buffer = b""
+        self._write_buffer = bytearray()
+        self._event_loop.getLoop().add_reader(self._file_descriptor, self._onReadable)
+        return True
+
+    def _onConnected(self):
+        self._state = "connected"
+        self._detecting = False
+        Logger.log("i", "Established printer connection on port %s", self._device.getSerialPort())
+        self._last_receive_time = self._event_loop.getLoop().time()
+        self._setTimer(self.__idle_check_interval, self._checkIdle)
+        self._device._onAsyncConnected(self)
+
+    ##  Tell the device when nothing was received for a while, so it can keep
+    #   the connection alive.
+    def _checkIdle(self):
+        if self._state != "connected":
+            return
+        now = self._event_loop.getLoop().time()
+        if now - self._last_receive_time >= self.__idle_timeout:
+            self._last_receive_time = now
+            self._device._processLine(b"")
+        if self._state == "connected":
+            self._setTimer(self.__idle_check_interval, self._checkIdle)
+
+    def _onReadable(self):
+        try:
+            data = os.read(self._file_descriptor, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            data = None
+            Logger.log("e", "Unexpected error while reading serial port. %s" % e)
+        if not data:  # The port is gone.
+            self._onDisconnected()
+            return
+
+        lines = (self._read_buffer + data).split(b"\n")
+        self._read_buffer = lines.pop()
+        for line in lines:
+            self._onLine(line + b"\n")
+            if self._state == "closed":
+                return
+
+    def _onLine(self, line):
+        # Marlin splits some error messages over two lines, see USBPrinterOutputDevice._processLine.
+        if self._error_line is not None:
+            line = self._error_line.rstrip() + line
+            self._error_line = None
+        elif self.__split_error_regex.match(line):
+            self._error_line = line
+            return
+
+        if self._state == "connected":
+            self._last_receive_time = self._event_loop.getLoop().time()
+            self._device._processLine(line)
+        elif self._state == "connecting":
+            self._onDetectionLine(line)
+
+    def _write(self, data):
+        if self._file_descriptor is None:
+            return
+        if self._write_buffer:
+            self._write_buffer.extend(data)  # Keep the order, the rest is written when the port is writable.
+            return
+        try:
+            written = os.write(self._file_descriptor, data)
+        except BlockingIOError:
+            written = 0
+        except OSError as e:
+            Logger.log("e", "Unexpected error while writing serial port %s" % e)
+            self._onDisconnected()
+            return
+        if written < len(data):
+            self._write_buffer.extend(data[written:])
+            self._event_loop.getLoop().add_writer(self._file_descriptor, self._onWritable)
+
+    def _onWritable(self):
+        try:
+            written = os.write(self._file_descriptor, self._write_buffer)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            Logger.log("e", "Unexpected error while writing serial port %s" % e)
+            self._onDisconnected()
+            return
+        del self._write_buffer[:written]
+        if not self._write_buffer:
+            self._event_loop.getLoop().remove_writer(self._file_descriptor)
+
+    def _onDisconnected(self):
+        was_connected = self._state == "connected"
+        self._close()
+        if was_connected:
+            self._device._setErrorState("Printer has been disconnected")
+            self._device.close()
+
+    def _close(self):
+        if self._state == "closed":
+            return
+        self._state = "closed"
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._closeSerial()
+
+    def _closeSerial(self):
+        if self._file_descriptor is not None:
+            self._event_loop.getLoop().remove_reader(self._file_descriptor)
+            self._event_loop.getLoop().remove_writer(self._file_descriptor)
+            self._file_descriptor = None
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except Exception:
+                pass
+            self._serial = None
+
+    # Seconds without receiving anything after which the device is told that the read timed out.
+    __idle_timeout = 2
+    __idle_check_interval = 0.5
+
+    # Seconds to probe a baud rate and to wait for each answer.
+    __probe_time = 5
+    __read_timeout = 3
+    # Seconds to probe a baud rate that is not the one that worked last time, and to wait for each answer.
+    __short_probe_time = 2
+    __short_read_timeout = 0.5
+
+    __split_error_regex = re.compile(b"Error:[0-9]\n")
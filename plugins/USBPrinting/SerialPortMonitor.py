@@ -0,0 +1,166 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+from UM.Logger import Logger
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import select
+import struct
+import threading
+import time
+
+##  Watches /dev for serial ports that are plugged in or out, with inotify.
+#
+#   Instead of listing the ports every few seconds, the monitor thread sleeps
+#   until a device node in /dev is created, deleted or gets its permissions
+#   set. The ports are then listed again once the events stop for a moment
+#   (udev creates the node and then changes its permissions, and a printer
+#   that resets can disappear and appear again in quick succession).
+#
+#   Ports that disappeared and appeared again while the events were settling
+#   are reported as re-enumerated, since they are a new device with the same
+#   name.
+#
+#   This only works on Linux. Use isSupported() to check, and list the ports
+#   periodically otherwise.
+class SerialPortMonitor:
+    ##  \param list_ports Function that returns the list of serial ports.
+    #   \param callback Called from the thread of the monitor with the list of
+    #   serial ports and the list of re-enumerated ports, whenever the ports
+    #   may have changed and once when the monitor starts.
+    def __init__(self, list_ports, callback):
+        self._list_ports = list_ports
+        self._callback = callback
+        self._inotify_file_descriptor = None
+        self._wake_read, self._wake_write = None, None
+        self._thread = None
+        self._running = False
+
+    ##  Whether inotify can be used on this platform.
+    @classmethod
+    def isSupported(cls):
+        return platform.system() == "Linux" and cls.__getLibC() is not None
+
+    ##  Start watching for serial ports.
+    #
+    #   \return True if the monitor started, or False if inotify could not be
+    #   set up. Then the caller must fall back to listing the ports
+    #   periodically.
+    def start(self):
+        if self._thread is not None:
+            return True
+        if not self.isSupported():
+            return False
+
+        libc = self.__getLibC()
+        file_descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if file_descriptor < 0:
+            Logger.log("w", "Could not watch for serial ports: %s", os.strerror(ctypes.get_errno()))
+            return False
+        if libc.inotify_add_watch(file_descriptor, b"/dev", self.__event_mask) < 0:
+            Logger.log("w", "Could not watch /dev for serial ports: %s", os.strerror(ctypes.get_errno()))
+            os.close(file_descriptor)
+            return False
+
+        self._inotify_file_descriptor = file_descriptor
+        self._wake_read, self._wake_write = os.pipe()
+        self._running = True
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    ##  Stop watching and wait for the thread of the monitor to end.
+    def stop(self):
+        if self._thread is None:
+            return
+        self._running = False
+        os.write(self._wake_write, b"x")
+        self._thread.join()
+        self._thread = None
+        for file_descriptor in (self._inotify_file_descriptor, self._wake_read, self._wake_write):
+            os.close(file_descriptor)
+        self._inotify_file_descriptor = None
+
+    def _run(self):
+        Logger.log("i", "Watching /dev for serial ports")
+        self._callback(self._list_ports(), [])
+        settle_time = None  # When the ports are listed again, if there were events.
+        removed_ports = set()  # The ports that were deleted since the last listing.
+        reenumerated_ports = set()
+        while self._running:
+            timeout = None if settle_time is None else max(settle_time - time.monotonic(), 0)
+            readable, _, _ = select.select([self._inotify_file_descriptor, self._wake_read], [], [], timeout)
+            if self._wake_read in readable:
+                break
+
+            if self._inotify_file_descriptor in readable:
+                for mask, name in self._readEvents():
+                    if not self._isSerialPortName(name):
+                        continue
+                    path = "/dev/" + name
+                    if mask & (self.__IN_DELETE | self.__IN_MOVED_FROM):
+                        removed_ports.add(path)
+                    elif path in removed_ports:
+                        reenumerated_ports.add(path)
+                    settle_time = time.monotonic() + self.__settle_delay
+
+            if settle_time is not None and time.monotonic() >= settle_time:
+                serial_ports = self._list_ports()
+                self._callback(serial_ports, [port for port in reenumerated_ports if port in serial_ports])
+                settle_time = None
+                removed_ports.clear()
+                reenumerated_ports.clear()
+
+    ##  Read the pending inotify events.
+    #
+    #   \return A list of tuples with the event mask and the file name.
+    def _readEvents(self):
+        events = []
+        try:
+            data = os.read(self._inotify_file_descriptor, 65536)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset + self.__event_header.size <= len(data):
+            _, mask, _, name_length = self.__event_header.unpack_from(data, offset)
+            offset += self.__event_header.size
+            name = data[offset:offset + name_length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += name_length
+            events.append((mask, name))
+        return events
+
+    def _isSerialPortName(self, name):
+        return name.startswith(self.__serial_port_prefixes)
+
+    @classmethod
+    def __getLibC(cls):
+        if cls.__libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno = True)
+                libc.inotify_init1, libc.inotify_add_watch  # Raise if inotify is missing.
+            except (OSError, AttributeError):
+                return None
+            cls.__libc = libc
+        return cls.__libc
+
+    __libc = None
+
+    __IN_ATTRIB = 0x00000004
+    __IN_MOVED_FROM = 0x00000040
+    __IN_MOVED_TO = 0x00000080
+    __IN_CREATE = 0x00000100
+    __IN_DELETE = 0x00000200
+    __event_mask = __IN_ATTRIB | __IN_MOVED_FROM | __IN_MOVED_TO | __IN_CREATE | __IN_DELETE
+
+    # The struct inotify_event without the name: watch descriptor, mask, cookie and length of the name.
+    __event_header = struct.Struct("iIII")
+
+    # The names of the device nodes of USB serial ports, see USBPrinterOutputDeviceManager.getSerialPortList.
+    __serial_port_prefixes = ("ttyUSB", "ttyACM")
+
+    # Seconds to wait for the events to settle before listing the ports.
+    __settle_delay = 0.05
@@ -2,26 +2,36 @@
 # Cura is released under the terms of the AGPLv3 or higher.
 
 from .avr_isp import stk500v2, ispBase, intelHex
+from .GCodeLineStream import GCodeLineStream, GCodeLineStreamJob
+from .GCodePathCompressor import GCodePathCompressor
 import serial
+import serial.tools.list_ports
 import threading
 import time
 import queue
 import re
-import functools
+import itertools
+import collections
+import json
 
 from UM.Application import Application
 from UM.Logger import Logger
 from cura.PrinterOutputDevice import PrinterOutputDevice, ConnectionState
+from cura.GCodePostProcessingPipeline import GCodePostProcessingPipeline
 from UM.Message import Message
+from UM.Preferences import Preferences
 
-from PyQt5.QtCore import QUrl, pyqtSlot, pyqtSignal
+from PyQt5.QtCore import QUrl, pyqtSlot, pyqtSignal, pyqtProperty
 
 from UM.i18n import i18nCatalog
 catalog = i18nCatalog("cura")
 
 
 class USBPrinterOutputDevice(PrinterOutputDevice):
-    def __init__(self, serial_port):
+    ##  \param serial_port The serial port of the printer.
+    #   \param event_loop The SerialEventLoop to connect in, or None to connect
+    #   and listen in threads of this device.
+    def __init__(self, serial_port, event_loop = None):
         super().__init__(serial_port)
         self.setName(catalog.i18nc("@item:inmenu", "USB printing"))
         self.setShortDescription(catalog.i18nc("@action:button", "Print via USB"))
@@ -32,6 +42,9 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         self._serial_port = serial_port
         self._error_state = None
 
+        self._event_loop = event_loop
+        self._async_connection = None  # The SerialConnection while connecting or connected in the event loop.
+
         self._connect_thread = threading.Thread(target = self._connect)
         self._connect_thread.daemon = True
 
@@ -42,14 +55,22 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         # response. If the baudrate is correct, this should make sense, else we get giberish.
         self._required_responses_auto_baud = 3
 
+        # The time it took to connect the last time, in seconds, or None if not connected yet.
+        self._connect_start_time = time.time()
+        self._connect_latency = None
+
         self._listen_thread = threading.Thread(target=self._listen)
         self._listen_thread.daemon = True
 
         self._update_firmware_thread = threading.Thread(target= self._updateFirmware)
         self._update_firmware_thread.daemon = True
         self.firmwareUpdateComplete.connect(self._onFirmwareUpdateComplete)
+        # The baud rate is detected in another thread, but the preferences may only be changed in the main thread.
+        self.baudRateDetected.connect(self._rememberBaudRate)
 
         self._heatup_wait_start_time = time.time()
+        self._temperature_request_timeout = time.time()
+        self._ok_timeout = time.time()
 
         ## Queue for commands that need to be send. Used when command is sent when a print is active.
         self._command_queue = queue.Queue()
@@ -64,8 +85,40 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         ## Keep track where in the provided g-code the print is
         self._gcode_position = 0
 
-        # List of gcode lines to be printed
-        self._gcode = []
+        # The g-code lines to be printed, encoded to send.
+        self._gcode = GCodeLineStream()
+
+        # The job that encodes the g-code of the next print, if the g-code is being encoded.
+        self._gcode_job = None
+
+        # Printing from the SD card of the printer: the g-code is uploaded to a file on the card and then printed by
+        # the printer itself. The state is None when not printing from the card, "opening" or "uploading" the file,
+        # or "printing".
+        self._sd_state = None
+        self._upload_to_sd = False  # Whether the g-code that is being encoded is uploaded to the SD card.
+        self._sd_file_opened = False
+        self._sd_upload_progress = 0
+        self._sd_status_timeout = time.time()
+
+        # Streaming mode: instead of sending a line for every "ok", keep as many lines in flight as the firmware can
+        # buffer. Every command that is sent is answered with one "ok", so the lines in flight are the ones not
+        # answered yet.
+        self._streaming = False
+        self._streaming_max_lines = 4
+        self._streaming_max_bytes = 127
+        self._streaming_lock = threading.Lock()
+        # The commands in flight, oldest first. Each is a list of its line number (None for a queued command that
+        # is not numbered), its size in bytes and whether it is a line that the printer will reject or has lost
+        # because it asked to resend an earlier line (stale).
+        self._in_flight = collections.deque()
+        self._in_flight_bytes = 0
+        self._line_capacity = 4  # The number of commands that can be in flight, lowered if the firmware reports fewer free buffer slots.
+        self._pending_command = None  # A queued command that didn't fit in the window yet.
+        self._sent_line_numbers = collections.deque(maxlen = self.__resend_history_size)
+        self._resend_line_number = None  # The line of the last resend request.
+        self._resend_requested = False  # Whether the next "ok" answers a line that the printer rejected.
+        self._streaming_start_time = None
+        self._streaming_statistics = {}
 
         # Check if endstops are ever pressed (used for first run)
         self._x_min_endstop_pressed = False
@@ -82,9 +135,15 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
 
         self._current_z = 0
 
+        # The capabilities that the firmware reported in its answer to M115, like "ARCS", with their values.
+        self._firmware_capabilities = {}
+
         self._updating_firmware = False
 
         self._firmware_file_name = None
+        self._firmware_data = None  # The contents of the firmware file, if they were read already.
+        self._firmware_update_progress = 0
+        self._firmware_update_state = None  # "updating", "completed" or "failed", or None if the firmware was not updated.
 
         self._error_message = None
 
@@ -92,6 +151,16 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
 
     firmwareUpdateComplete = pyqtSignal()
 
+    firmwareUpdateFailed = pyqtSignal()
+
+    ##  Emitted with the keys to remember the baud rate under and the baud
+    #   rate, see _onBaudRateDetected.
+    baudRateDetected = pyqtSignal("QVariantList", int)
+
+    firmwareUpdateProgressChanged = pyqtSignal()
+
+    sdUploadProgressChanged = pyqtSignal()
+
     endstopStateChanged = pyqtSignal(str ,bool, arguments = ["key","state"])
 
     def _setTargetBedTemperature(self, temperature):
@@ -132,30 +201,157 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         self._sendCommand("G90")
 
     ##  Start a print based on a g-code.
-    #   \param gcode_list List with gcode (strings).
-    def printGCode(self, gcode_list):
-        if self._progress or self._connection_state != ConnectionState.connected:
+    #   \param gcode_list List with gcode (strings). Each string can hold one or
+    #   more lines. This can be a generator, it is read in the background.
+    #   \param post_process Whether to apply the g-code post-processors. The
+    #   g-code is already post-processed if it was encoded by the g-code writer.
+    #
+    #   The g-code is encoded into a GCodeLineStream in the background, the print
+    #   starts when it is encoded. If the preference "usb_printing/sd_upload" is
+    #   set, the g-code is uploaded to the SD card of the printer and printed
+    #   from there.
+    def printGCode(self, gcode_list, post_process = True):
+        if self._progress or self._gcode_job or self._sd_state is not None or self._connection_state != ConnectionState.connected:
             self._error_message = Message(catalog.i18nc("@info:status", "Printer is busy or not connected. Unable to start a new job."))
             self._error_message.show()
             Logger.log("d", "Printer is busy or not connected, aborting print")
             self.writeError.emit(self)
             return
 
-        self._gcode.clear()
-        for layer in gcode_list:
-            self._gcode.extend(layer.split("\n"))
+        if post_process:
+            lines = GCodePostProcessingPipeline.getInstance().process(gcode_list, split_lines = True)
+        else:
+            lines = itertools.chain.from_iterable(gcode.split("\n") for gcode in gcode_list)
+        self._upload_to_sd = bool(Preferences.getInstance().getValue("usb_printing/sd_upload"))
+
+        # Encode the lines in the background, the print starts when they are encoded.
+        self._gcode_job = GCodeLineStreamJob(self._getPrintLines(lines, self._upload_to_sd))
+        self._gcode_job.finished.connect(self._onGCodeEncoded)
+        self._gcode_job.start()
+
+    ##  Start the print when its g-code is encoded.
+    def _onGCodeEncoded(self, job):
+        self._gcode_job = None
+        if self._connection_state != ConnectionState.connected or self._job_state != "printing":
+            Logger.log("d", "Print was aborted while encoding the g-code")
+            self.writeError.emit(self)
+            return
 
+        self._printGCodeStream(job.getResult(), self._upload_to_sd)
+        self.writeFinished.emit(self)
+        self.writeSuccess.emit(self)
+
+    ##  Get the lines to send to the printer for a print.
+    #
+    #   If the preference "usb_printing/path_compression" is set, runs of moves
+    #   are merged into fewer lines, see GCodePathCompressor.
+    #   \param lines The g-code lines of the print.
+    #   \param upload_to_sd Whether the lines are uploaded to the SD card. The
+    #   file on the card is closed after the last line.
+    def _getPrintLines(self, lines, upload_to_sd):
+        if Preferences.getInstance().getValue("usb_printing/path_compression"):
+            lines = GCodePathCompressor(arcs = self._firmware_capabilities.get("ARCS") == "1").compress(lines)
+        if upload_to_sd:
+            lines = itertools.chain(lines, ["M29"])
         # Reset line number. If this is not done, first line is sometimes ignored
-        self._gcode.insert(0, "M110")
+        return itertools.chain(["M110"], lines)
+
+    ##  Start sending encoded g-code to the printer.
+    #   \param gcode The GCodeLineStream to print, see _getPrintLines.
+    #   \param upload_to_sd Whether to upload the g-code to the SD card and
+    #   print it from there.
+    def _printGCodeStream(self, gcode, upload_to_sd = False):
+        self._gcode = gcode
         self._gcode_position = 0
         self._print_start_time_100 = None
-        self._is_printing = True
         self._print_start_time = time.time()
 
-        for i in range(0, 4):  # Push first 4 entries before accepting other inputs
-            self._sendNextGcodeLine()
+        if upload_to_sd:
+            # Open the file first. Lines that are sent before the printer is writing to the file would be executed.
+            self._sd_state = "opening"
+            self._sd_file_opened = False
+            self._setSDUploadProgress(0)
+            self._sendCommand("M28 %s" % self.__sd_file_name)
+            return
+        self._startSendingGCode()
+
+    ##  Start sending the lines of the print, once or streaming.
+    def _startSendingGCode(self):
+        preferences = Preferences.getInstance()
+        # An upload is always streamed, as the printer only writes the lines to the card.
+        self._streaming = self._sd_state == "uploading" or bool(preferences.getValue("usb_printing/streaming"))
+        if self._streaming:
+            self._startStreaming(int(preferences.getValue("usb_printing/streaming_lines")), int(preferences.getValue("usb_printing/streaming_bytes")))
+            self._is_printing = True
+            with self._streaming_lock:
+                self._fillStreamingWindow()
+        else:
+            self._is_printing = True
+            for i in range(0, 4):  # Push first 4 entries before accepting other inputs
+                self._sendNextGcodeLine()
+
+    ##  Handle a line of the printer while uploading to or printing from the SD
+    #   card.
+    def _processSDLine(self, line):
+        if b"open failed" in line or b"SD init fail" in line or b"No SD card" in line:
+            Logger.log("e", "Could not print from the SD card: %s", line)
+            self._sd_state = None
+            self._is_printing = False
+            self.setProgress(0)
+            self._setErrorState("Could not print from the SD card of the printer")
+            return
 
-        self.writeFinished.emit(self)
+        if self._sd_state == "opening":
+            if b"Writing to file" in line:
+                self._sd_file_opened = True
+            elif self._sd_file_opened and line.startswith(b"ok"):  # The file is open when M28 is answered.
+                self._sd_state = "uploading"
+                self._startSendingGCode()
+        elif self._sd_state == "uploading":
+            if b"Done saving file" in line:
+                self._onSDUploadFinished()
+        elif self._sd_state == "printing":
+            match = self.__sd_progress_regex.search(line)
+            if match:
+                printed_bytes, total_bytes = int(match.group(1)), int(match.group(2))
+                if printed_bytes < total_bytes:  # The print is done when the printer says so.
+                    self.setProgress(printed_bytes, total_bytes)
+            elif b"Done printing file" in line:
+                Logger.log("i", "Printed from the SD card in %.1f s", time.time() - self._print_start_time)
+                self._sd_state = None
+                self.setProgress(100)
+                return
+
+            if time.time() > self._sd_status_timeout:
+                self._sd_status_timeout = time.time() + self.__sd_status_interval
+                self._sendCommand("M27")
+
+    ##  Start printing the file on the SD card when it is uploaded.
+    def _onSDUploadFinished(self):
+        Logger.log("i", "Uploaded the print to the SD card in %.1f s", time.time() - self._print_start_time)
+        self._is_printing = False
+        self._sd_state = "printing"
+        self._setSDUploadProgress(100)
+        self._sendCommand("M23 %s" % self.__sd_file_name)
+        self._sendCommand("M24")
+        self._sd_status_timeout = time.time() + self.__sd_status_interval
+        # Send the commands that were held back while uploading, so they weren't written to the file.
+        while not self._command_queue.empty():
+            self._sendCommand(self._command_queue.get())
+
+    ##  Whether the g-code is being uploaded to the SD card. Nothing but the
+    #   g-code may be sent then, as the printer writes everything to the file.
+    def _isUploadingToSD(self):
+        return self._sd_state == "opening" or self._sd_state == "uploading"
+
+    ##  The progress of the upload to the SD card, from 0 to 100.
+    @pyqtProperty(float, notify = sdUploadProgressChanged)
+    def sdUploadProgress(self):
+        return self._sd_upload_progress
+
+    def _setSDUploadProgress(self, progress):
+        self._sd_upload_progress = progress
+        self.sdUploadProgressChanged.emit()
 
     ##  Get the serial port string of this connection.
     #   \return serial port
@@ -164,23 +360,49 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
 
     ##  Try to connect the serial. This simply starts the thread, which runs _connect.
     def connect(self):
+        if self._event_loop is not None:
+            if not self._updating_firmware and self._async_connection is None:
+                self.setConnectionState(ConnectionState.connecting)
+                self._connect_start_time = time.time()
+                self._async_connection = self._event_loop.connect(self, self._getBaudrateList(), self._required_responses_auto_baud, self._getRememberedBaudRate())
+            return
         if not self._updating_firmware and not self._connect_thread.isAlive():
             self._connect_thread.start()
 
+    ##  Called by the SerialEventLoop when the connection is established.
+    def _onAsyncConnected(self, connection):
+        self._serial = connection
+        self._onBaudRateDetected(connection.getBaudRate())
+        self._temperature_request_timeout = time.time()
+        self._ok_timeout = time.time()
+        self.setConnectionState(ConnectionState.connected)
+        self._requestFirmwareCapabilities()
+
+    ##  Called by the SerialEventLoop when no baud rate worked.
+    def _onAsyncConnectFailed(self, connection):
+        if connection is self._async_connection:
+            self._async_connection = None
+            self.setConnectionState(ConnectionState.closed)
+
     ##  Private function (threaded) that actually uploads the firmware.
     def _updateFirmware(self):
-        self.setProgress(0, 100)
+        self._setFirmwareUpdateProgress(0)
 
         if self._connection_state != ConnectionState.closed:
             self.close()
-        hex_file = intelHex.readHex(self._firmware_file_name)
+        try:
+            hex_file = self._firmware_data if self._firmware_data is not None else intelHex.readHex(self._firmware_file_name)
+        except Exception as e:  # intelHex raises a plain Exception for a malformed file.
+            Logger.log("e", "Unable to read hex file %s: %s", self._firmware_file_name, str(e))
+            hex_file = []
 
         if len(hex_file) == 0:
             Logger.log("e", "Unable to read provided hex file. Could not update firmware")
-            return 
+            self._onFirmwareUpdateFailed()
+            return
 
         programmer = stk500v2.Stk500v2()
-        programmer.progressCallback = self.setProgress 
+        programmer.progress_callback = self._setFirmwareUpdateProgress
 
         try:
             programmer.connect(self._serial_port)
@@ -192,7 +414,8 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
 
         if not programmer.isConnected():
             Logger.log("e", "Unable to connect with serial. Could not update firmware")
-            return 
+            self._onFirmwareUpdateFailed()
+            return
 
         self._updating_firmware = True
 
@@ -202,20 +425,55 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         except Exception as e:
             Logger.log("e", "Exception while trying to update firmware %s" %e)
             self._updating_firmware = False
+            programmer.close()
+            self._onFirmwareUpdateFailed()
             return
         programmer.close()
 
-        self.setProgress(100, 100)
+        self._setFirmwareUpdateProgress(100)
 
+        self._firmware_update_state = "completed"
         self.firmwareUpdateComplete.emit()
 
+    ##  Report that the firmware could not be updated. The progress is left
+    #   where it was, so it doesn't look like the update completed.
+    def _onFirmwareUpdateFailed(self):
+        self._firmware_update_state = "failed"
+        self.firmwareUpdateFailed.emit()
+
     ##  Upload new firmware to machine
     #   \param filename full path of firmware file to be uploaded
-    def updateFirmware(self, file_name):
+    #   \param hex_data The contents of the file as read by intelHex.readHex,
+    #   or None to read the file. When many printers are updated at once, the
+    #   file is read only once.
+    def updateFirmware(self, file_name, hex_data = None):
         Logger.log("i", "Updating firmware of %s using %s", self._serial_port, file_name)
         self._firmware_file_name = file_name
+        self._firmware_data = hex_data
+        if self._update_firmware_thread.isAlive():
+            Logger.log("w", "The firmware of %s is already being updated", self._serial_port)
+            return
+        self._firmware_update_state = "updating"
+        self._update_firmware_thread = threading.Thread(target = self._updateFirmware)  # A thread can only run once.
+        self._update_firmware_thread.daemon = True
         self._update_firmware_thread.start()
 
+    ##  The state of the last firmware update: "updating", "completed" or
+    #   "failed", or None if the firmware was not updated.
+    def getFirmwareUpdateState(self):
+        return self._firmware_update_state
+
+    ##  The progress of the firmware update, from 0 to 100.
+    @pyqtProperty(float, notify = firmwareUpdateProgressChanged)
+    def firmwareUpdateProgress(self):
+        return self._firmware_update_progress
+
+    ##  Set the progress of the firmware update.
+    #   It will be normalized (based on max_progress) to range 0 - 100
+    def _setFirmwareUpdateProgress(self, progress, max_progress = 100):
+        self._firmware_update_progress = (progress / max_progress) * 100
+        self.firmwareUpdateProgressChanged.emit()
+
     @pyqtSlot()
     def startPollEndstop(self):
         if not self._poll_endstop:
@@ -239,6 +497,11 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     def _connect(self):
         Logger.log("d", "Attempting to connect to %s", self._serial_port)
         self.setConnectionState(ConnectionState.connecting)
+        self._connect_start_time = time.time()
+        remembered_baud_rate = self._getRememberedBaudRate()
+        # Opening the port resets the board into its bootloader. The time to wait for the bootloader is counted from
+        # here, so it overlaps with the STK500 probe.
+        reset_time = time.time()
         programmer = stk500v2.Stk500v2()
         try:
             programmer.connect(self._serial_port) # Connect with the serial, if this succeeds, it's an arduino based usb device.
@@ -254,6 +517,7 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
             Logger.log("d","Attempting to connect to printer with serial %s on baud rate %s", self._serial_port, baud_rate)
             if self._serial is None:
                 try:
+                    reset_time = time.time()
                     self._serial = serial.Serial(str(self._serial_port), baud_rate, timeout = 3, writeTimeout = 10000)
                 except serial.SerialException:
                     Logger.log("d", "Could not open port %s" % self._serial_port)
@@ -262,9 +526,17 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
                 if not self.setBaudRate(baud_rate):
                     continue # Could not set the baud rate, go to the next
 
-            time.sleep(1.5) # Ensure that we are not talking to the bootloader. 1.5 seconds seems to be the magic number
+            # Ensure that we are not talking to the bootloader. 1.5 seconds seems to be the magic number.
+            # Changing the baud rate of an open port doesn't reset the board, so this only waits once.
+            time.sleep(max(reset_time + 1.5 - time.time(), 0))
             sucesfull_responses = 0
-            timeout_time = time.time() + 5
+            if remembered_baud_rate is None or baud_rate == remembered_baud_rate:
+                timeout_time = time.time() + 5
+            else:
+                # Other baud rates than the one that worked last time are probed briefly, with short reads. Without a
+                # baud rate that worked, all are probed as long as the first.
+                self._serial.timeout = 0.5
+                timeout_time = time.time() + self.__short_probe_time
             self._serial.write(b"\n")
             self._sendCommand("M105")  # Request temperature, as this should (if baudrate is correct) result in a command with "T:" in it
             while timeout_time > time.time():
@@ -279,10 +551,11 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
                     sucesfull_responses += 1
                     if sucesfull_responses >= self._required_responses_auto_baud:
                         self._serial.timeout = 2 # Reset serial timeout
+                        self._onBaudRateDetected(baud_rate)
                         self.setConnectionState(ConnectionState.connected)
+                        self._requestFirmwareCapabilities()
                         self._listen_thread.start()  # Start listening
-                        Logger.log("i", "Established printer connection on port %s" % self._serial_port)
-                        return 
+                        return
 
                 self._sendCommand("M105")  # Send M105 as long as we are listening, otherwise we end up in an undefined state
 
@@ -290,6 +563,68 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         self.close()  # Unable to connect, wrap up.
         self.setConnectionState(ConnectionState.closed)
 
+    ##  Ask the firmware what it supports. It answers with a line
+    #   "Cap:<name>:<value>" per capability, see _processLine.
+    def _requestFirmwareCapabilities(self):
+        self._firmware_capabilities = {}
+        self._sendCommand("M115")
+
+    ##  Remember the baud rate of the printer and how long connecting took.
+    #
+    #   This is called in the thread that detected the baud rate. The baud rate
+    #   is stored in the preferences in the main thread, by _rememberBaudRate.
+    def _onBaudRateDetected(self, baud_rate):
+        self._connect_latency = time.time() - self._connect_start_time
+        Logger.log("i", "Established printer connection on port %s at %s baud in %.1f seconds", self._serial_port, baud_rate, self._connect_latency)
+        self.baudRateDetected.emit(self._getBaudRateKeys(), baud_rate)  # Listing the ports can be slow, so it is not done in the main thread.
+
+    ##  Store the baud rate of the printer in the preferences.
+    #   \param keys The keys to store the baud rate under, see _getBaudRateKeys.
+    #   \param baud_rate The baud rate that the printer connected at.
+    def _rememberBaudRate(self, keys, baud_rate):
+        preferences = Preferences.getInstance()
+        try:
+            baud_rates = json.loads(preferences.getValue("usb_printing/baud_rates"))
+        except (TypeError, ValueError):
+            baud_rates = {}
+        if all(baud_rates.get(key) == baud_rate for key in keys):
+            return
+        for key in keys:
+            baud_rates[key] = baud_rate
+        preferences.setValue("usb_printing/baud_rates", json.dumps(baud_rates))
+
+    ##  The baud rate that the printer on this port connected at last time.
+    #   \return The baud rate, or None if it isn't known.
+    def _getRememberedBaudRate(self):
+        try:
+            baud_rates = json.loads(Preferences.getInstance().getValue("usb_printing/baud_rates"))
+        except (TypeError, ValueError):
+            return None
+        for key in self._getBaudRateKeys():
+            if key in baud_rates:
+                return baud_rates[key]
+        return None
+
+    ##  The keys under which the baud rate of the printer is remembered: the
+    #   serial number of the USB device, which follows the printer to other
+    #   ports, and the port.
+    def _getBaudRateKeys(self):
+        keys = []
+        try:
+            for port_info in serial.tools.list_ports.comports():
+                if port_info.device == self._serial_port and port_info.serial_number:
+                    keys.append("serial_number:" + port_info.serial_number)
+        except AttributeError:
+            pass  # Older versions of pyserial don't tell the serial number.
+        keys.append("port:" + str(self._serial_port))
+        return keys
+
+    ##  The time it took to connect to the printer, in seconds, or -1 if it
+    #   isn't connected yet.
+    @pyqtProperty(float, notify = PrinterOutputDevice.connectionStateChanged)
+    def connectLatency(self):
+        return self._connect_latency if self._connect_latency is not None else -1
+
     ##  Set the baud rate of the serial. This can cause exceptions, but we simply want to ignore those.
     def setBaudRate(self, baud_rate):
         try:
@@ -301,6 +636,14 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     ##  Close the printer connection
     def close(self):
         Logger.log("d", "Closing the USB printer connection.")
+        if self._event_loop is not None:
+            if self._async_connection is not None:
+                self._async_connection.close()
+                self._async_connection = None
+            self._serial = None
+            self.setConnectionState(ConnectionState.closed)
+            return
+
         if self._connect_thread.isAlive():
             try:
                 self._connect_thread.join()
@@ -326,21 +669,24 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     ##  Directly send the command, withouth checking connection state (eg; printing).
     #   \param cmd string with g-code
     def _sendCommand(self, cmd):
+        self._sendBytes(b"\n" + (cmd + "\n").encode())
+
+    ##  Directly send encoded g-code to the printer.
+    #   \param command bytes with one or more lines of g-code, ending in a newline
+    def _sendBytes(self, command):
         if self._serial is None:
             return
 
-        if "M109" in cmd or "M190" in cmd:
+        if b"M109" in command or b"M190" in command:
             self._heatup_wait_start_time = time.time()
 
         try:
-            command = (cmd + "\n").encode()
-            self._serial.write(b"\n")
             self._serial.write(command)
         except serial.SerialTimeoutException:
             Logger.log("w","Serial timeout while writing to serial port, trying again.")
             try:
                 time.sleep(0.5)
-                self._serial.write((cmd + "\n").encode())
+                self._serial.write(command)
             except Exception as e:
                 Logger.log("e","Unexpected error while writing serial port %s " % e)
                 self._setErrorState("Unexpected error while writing serial port %s " % e)
@@ -353,7 +699,7 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     ##  Send a command to printer.
     #   \param cmd string with g-code
     def sendCommand(self, cmd):
-        if self._progress:
+        if self._isUploadingToSD() or (self._progress and self._sd_state is None):
             self._command_queue.put(cmd)
         elif self._connection_state == ConnectionState.connected:
             self._sendCommand(cmd)
@@ -369,6 +715,24 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         Application.getInstance().showPrintMonitor.emit(True)
         self.startPrint()
 
+    ##  Print g-code that is already encoded, see EncodedGCode.
+    #
+    #   \param encoded_gcode The EncodedGCode to print.
+    #   \param node Not used, the encoded g-code is printed.
+    #   \param file_name Not used.
+    def requestWriteEncoded(self, encoded_gcode, node, file_name = None):
+        Application.getInstance().showPrintMonitor.emit(True)
+        self.writeStarted.emit(self)
+        self._updateJobState("printing")
+        self.printGCode(self._readEncodedLines(encoded_gcode), post_process = False)
+
+    ##  Read the lines of encoded g-code one by one, without reading the
+    #   whole file into memory.
+    def _readEncodedLines(self, encoded_gcode):
+        with encoded_gcode.open() as stream:
+            for line in stream:
+                yield line.decode("utf-8", "replace")
+
     def _setEndstopState(self, endstop_key, value):
         if endstop_key == b"x_min":
             if self._x_min_endstop_pressed != value:
@@ -386,77 +750,270 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     ##  Listen thread function.
     def _listen(self):
         Logger.log("i", "Printer connection listen thread started for %s" % self._serial_port)
-        temperature_request_timeout = time.time()
-        ok_timeout = time.time()
+        self._temperature_request_timeout = time.time()
+        self._ok_timeout = time.time()
         while self._connection_state == ConnectionState.connected:
             line = self._readline()
             if line is None:
                 break  # None is only returned when something went wrong. Stop listening
+            self._processLine(line)
+
+        Logger.log("i", "Printer connection listen thread stopped for %s" % self._serial_port)
 
-            if time.time() > temperature_request_timeout:
-                if self._num_extruders > 0:
-                    self._temperature_requested_extruder_index = (self._temperature_requested_extruder_index + 1) % self._num_extruders
-                    self.sendCommand("M105 T%d" % (self._temperature_requested_extruder_index))
+    ##  Handle a line received from the printer while connected.
+    #
+    #   An empty line means that nothing was received for a while (the read
+    #   timed out), which is used to keep the connection alive.
+    #   \param line bytes with the line, or empty if the read timed out
+    def _processLine(self, line):
+        if time.time() > self._temperature_request_timeout and not self._isUploadingToSD():
+            if self._num_extruders > 0:
+                self._temperature_requested_extruder_index = (self._temperature_requested_extruder_index + 1) % self._num_extruders
+                self.sendCommand("M105 T%d" % (self._temperature_requested_extruder_index))
+            else:
+                self.sendCommand("M105")
+            self._temperature_request_timeout = time.time() + 5
+
+        if line.startswith(b"Error:"):
+            # Oh YEAH, consistency.
+            # Marlin reports a MIN/MAX temp error as "Error:x\n: Extruder switched off. MAXTEMP triggered !\n"
+            # But a bed temp error is reported as "Error: Temperature heated bed switched off. MAXTEMP triggered !!"
+            # So we can have an extra newline in the most common case. Awesome work people.
+            if re.match(b"Error:[0-9]\n", line):
+                line = line.rstrip() + self._readline()
+
+            # Skip the communication errors, as those get corrected.
+            if b"Extruder switched off" in line or b"Temperature heated bed switched off" in line or b"Something is wrong, please turn off the printer." in line:
+                if not self.hasError():
+                    self._setErrorState(line[6:])
+
+        elif b" T:" in line or line.startswith(b"T:"):  # Temperature message
+            try:
+                self._setHotendTemperature(self._temperature_requested_extruder_index, float(re.search(b"T: *([0-9\.]*)", line).group(1)))
+            except:
+                pass
+            if b"B:" in line:  # Check if it's a bed temperature
+                try:
+                    self._setBedTemperature(float(re.search(b"B: *([0-9\.]*)", line).group(1)))
+                except Exception as e:
+                    pass
+            #TODO: temperature changed callback
+        elif line.startswith(b"Cap:"):  # Capability of the firmware, answer to M115
+            try:
+                _, name, value = line.decode("utf-8", "replace").strip().split(":", 2)
+                self._firmware_capabilities[name] = value
+            except ValueError:
+                pass
+        elif b"_min" in line or b"_max" in line:
+            tag, value = line.split(b":", 1)
+            self._setEndstopState(tag,(b"H" in value or b"TRIGGERED" in value))
+
+        if self._is_printing and self._streaming:
+            if b"ok" in line:
+                self._ok_timeout = time.time() + 5
+                self._onStreamingOk(line)
+            elif b"resend" in line.lower() or b"rs" in line:
+                self._onStreamingResend(line)
+            elif line == b"" and time.time() > self._ok_timeout:
+                self._ok_timeout = time.time() + 5
+                self._onStreamingTimeout()
+        elif self._is_printing:
+            if line == b"" and time.time() > self._ok_timeout:
+                line = b"ok"  # Force a timeout (basically, send next command)
+
+            if b"ok" in line:
+                self._ok_timeout = time.time() + 5
+                if not self._command_queue.empty() and not self._isUploadingToSD():
+                    self._sendCommand(self._command_queue.get())
+                elif self._is_paused:
+                    line = b""  # Force getting temperature as keep alive
                 else:
-                    self.sendCommand("M105")
-                temperature_request_timeout = time.time() + 5
-
-            if line.startswith(b"Error:"):
-                # Oh YEAH, consistency.
-                # Marlin reports a MIN/MAX temp error as "Error:x\n: Extruder switched off. MAXTEMP triggered !\n"
-                # But a bed temp error is reported as "Error: Temperature heated bed switched off. MAXTEMP triggered !!"
-                # So we can have an extra newline in the most common case. Awesome work people.
-                if re.match(b"Error:[0-9]\n", line):
-                    line = line.rstrip() + self._readline()
-
-                # Skip the communication errors, as those get corrected.
-                if b"Extruder switched off" in line or b"Temperature heated bed switched off" in line or b"Something is wrong, please turn off the printer." in line:
-                    if not self.hasError():
-                        self._setErrorState(line[6:])
-
-            elif b" T:" in line or line.startswith(b"T:"):  # Temperature message
+                    self._sendNextGcodeLine()
+            elif b"resend" in line.lower() or b"rs" in line:  # Because a resend can be asked with "resend" and "rs"
+                line_number = self._getResendLineNumber(line)
+                if line_number is not None:
+                    self._gcode_position = line_number
+
+        # After the lines of the print, so the "ok" that starts the upload isn't counted for the first line.
+        if self._sd_state is not None:
+            self._processSDLine(line)
+
+        # Request the temperature on comm timeout (every 2 seconds) when we are not printing.)
+        if line == b"" and not self._isUploadingToSD():
+            if self._num_extruders > 0:
+                self._temperature_requested_extruder_index = (self._temperature_requested_extruder_index + 1) % self._num_extruders
+                self.sendCommand("M105 T%d" % self._temperature_requested_extruder_index)
+            else:
+                self.sendCommand("M105")
+
+    ##  Get the line number from a resend request of the printer.
+    #   \return The line number, or None if the request can't be read.
+    def _getResendLineNumber(self, line):
+        try:
+            return int(line.replace(b"N:",b" ").replace(b"N",b" ").replace(b":",b" ").split()[-1])
+        except:
+            if b"rs" in line:
                 try:
-                    self._setHotendTemperature(self._temperature_requested_extruder_index, float(re.search(b"T: *([0-9\.]*)", line).group(1)))
+                    return int(line.split()[1])
                 except:
                     pass
-                if b"B:" in line:  # Check if it's a bed temperature
-                    try:
-                        self._setBedTemperature(float(re.search(b"B: *([0-9\.]*)", line).group(1)))
-                    except Exception as e:
-                        pass
-                #TODO: temperature changed callback
-            elif b"_min" in line or b"_max" in line:
-                tag, value = line.split(b":", 1)
-                self._setEndstopState(tag,(b"H" in value or b"TRIGGERED" in value))
-
-            if self._is_printing:
-                if line == b"" and time.time() > ok_timeout:
-                    line = b"ok"  # Force a timeout (basically, send next command)
-
-                if b"ok" in line:
-                    ok_timeout = time.time() + 5
-                    if not self._command_queue.empty():
-                        self._sendCommand(self._command_queue.get())
-                    elif self._is_paused:
-                        line = b""  # Force getting temperature as keep alive
-                    else:
-                        self._sendNextGcodeLine()
-                elif b"resend" in line.lower() or b"rs" in line:  # Because a resend can be asked with "resend" and "rs"
-                    try:
-                        self._gcode_position = int(line.replace(b"N:",b" ").replace(b"N",b" ").replace(b":",b" ").split()[-1])
-                    except:
-                        if b"rs" in line:
-                            self._gcode_position = int(line.split()[1])
-
-            # Request the temperature on comm timeout (every 2 seconds) when we are not printing.)
-            if line == b"":
-                if self._num_extruders > 0:
-                    self._temperature_requested_extruder_index = (self._temperature_requested_extruder_index + 1) % self._num_extruders
-                    self.sendCommand("M105 T%d" % self._temperature_requested_extruder_index)
-                else:
-                    self.sendCommand("M105")
+        return None
+
+    ##  Reset the state of streaming mode for a new print.
+    #   \param max_lines The maximum number of commands in flight.
+    #   \param max_bytes The maximum number of bytes in flight.
+    def _startStreaming(self, max_lines, max_bytes):
+        with self._streaming_lock:
+            self._streaming_max_lines = max(max_lines, 1)
+            self._streaming_max_bytes = max(max_bytes, 1)
+            self._line_capacity = self._streaming_max_lines
+            self._in_flight.clear()
+            self._in_flight_bytes = 0
+            self._pending_command = None
+            self._sent_line_numbers.clear()
+            self._resend_line_number = None
+            self._resend_requested = False
+            self._streaming_start_time = time.time()
+            self._streaming_statistics = {"lines": 0, "bytes": 0, "underruns": 0, "resends": 0, "timeouts": 0}
+
+    ##  Send commands until the window of commands in flight is full.
+    #
+    #   Queued commands, like temperature requests, are sent before the lines
+    #   of the print. At least one command that is not stale is always allowed
+    #   in flight, also if it is larger than the window. The print is done
+    #   when all its lines are sent and answered.
+    #   Must be called with the streaming lock held.
+    def _fillStreamingWindow(self):
+        while self._is_printing:
+            if self._pending_command is None and not self._command_queue.empty() and not self._isUploadingToSD():
+                self._pending_command = (self._command_queue.get() + "\n").encode()
+
+            if self._pending_command is not None:
+                size = len(self._pending_command)
+            elif not self._is_paused and self._gcode_position < len(self._gcode):
+                size = self._gcode.getLineSize(self._gcode_position)
+            else:
+                if not self._in_flight and self._gcode_position >= len(self._gcode) and self._sd_state is None:
+                    self.setProgress(100)
+                return  # Nothing to send.
+
+            # Stale lines are rejected or lost, so they don't take the place of the lines that are resent. They are
+            # still counted, as they can be in the receive buffer of the printer.
+            has_fresh_commands = any(not stale for _, _, stale in self._in_flight)
+            if has_fresh_commands and (len(self._in_flight) >= self._line_capacity or self._in_flight_bytes + size > self._streaming_max_bytes):
+                return  # The window is full.
+
+            self._in_flight_bytes += size
+            self._streaming_statistics["bytes"] += size
+            if self._pending_command is not None:
+                self._in_flight.append([None, size, False])
+                self._sendBytes(self._pending_command)
+                self._pending_command = None
+            else:
+                self._in_flight.append([self._gcode_position, size, False])
+                self._sent_line_numbers.append(self._gcode_position)
+                self._streaming_statistics["lines"] += 1
+                self._sendNextGcodeLine()
+
+    ##  Handle an "ok" of the printer in streaming mode.
+    #
+    #   Every "ok" answers a command in flight, see _removeAnsweredCommand.
+    #   With advanced ok messages the firmware also reports how many commands
+    #   it can still buffer (as "B<free slots>"), which limits the window.
+    def _onStreamingOk(self, line):
+        with self._streaming_lock:
+            self._removeAnsweredCommand(self._resend_requested)
+            self._resend_requested = False
+
+            match = self.__free_buffer_regex.search(line)
+            if match:
+                self._line_capacity = max(1, min(self._streaming_max_lines, len(self._in_flight) + int(match.group(1))))
+
+            if not self._in_flight and not self._is_paused and self._gcode_position < len(self._gcode):
+                self._streaming_statistics["underruns"] += 1  # The printer has executed everything we sent it.
+            self._fillStreamingWindow()
+
+    ##  Remove the command in flight that an "ok" answers.
+    #
+    #   The printer answers the commands it accepts in the order they were
+    #   sent, once it has executed them. When it rejects a line, it flushes
+    #   its receive buffer and asks right away to resend the line it expects,
+    #   also if earlier commands are not executed yet. The lines in the flushed
+    #   buffer are lost without an answer. Every later line that was sent
+    #   before the resend request (which are stale) is rejected with another
+    #   request for the same line. So an "ok" after a resend request answers
+    #   the oldest stale line, and any other "ok" answers the oldest command
+    #   that is not stale. Stale lines before that command were lost, as they
+    #   would have been rejected before it was executed.
+    #   \param rejected Whether the "ok" follows a resend request.
+    def _removeAnsweredCommand(self, rejected):
+        if rejected:
+            for index, (_, size, stale) in enumerate(self._in_flight):
+                if stale:
+                    del self._in_flight[index]
+                    self._in_flight_bytes -= size
+                    return
+            return
 
-        Logger.log("i", "Printer connection listen thread stopped for %s" % self._serial_port)
+        while self._in_flight:
+            _, size, stale = self._in_flight.popleft()
+            self._in_flight_bytes -= size
+            if not stale:
+                return
+
+    ##  Handle a resend request of the printer in streaming mode.
+    #
+    #   The first request for a line rewinds the print to that line. The
+    #   lines in flight from that line on become stale: they are lost or
+    #   rejected, and the requests for the same line that answer the rejected
+    #   ones are no new requests. A request for the same line when no stale
+    #   lines are in flight is a new request, as the line was rejected again.
+    def _onStreamingResend(self, line):
+        line_number = self._getResendLineNumber(line)
+        if line_number is None:
+            return
+        with self._streaming_lock:
+            self._resend_requested = True
+            if line_number == self._resend_line_number and any(stale for _, _, stale in self._in_flight):
+                return  # The answer to a stale line.
+
+            if not self._sent_line_numbers or not self._sent_line_numbers[0] <= line_number <= self._gcode_position:
+                Logger.log("e", "Printer asked to resend line %d, which is not in the history of sent lines", line_number)
+                self._setErrorState("Printer asked to resend line %d, which can't be resent" % line_number)
+                return
+
+            Logger.log("d", "Resending from line %d", line_number)
+            self._streaming_statistics["resends"] += 1
+            self._resend_line_number = line_number
+            self._gcode_position = line_number
+            for command in self._in_flight:
+                if command[0] is not None and command[0] >= line_number:
+                    command[2] = True
+
+    ##  Handle a missing "ok" in streaming mode: assume the commands in flight
+    #   were lost and continue.
+    def _onStreamingTimeout(self):
+        with self._streaming_lock:
+            self._streaming_statistics["timeouts"] += 1
+            self._in_flight.clear()
+            self._in_flight_bytes = 0
+            self._resend_requested = False
+            self._fillStreamingWindow()
+
+    ##  The counters of streaming mode for the current or last print.
+    #
+    #   The keys are "lines" and "bytes" sent, "underruns" (the times the
+    #   printer had executed all commands that were sent), "resends" and
+    #   "timeouts", and the throughput in "lines_per_second" and
+    #   "bytes_per_second".
+    @pyqtProperty("QVariantMap", notify = PrinterOutputDevice.progressChanged)
+    def streamingStatistics(self):
+        statistics = dict(self._streaming_statistics)
+        if self._streaming_start_time is not None:
+            elapsed = max(time.time() - self._streaming_start_time, 1e-3)
+            statistics["lines_per_second"] = statistics["lines"] / elapsed
+            statistics["bytes_per_second"] = statistics["bytes"] / elapsed
+        return statistics
 
     ##  Send next Gcode in the gcode list
     def _sendNextGcodeLine(self):
@@ -464,35 +1021,29 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
             return
         if self._gcode_position == 100:
             self._print_start_time_100 = time.time()
-        line = self._gcode[self._gcode_position]
 
-        if ";" in line:
-            line = line[:line.find(";")]
-        line = line.strip()
-        try:
-            if line == "M0" or line == "M1":
-                line = "M105"  # Don't send the M0 or M1 to the machine, as M0 and M1 are handled as an LCD menu pause.
-            if ("G0" in line or "G1" in line) and "Z" in line:
-                z = float(re.search("Z([0-9\.]*)", line).group(1))
-                if self._current_z != z:
-                    self._current_z = z
-        except Exception as e:
-            Logger.log("e", "Unexpected error with printer connection: %s" % e)
-            self._setErrorState("Unexpected error: %s" %e)
-        checksum = functools.reduce(lambda x,y: x^y, map(ord, "N%d%s" % (self._gcode_position, line)))
-
-        self._sendCommand("N%d%s*%d" % (self._gcode_position, line, checksum))
+        # The lines are numbered, checksummed and encoded already, see GCodeLineStream.
+        self._sendBytes(self._gcode.getLine(self._gcode_position))
+        self._current_z = self._gcode.getZ(self._gcode_position)
         self._gcode_position += 1
-        self.setProgress((self._gcode_position / len(self._gcode)) * 100)
-        self.progressChanged.emit()
+        if self._sd_state == "uploading":
+            self._setSDUploadProgress(self._gcode.getProgress(self._gcode_position) * 100)
+        elif self._streaming and self._gcode_position >= len(self._gcode):
+            pass  # The print is done when the printer answered the last lines, see _fillStreamingWindow.
+        else:
+            self.setProgress(self._gcode.getProgress(self._gcode_position) * 100)
 
     ##  Set the state of the print.
     #   Sent from the print monitor
     def _setJobState(self, job_state):
         if job_state == "pause":
+            if self._sd_state == "printing":
+                self._sendCommand("M25")
             self._is_paused = True
             self._updateJobState("paused")
         elif job_state == "print":
+            if self._sd_state == "printing":
+                self._sendCommand("M24")
             self._is_paused = False
             self._updateJobState("printing")
         elif job_state == "abort":
@@ -503,6 +1054,9 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     def setProgress(self, progress, max_progress = 100):
         self._progress = (progress / max_progress) * 100  # Convert to scale of 0-100
         if self._progress == 100:
+            if self._streaming:
+                Logger.log("i", "Streamed the print with %s", self.streamingStatistics)
+                self._streaming_start_time = None
             # Printing is done, reset progress
             self._gcode_position = 0
             self.setProgress(0)
@@ -513,9 +1067,14 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
 
     ##  Cancel the current print. Printer connection wil continue to listen.
     def cancelPrint(self):
+        if self._isUploadingToSD():
+            self._sendCommand("M29")  # Close the file, otherwise the commands below are written to it.
+        elif self._sd_state == "printing":
+            self._sendCommand("M25")
+        self._sd_state = None
         self._gcode_position = 0
         self.setProgress(0)
-        self._gcode = []
+        self._gcode = GCodeLineStream()
 
         # Turn off temperatures, fan and steppers
         self._sendCommand("M140 S0")
@@ -548,6 +1107,11 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
     #   \return list of int
     def _getBaudrateList(self):
         ret = [115200, 250000, 230400, 57600, 38400, 19200, 9600]
+        # The baud rate that worked the last time is tried first.
+        remembered_baud_rate = self._getRememberedBaudRate()
+        if remembered_baud_rate in ret:
+            ret.remove(remembered_baud_rate)
+            ret.insert(0, remembered_baud_rate)
         return ret
 
     def _onFirmwareUpdateComplete(self):
@@ -556,3 +1120,17 @@ class USBPrinterOutputDevice(PrinterOutputDevice):
         self._update_firmware_thread.daemon = True
 
         self.connect()
+
+    # Seconds to probe a baud rate that is not the one that worked last time.
+    __short_probe_time = 2
+
+    # The number of sent lines of which a resend can be requested.
+    __resend_history_size = 1000
+
+    __free_buffer_regex = re.compile(b" B([0-9]+)")
+
+    # The file on the SD card to upload prints to. The firmware only handles 8.3 file names.
+    __sd_file_name = "cura.gco"
+    # Seconds between requests of the progress of a print from the SD card.
+    __sd_status_interval = 2
+    __sd_progress_regex = re.compile(b"SD printing byte ([0-9]+)/([0-9]+)")
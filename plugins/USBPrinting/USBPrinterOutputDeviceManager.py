@@ -3,6 +3,9 @@
 
 from UM.Signal import Signal, signalemitter
 from . import USBPrinterOutputDevice
+from .SerialEventLoop import SerialEventLoop
+from .SerialPortMonitor import SerialPortMonitor
+from .ReadFirmwareJob import ReadFirmwareJob
 from UM.Application import Application
 from UM.Resources import Resources
 from UM.Logger import Logger
@@ -11,6 +14,7 @@ from UM.OutputDevice.OutputDevicePlugin import OutputDevicePlugin
 from cura.PrinterOutputDevice import ConnectionState
 from UM.Qt.ListModel import ListModel
 from UM.Message import Message
+from UM.Preferences import Preferences
 
 from cura.CuraApplication import CuraApplication
 
@@ -40,17 +44,50 @@ class USBPrinterOutputDeviceManager(QObject, OutputDevicePlugin, Extension):
 
         self._check_updates = True
         self._firmware_view = None
+        self._firmware_devices = []  # The devices of which the firmware is being updated.
+        self._firmware_update_state = None  # "updating", "completed" or "failed", see firmwareUpdateState.
+        self._read_firmware_job = None
+        self._read_firmware_devices = []  # The devices to update once the firmware file is read.
+
+        # Streaming keeps several lines in flight instead of waiting for an "ok" for every line, see USBPrinterOutputDevice.
+        Preferences.getInstance().addPreference("usb_printing/streaming", False)
+        Preferences.getInstance().addPreference("usb_printing/streaming_lines", 4)  # The number of commands the firmware can buffer.
+        Preferences.getInstance().addPreference("usb_printing/streaming_bytes", 127)  # The size of the receive buffer of the firmware.
+        # Upload prints to the SD card of the printer and print from there, so the print doesn't depend on the host.
+        Preferences.getInstance().addPreference("usb_printing/sd_upload", False)
+        # Merge runs of short moves into fewer lines before sending them, see GCodePathCompressor.
+        Preferences.getInstance().addPreference("usb_printing/path_compression", False)
+        # Handle all printers in one event loop instead of threads per printer, for hosts with many printers.
+        Preferences.getInstance().addPreference("usb_printing/event_loop", False)
+        # The baud rate per port and per serial number that printers connected at last time, as JSON.
+        Preferences.getInstance().addPreference("usb_printing/baud_rates", "{}")
+        self._serial_event_loop = None
+
+        # Adds and removes devices as soon as ports appear or disappear, if possible. Otherwise the update thread lists
+        # the ports every few seconds.
+        self._port_monitor = SerialPortMonitor(lambda: self.getSerialPortList(only_list_usb = True), self._addRemovePorts)
 
         Application.getInstance().applicationShuttingDown.connect(self.stop)
         self.addUSBOutputDeviceSignal.connect(self.addOutputDevice) #Because the model needs to be created in the same thread as the QMLEngine, we use a signal.
+        self.removeUSBOutputDeviceSignal.connect(self._removeOutputDevice)
 
     addUSBOutputDeviceSignal = Signal()
+    removeUSBOutputDeviceSignal = Signal()
     connectionStateChanged = pyqtSignal()
 
     progressChanged = pyqtSignal()
 
+    firmwareUpdateStateChanged = pyqtSignal()
+
+    ##  The progress of the firmware update of all printers that are being
+    #   updated, or else the average progress of the prints.
     @pyqtProperty(float, notify = progressChanged)
     def progress(self):
+        if self._firmware_devices:
+            return sum(device.firmwareUpdateProgress for device in self._firmware_devices) / len(self._firmware_devices)
+        if not self._usb_output_devices:
+            return 0
+
         progress = 0
         for printer_name, device in self._usb_output_devices.items(): # TODO: @UnusedVariable "printer_name"
             progress += device.progress
@@ -58,15 +95,22 @@ class USBPrinterOutputDeviceManager(QObject, OutputDevicePlugin, Extension):
         return progress / len(self._usb_output_devices)
 
     def start(self):
+        if Preferences.getInstance().getValue("usb_printing/event_loop") and SerialEventLoop.isSupported():
+            self._serial_event_loop = SerialEventLoop()
+            self._serial_event_loop.start()
         self._check_updates = True
-        self._update_thread.start()
+        if not self._port_monitor.start():
+            self._update_thread.start()
 
     def stop(self):
         self._check_updates = False
+        self._port_monitor.stop()
         try:
             self._update_thread.join()
         except RuntimeError:
             pass
+        if self._serial_event_loop is not None:
+            self._serial_event_loop.stop()
 
     def _updateThread(self):
         while self._check_updates:
@@ -94,27 +138,95 @@ class USBPrinterOutputDeviceManager(QObject, OutputDevicePlugin, Extension):
             return
 
         self.spawnFirmwareInterface("")
-        for printer_connection in self._usb_output_devices:
-            try:
-                self._usb_output_devices[printer_connection].updateFirmware(Resources.getPath(CuraApplication.ResourceTypes.Firmware, self._getDefaultFirmwareName()))
-            except FileNotFoundError:
-                self._usb_output_devices[printer_connection].setProgress(100, 100)
-                Logger.log("w", "No firmware found for printer %s", printer_connection)
-                continue
+        if not self._updateFirmware(list(self._usb_output_devices.values())):
+            self._firmware_view.close()
 
     @pyqtSlot(str, result = bool)
     def updateFirmwareBySerial(self, serial_port):
         if serial_port in self._usb_output_devices:
             self.spawnFirmwareInterface(self._usb_output_devices[serial_port].getSerialPort())
-            try:
-                self._usb_output_devices[serial_port].updateFirmware(Resources.getPath(CuraApplication.ResourceTypes.Firmware, self._getDefaultFirmwareName()))
-            except FileNotFoundError:
+            if not self._updateFirmware([self._usb_output_devices[serial_port]]):
                 self._firmware_view.close()
-                Logger.log("e", "Could not find firmware required for this machine")
                 return False
             return True
         return False
 
+    ##  Update the firmware of printers, all at the same time.
+    #
+    #   The firmware file is read once for all printers, in the background.
+    #   Each printer is flashed in its own thread, and the progress of all of
+    #   them is shown as one.
+    #   \return False if there is no firmware for the machine.
+    def _updateFirmware(self, devices):
+        try:
+            file_name = Resources.getPath(CuraApplication.ResourceTypes.Firmware, self._getDefaultFirmwareName())
+        except FileNotFoundError:
+            Logger.log("e", "Could not find firmware required for this machine")
+            return False
+
+        self._setFirmwareUpdateState("updating")
+        self._read_firmware_devices = list(devices)
+        self._read_firmware_job = ReadFirmwareJob(file_name)
+        self._read_firmware_job.finished.connect(self._onFirmwareRead)
+        self._read_firmware_job.start()
+        return True
+
+    ##  Start updating the firmware of the printers when the firmware file is
+    #   read.
+    def _onFirmwareRead(self, job):
+        if job is not self._read_firmware_job:  # The update was started again in the meantime.
+            return
+        self._read_firmware_job = None
+        devices = self._read_firmware_devices
+        self._read_firmware_devices = []
+
+        hex_data = job.getResult()
+        if not hex_data:
+            self._setFirmwareUpdateState("failed")
+            return
+
+        self._setFirmwareDevices(devices)
+        for device in self._firmware_devices:
+            device.updateFirmware(job.getFileName(), hex_data)
+        self.progressChanged.emit()
+
+    ##  The state of the firmware update of all printers: "updating" until the
+    #   update of every printer is done, then "completed", or "failed" if the
+    #   update of any printer failed. None if no firmware was updated.
+    @pyqtProperty(str, notify = firmwareUpdateStateChanged)
+    def firmwareUpdateState(self):
+        return self._firmware_update_state if self._firmware_update_state is not None else ""
+
+    def _setFirmwareUpdateState(self, state):
+        if self._firmware_update_state != state:
+            self._firmware_update_state = state
+            self.firmwareUpdateStateChanged.emit()
+
+    ##  Follow the firmware update of devices, instead of the devices that were
+    #   followed before.
+    def _setFirmwareDevices(self, devices):
+        for device in self._firmware_devices:
+            device.firmwareUpdateProgressChanged.disconnect(self.progressChanged)
+            device.firmwareUpdateComplete.disconnect(self._onFirmwareUpdateFinished)
+            device.firmwareUpdateFailed.disconnect(self._onFirmwareUpdateFinished)
+        self._firmware_devices = list(devices)
+        for device in self._firmware_devices:
+            device.firmwareUpdateProgressChanged.connect(self.progressChanged)
+            device.firmwareUpdateComplete.connect(self._onFirmwareUpdateFinished)
+            device.firmwareUpdateFailed.connect(self._onFirmwareUpdateFinished)
+
+    ##  Called when the firmware update of a device completed or failed.
+    #
+    #   Once the updates of all devices are done, they are no longer followed,
+    #   so the progress is that of the prints again.
+    def _onFirmwareUpdateFinished(self):
+        states = [device.getFirmwareUpdateState() for device in self._firmware_devices]
+        if "updating" in states:
+            return
+        self._setFirmwareDevices([])
+        self._setFirmwareUpdateState("failed" if "failed" in states else "completed")
+        self.progressChanged.emit()
+
     ##  Return the singleton instance of the USBPrinterManager
     @classmethod
     def getInstance(cls, engine = None, script_engine = None):
@@ -177,7 +289,20 @@ class USBPrinterOutputDeviceManager(QObject, OutputDevicePlugin, Extension):
             raise FileNotFoundError()
 
     ##  Helper to identify serial ports (and scan for them)
-    def _addRemovePorts(self, serial_ports):
+    #   \param serial_ports The serial ports that are present.
+    #   \param reenumerated_ports The ports that were unplugged and plugged in
+    #   again since the last call. Their devices are replaced.
+    def _addRemovePorts(self, serial_ports, reenumerated_ports = ()):
+        for port in reenumerated_ports:
+            if port in self._usb_output_devices:
+                Logger.log("d", "Serial port %s was re-enumerated, creating a new device for it", port)
+                # The state change of the closed device may only be handled after it is deleted, so make sure it is
+                # removed from the output devices. This is queued before the new device is added.
+                self._usb_output_devices[port].close()
+                self.removeUSBOutputDeviceSignal.emit(port)  # Hack to ensure its removed in main thread
+                del self._usb_output_devices[port]
+        self._serial_port_list = [port for port in self._serial_port_list if port not in reenumerated_ports]
+
         # First, find and add all new or changed keys
         for serial_port in list(serial_ports):
             if serial_port not in self._serial_port_list:
@@ -196,12 +321,16 @@ class USBPrinterOutputDeviceManager(QObject, OutputDevicePlugin, Extension):
 
     ##  Because the model needs to be created in the same thread as the QMLEngine, we use a signal.
     def addOutputDevice(self, serial_port):
-        device = USBPrinterOutputDevice.USBPrinterOutputDevice(serial_port)
+        device = USBPrinterOutputDevice.USBPrinterOutputDevice(serial_port, event_loop = self._serial_event_loop)
         device.connectionStateChanged.connect(self._onConnectionStateChanged)
         device.connect()
         device.progressChanged.connect(self.progressChanged)
         self._usb_output_devices[serial_port] = device
 
+    ##  Remove the device of a port from the output devices, in the same thread as the QMLEngine.
+    def _removeOutputDevice(self, serial_port):
+        self.getOutputDeviceManager().removeOutputDevice(serial_port)
+
     ##  If one of the states of the connected devices change, we might need to add / remove them from the global list.
     def _onConnectionStateChanged(self, serial_port):
         try:
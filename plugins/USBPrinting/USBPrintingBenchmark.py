@@ -0,0 +1,228 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+##  Benchmark of printing over USB, against a VirtualPrinter.
+#
+#   Every benchmark starts a VirtualPrinter in its own process, connects a
+#   USBPrinterOutputDevice to it and prints g-code to it, like Cura does to a
+#   real printer. It measures:
+#
+#   - The lines per second that the printer received.
+#   - The CPU time of Cura per line, without the CPU time of the printer.
+#   - The underruns: the times the planner of the printer ran empty, so the
+#     print head would have stopped, and how long it was empty in total.
+#   - The resends and the time from a resend request of the printer until it
+#     got the line it asked for.
+#
+#   It runs from the root of the source tree, with Uranium on the Python path:
+#
+#       python3 plugins/USBPrinting/USBPrintingBenchmark.py --error-rate 0.001
+#
+#   By default all ways of printing (sending one line per "ok", streaming, and
+#   uploading to the SD card to print from there) are measured on generated
+#   g-code with the short moves of curved walls. Use --gcode to print a g-code
+#   file instead. For the SD card the lines per second are those of the
+#   upload, and the underruns those of the print from the card.
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # For the USBPrinting package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))  # For the cura package.
+
+from UM.Preferences import Preferences
+from cura.PrinterOutputDevice import ConnectionState
+from USBPrinting.GCodeLineStream import GCodeLineStream
+from USBPrinting.SerialEventLoop import SerialEventLoop
+from USBPrinting.USBPrinterOutputDevice import USBPrinterOutputDevice
+
+##  A VirtualPrinter in its own process, so its CPU time is not counted as
+#   the CPU time of Cura.
+class VirtualPrinterProcess:
+    ##  \param arguments The command line arguments of the printer, see
+    #   VirtualPrinter.main.
+    def __init__(self, arguments):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "VirtualPrinter.py")
+        self._process = subprocess.Popen([sys.executable, script] + arguments, stdin = subprocess.PIPE, stdout = subprocess.PIPE, universal_newlines = True)
+        self._port_name = self._process.stdout.readline().strip()
+
+    def getPortName(self):
+        return self._port_name
+
+    ##  The statistics of the printer, see VirtualPrinter.getStatistics.
+    def getStatistics(self):
+        self._process.stdin.write("statistics\n")
+        self._process.stdin.flush()
+        return json.loads(self._process.stdout.readline())
+
+    def stop(self):
+        self._process.stdin.close()
+        self._process.wait()
+
+##  Generate g-code with the mix of moves of a typical print.
+#
+#   Every layer has walls of round objects, which consist of many short moves,
+#   with retractions and travel moves between them, and infill of long moves.
+#   \param layers The number of layers.
+#   \param segments The number of moves of every wall.
+#   \return A list of g-code lines.
+def generateGCode(layers = 50, segments = 360):
+    lines = [";FLAVOR:RepRap", "M140 S60", "M104 S210", "M109 S210", "M190 S60", "G28", "G92 E0", "G1 F1500 E-6.5"]
+    extrusion = 0.0
+    for layer in range(layers):
+        lines.append(";LAYER:%d" % layer)
+        lines.append("G0 F7200 Z%.2f" % (0.3 + layer * 0.1))
+        if layer == 1:
+            lines.append("M106 S255")
+        for wall in range(3):
+            radius = 20.0 - wall * 0.4
+            lines.append(";TYPE:WALL-%s" % ("OUTER" if wall == 0 else "INNER"))
+            lines.append("G0 F7200 X%.3f Y%.3f" % (100 + radius, 100))
+            lines.append("G1 F1500 E%.5f" % extrusion)
+            for segment in range(1, segments + 1):
+                angle = 2 * math.pi * segment / segments
+                extrusion += 2 * math.pi * radius / segments * 0.033
+                lines.append("G1 F1800 X%.3f Y%.3f E%.5f" % (100 + radius * math.cos(angle), 100 + radius * math.sin(angle), extrusion))
+            lines.append("G1 F1500 E%.5f" % (extrusion - 6.5))
+        lines.append(";TYPE:FILL")
+        for row in range(40):
+            y = 81 + row
+            extrusion += 38 * 0.033
+            lines.append("G0 F7200 X81 Y%d" % y if row % 2 == 0 else "G0 F7200 X119 Y%d" % y)
+            lines.append("G1 F3000 X119 Y%d E%.5f" % (y, extrusion) if row % 2 == 0 else "G1 F3000 X81 Y%d E%.5f" % (y, extrusion))
+    lines.extend(["M107", "M104 S0", "M140 S0", "G28 X0 Y0", "M84"])
+    return lines
+
+##  Print g-code to a virtual printer and measure how well it was sent.
+#
+#   \param gcode_lines The g-code lines to print.
+#   \param mode "ping-pong" to send a line for every "ok", "streaming" or "sd"
+#   to upload to the SD card and print from there.
+#   \param event_loop Whether to connect in a SerialEventLoop instead of in
+#   threads of the device.
+#   \param printer_arguments The command line arguments of the printer.
+#   \param timeout The maximum time to connect and to print, in seconds.
+#   \return A dictionary with the results.
+def runBenchmark(gcode_lines, mode, event_loop, printer_arguments, timeout = 600):
+    Preferences.getInstance().setValue("usb_printing/streaming", mode == "streaming")
+    printer = VirtualPrinterProcess(printer_arguments)
+    serial_event_loop = None
+    if event_loop:
+        serial_event_loop = SerialEventLoop()
+        serial_event_loop.start()
+    device = USBPrinterOutputDevice(printer.getPortName(), serial_event_loop)
+    try:
+        device.connect()
+        end_time = time.time() + timeout
+        while device.connectionState != ConnectionState.connected:
+            if time.time() > end_time:
+                raise RuntimeError("Could not connect to the virtual printer on %s" % printer.getPortName())
+            time.sleep(0.05)
+        capabilities_time = time.time() + 2
+        while not device._firmware_capabilities and time.time() < capabilities_time:  # The path compression depends on them.
+            time.sleep(0.05)
+
+        upload_to_sd = mode == "sd"
+        gcode = GCodeLineStream(device._getPrintLines(gcode_lines, upload_to_sd))
+        start_statistics = printer.getStatistics()
+        start_time = time.time()
+        start_cpu_time = time.process_time()
+        end_time = start_time + timeout
+        elapsed_time = None
+        device._printGCodeStream(gcode, upload_to_sd)
+        while True:
+            statistics = printer.getStatistics()
+            if elapsed_time is None and (device.sdUploadProgress == 100 if upload_to_sd else statistics["last_line_number"] >= len(gcode) - 1):
+                elapsed_time = time.time() - start_time  # The printer has all lines.
+            if elapsed_time is not None and (not upload_to_sd or statistics["sd_prints_finished"] > start_statistics["sd_prints_finished"]):
+                break
+            if time.time() > end_time:
+                raise RuntimeError("The virtual printer did not receive the print in time")
+            time.sleep(0.05)
+        cpu_time = time.process_time() - start_cpu_time
+        statistics = printer.getStatistics()
+    finally:
+        device.close()
+        if serial_event_loop is not None:
+            serial_event_loop.stop()
+        printer.stop()
+
+    recovery_times = statistics["resend_recovery_times"]
+    return {
+        "lines": len(gcode),
+        "seconds": elapsed_time,
+        "lines_per_second": len(gcode) / elapsed_time,
+        "cpu_per_line": cpu_time / len(gcode),
+        "underruns": statistics["underruns"] - start_statistics["underruns"],
+        "starved_time": statistics["starved_time"] - start_statistics["starved_time"],
+        "dropped_bytes": statistics["dropped_bytes"] - start_statistics["dropped_bytes"],
+        "resends": statistics["resends"] - start_statistics["resends"],
+        "mean_resend_recovery_time": sum(recovery_times) / len(recovery_times) if recovery_times else 0.0,
+        "max_resend_recovery_time": max(recovery_times) if recovery_times else 0.0
+    }
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Benchmark printing over USB against a virtual printer.")
+    parser.add_argument("--gcode", help = "A g-code file to print, instead of generated g-code.")
+    parser.add_argument("--layers", type = int, default = 20, help = "The number of layers of the generated g-code.")
+    parser.add_argument("--mode", choices = ("ping-pong", "streaming", "sd", "all"), default = "all")
+    parser.add_argument("--event-loop", action = "store_true", help = "Connect in the serial event loop.")
+    parser.add_argument("--streaming-lines", type = int, default = 4)
+    parser.add_argument("--streaming-bytes", type = int, default = 127)
+    parser.add_argument("--planner-buffer-size", type = int, default = 16)
+    parser.add_argument("--move-time", type = float, default = 0.002, help = "Seconds the printer needs to execute one move.")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "Seconds to delay every answer of the printer.")
+    parser.add_argument("--error-rate", type = float, default = 0.0, help = "Part of the lines the printer rejects.")
+    parser.add_argument("--advanced-ok", action = "store_true")
+    parser.add_argument("--arcs", action = "store_true", help = "The printer supports G2 and G3 arcs.")
+    parser.add_argument("--flush-on-resend", action = "store_true", help = "The printer loses the received lines when it rejects a line.")
+    parser.add_argument("--path-compression", action = "store_true", help = "Merge runs of moves into fewer lines.")
+    parser.add_argument("--json", action = "store_true", help = "Write the results as JSON.")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.gcode:
+        with open(arguments.gcode, "rt") as f:
+            gcode_lines = f.read().split("\n")
+    else:
+        gcode_lines = generateGCode(arguments.layers)
+    printer_arguments = ["--planner-buffer-size", str(arguments.planner_buffer_size), "--move-time", str(arguments.move_time),
+                         "--latency", str(arguments.latency), "--error-rate", str(arguments.error_rate), "--seed", "0"]
+    if arguments.advanced_ok:
+        printer_arguments.append("--advanced-ok")
+    if arguments.arcs:
+        printer_arguments.append("--arcs")
+    if arguments.flush_on_resend:
+        printer_arguments.append("--flush-on-resend")
+
+    preferences = Preferences.getInstance()
+    preferences.addPreference("usb_printing/streaming", False)
+    preferences.addPreference("usb_printing/streaming_lines", 4)
+    preferences.addPreference("usb_printing/streaming_bytes", 127)
+    preferences.addPreference("usb_printing/sd_upload", False)
+    preferences.addPreference("usb_printing/path_compression", False)
+    preferences.addPreference("usb_printing/baud_rates", "{}")
+    preferences.setValue("usb_printing/streaming_lines", arguments.streaming_lines)
+    preferences.setValue("usb_printing/streaming_bytes", arguments.streaming_bytes)
+    preferences.setValue("usb_printing/path_compression", arguments.path_compression)
+
+    modes = ("ping-pong", "streaming", "sd") if arguments.mode == "all" else (arguments.mode, )
+    results = {}
+    for mode in modes:
+        results[mode] = runBenchmark(gcode_lines, mode, arguments.event_loop, printer_arguments)
+
+    if arguments.json:
+        print(json.dumps(results, indent = 4, sort_keys = True))
+        return
+    print("%-10s %8s %10s %12s %9s %10s %8s %14s" % ("mode", "lines", "lines/s", "CPU/line", "underruns", "starved", "resends", "recovery max"))
+    for mode in modes:
+        result = results[mode]
+        print("%-10s %8d %10.0f %10.1fus %9d %9.2fs %8d %12.1fms" % (mode, result["lines"], result["lines_per_second"], result["cpu_per_line"] * 1e6,
+                                                                      result["underruns"], result["starved_time"], result["resends"], result["max_resend_recovery_time"] * 1e3))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import argparse
+import collections
+import fcntl
+import functools
+import json
+import operator
+import os
+import random
+import re
+import select
+import sys
+import threading
+import time
+import tty
+
+##  A simulated Marlin printer on a pseudo-terminal, to test and benchmark USB
+#   printing without hardware.
+#
+#   The printer opens a pseudo-terminal and behaves like Marlin on the other
+#   end of it, so a USBPrinterOutputDevice can connect to getPortName() like
+#   to a real serial port. It emulates the parts of the firmware that matter
+#   for sending g-code:
+#
+#   - The receive buffer of the serial port. Bytes that don't fit in it are
+#     lost, like they are on a real board.
+#   - The command buffer. Lines are taken from the receive buffer as long as
+#     there is room in it, and their line numbers and checksums are checked.
+#     A bad line is answered with "Error:", "Resend:" and "ok". Like Marlin,
+#     every later numbered line is answered the same way until the line that
+#     was asked for arrives. Optionally the receive buffer is flushed too, so
+#     the lines in it are lost without an answer.
+#   - The planner buffer. A move is answered with "ok" when it is added to the
+#     planner, which waits when the planner is full. Every move takes a fixed
+#     time to execute.
+#   - Temperatures. M105 is answered with "ok T:... B:...", and the heaters
+#     reach their target immediately.
+#   - An SD card. Files are written with M28 and M29 and printed with M23 and
+#     M24, feeding the command buffer from the file. M27 reports the progress.
+#   - Capabilities. M115 reports the firmware and whether it supports arcs.
+#     Without arc support G2 and G3 are unknown commands.
+#
+#   Answers can be delayed, to simulate the latency of the USB connection,
+#   and a part of the lines can be rejected as if they were corrupted.
+#
+#   Next to the emulation the printer counts how well it was fed: how often
+#   the planner ran empty (an underrun, the print head stops) and how long it
+#   took to get the line that was asked to resend, see getStatistics().
+#
+#   The pseudo-terminal only exists on Unix.
+class VirtualPrinter:
+    ##  \param planner_buffer_size The number of moves the planner can buffer.
+    #   \param move_time The time to execute one move, in seconds.
+    #   \param latency The delay of every answer, in seconds.
+    #   \param command_buffer_size The number of commands the firmware can
+    #   buffer before executing them.
+    #   \param receive_buffer_size The size of the receive buffer of the
+    #   serial port, in bytes.
+    #   \param error_rate The part of the numbered lines to reject as if their
+    #   checksum is wrong, from 0 to 1.
+    #   \param advanced_ok Whether to report the free buffer space with every
+    #   "ok", like Marlin with ADVANCED_OK.
+    #   \param seed The seed of the random rejection of lines.
+    #   \param arcs Whether G2 and G3 arcs are supported. An arc is one move.
+    #   \param flush_on_resend Whether to flush the receive buffer when a line
+    #   is rejected. Marlin does, but on a real board the buffer holds only the
+    #   bytes that arrived until then, while here it holds all bytes that were
+    #   sent.
+    def __init__(self, planner_buffer_size = 16, move_time = 0.002, latency = 0.0, command_buffer_size = 4, receive_buffer_size = 128, error_rate = 0.0, advanced_ok = False, seed = None, arcs = False,
+                 flush_on_resend = False):
+        self._planner_buffer_size = planner_buffer_size
+        self._move_time = move_time
+        self._latency = latency
+        self._command_buffer_size = command_buffer_size
+        self._receive_buffer_size = receive_buffer_size
+        self._error_rate = error_rate
+        self._advanced_ok = advanced_ok
+        self._random = random.Random(seed)
+        self._arcs = arcs
+        self._flush_on_resend = flush_on_resend
+
+        self._master_file_descriptor = None
+        self._slave_file_descriptor = None
+        self._wake_read, self._wake_write = None, None
+        self._thread = None
+        self._running = False
+
+        self._receive_buffer = b""
+        self._commands = collections.deque()  # The commands, and whether they were read from the SD card.
+        self._planner = collections.deque()  # The time at which every move in the planner is executed.
+        self._last_move_end_time = 0
+        self._replies = collections.deque()  # The answers that are delayed by the latency, with the time to send them.
+        self._write_buffer = b""
+        self._last_line_number = 0
+        self._resend_line_number = None  # The line that was asked to resend, and since when.
+        self._resend_time = 0
+        self._hotend_temperature = 20.0
+        self._hotend_target = 0.0
+        self._bed_temperature = 20.0
+        self._bed_target = 0.0
+        self._sd_files = {}  # The lines of every file on the SD card.
+        self._sd_writing_file = None  # The name and the lines of the file that is being written.
+        self._sd_selected_file = None
+        self._sd_file_size = 0
+        self._sd_position = 0  # The line and the byte in the selected file to read next.
+        self._sd_byte_position = 0
+        self._sd_printing = False
+
+        self._statistics_lock = threading.Lock()
+        self._statistics = {"lines": 0, "commands": 0, "moves": 0, "underruns": 0, "starved_time": 0.0, "resends": 0, "dropped_bytes": 0, "resend_recovery_times": [],
+                            "sd_lines_written": 0, "sd_prints_finished": 0}
+
+    ##  Open the pseudo-terminal and start the thread of the printer.
+    def start(self):
+        if self._thread is not None:
+            return
+        self._master_file_descriptor, self._slave_file_descriptor = os.openpty()
+        # Keep the slave side open, so the master side keeps working while a connection closes and opens the port.
+        tty.setraw(self._slave_file_descriptor)
+        flags = fcntl.fcntl(self._master_file_descriptor, fcntl.F_GETFL)
+        fcntl.fcntl(self._master_file_descriptor, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self._wake_read, self._wake_write = os.pipe()
+        self._running = True
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    ##  Stop the printer and close the pseudo-terminal.
+    def stop(self):
+        if self._thread is None:
+            return
+        self._running = False
+        os.write(self._wake_write, b"x")
+        self._thread.join()
+        self._thread = None
+        for file_descriptor in (self._master_file_descriptor, self._slave_file_descriptor, self._wake_read, self._wake_write):
+            os.close(file_descriptor)
+        self._master_file_descriptor = None
+        self._slave_file_descriptor = None
+
+    ##  The serial port to connect to, like "/dev/pts/3".
+    def getPortName(self):
+        return os.ttyname(self._slave_file_descriptor)
+
+    ##  The counters of the printer.
+    #
+    #   The keys are "lines" (numbered lines accepted), "last_line_number",
+    #   "commands" and "moves" executed, "underruns" (the times the planner ran
+    #   empty between two moves) and "starved_time" (the total time it was
+    #   empty), "resends" (the resend requests), "dropped_bytes" (the bytes
+    #   that didn't fit in the receive buffer), the time from a resend request
+    #   until the line arrived, as a list of "resend_recovery_times" in
+    #   seconds, and the "sd_lines_written" to files and "sd_prints_finished".
+    def getStatistics(self):
+        with self._statistics_lock:
+            statistics = dict(self._statistics)
+            statistics["resend_recovery_times"] = list(statistics["resend_recovery_times"])
+            statistics["last_line_number"] = self._last_line_number
+        return statistics
+
+    def _run(self):
+        while self._running:
+            now = time.monotonic()
+            while self._planner and self._planner[0] <= now:
+                self._planner.popleft()
+            self._processCommands(now)
+            while self._replies and self._replies[0][0] <= now:
+                self._write_buffer += self._replies.popleft()[1]
+            if self._write_buffer:
+                self._writeReplies()
+
+            timeout = None
+            if self._replies:
+                timeout = self._replies[0][0] - now
+            if self._commands and self._planner:  # The next command may be waiting for the planner.
+                timeout = self._planner[0] - now if timeout is None else min(timeout, self._planner[0] - now)
+            if timeout is not None:
+                timeout = max(timeout, 0)
+            writers = [self._master_file_descriptor] if self._write_buffer else []
+            readable, _, _ = select.select([self._master_file_descriptor, self._wake_read], writers, [], timeout)
+            if self._wake_read in readable:
+                break
+            if self._master_file_descriptor in readable:
+                self._receive(time.monotonic())
+
+    def _receive(self, now):
+        try:
+            data = os.read(self._master_file_descriptor, 4096)
+        except OSError:
+            return
+        self._receive_buffer += data
+        self._readCommands(now)
+        if len(self._receive_buffer) > self._receive_buffer_size:
+            with self._statistics_lock:
+                self._statistics["dropped_bytes"] += len(self._receive_buffer) - self._receive_buffer_size
+            self._receive_buffer = self._receive_buffer[:self._receive_buffer_size]
+
+    def _writeReplies(self):
+        try:
+            written = os.write(self._master_file_descriptor, self._write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        self._write_buffer = self._write_buffer[written:]
+
+    ##  Move lines from the receive buffer to the command buffer while there
+    #   is room, checking their line numbers and checksums. When printing from
+    #   the SD card the rest of the room is filled from the file.
+    def _readCommands(self, now):
+        while len(self._commands) < self._command_buffer_size and b"\n" in self._receive_buffer:
+            line, self._receive_buffer = self._receive_buffer.split(b"\n", 1)
+            line = line.strip()
+            if line:
+                self._acceptLine(line, now)
+
+        while self._sd_printing and len(self._commands) < self._command_buffer_size:
+            lines = self._sd_files[self._sd_selected_file]
+            if self._sd_position >= len(lines):
+                self._sd_printing = False
+                with self._statistics_lock:
+                    self._statistics["sd_prints_finished"] += 1
+                self._reply("Done printing file\n", now)
+                return
+            line = lines[self._sd_position]
+            self._sd_position += 1
+            self._sd_byte_position += len(line) + 1
+            self._commands.append((line, True))
+
+    def _acceptLine(self, line, now):
+        if line.startswith(b"N"):
+            match = self.__line_number_regex.match(line)
+            if match is None or b"*" not in line:
+                self._requestResend("No Checksum with line number", now)
+                return
+            line_number = int(match.group(1))
+            body, _, checksum = line.rpartition(b"*")
+            if line_number != self._last_line_number + 1 and b"M110" not in body:
+                self._requestResend("Line Number is not Last Line Number+1", now)
+                return
+            if checksum.strip() != str(functools.reduce(operator.xor, body, 0)).encode() or (self._error_rate and self._random.random() < self._error_rate):
+                self._requestResend("checksum mismatch", now)
+                return
+
+            self._last_line_number = line_number
+            with self._statistics_lock:
+                self._statistics["lines"] += 1
+                if line_number == self._resend_line_number:
+                    self._statistics["resend_recovery_times"].append(now - self._resend_time)
+                    self._resend_line_number = None
+            line = body[match.end():].strip()
+        elif b"*" in line:
+            self._requestResend("No Line Number with checksum", now)
+            return
+        self._commands.append((line, False))
+
+    ##  Reject a line and ask for the line after the last accepted line.
+    def _requestResend(self, message, now):
+        if self._flush_on_resend:
+            self._receive_buffer = b""
+        line_number = self._last_line_number + 1
+        with self._statistics_lock:
+            self._statistics["resends"] += 1
+        if line_number != self._resend_line_number:
+            self._resend_line_number = line_number
+            self._resend_time = now
+        self._reply("Error:%s, Last Line: %d\nResend: %d\nok\n" % (message, self._last_line_number, line_number), now)
+
+    ##  Execute the commands in the command buffer, until the buffer is empty
+    #   or a command has to wait for the planner.
+    def _processCommands(self, now):
+        while True:
+            self._readCommands(now)
+            if not self._commands:
+                return
+            command, from_sd = self._commands[0]
+            match = self.__code_regex.match(command)
+            code = match.group(1).upper() + match.group(2) if match else b""
+            code = code.replace(b"G00", b"G0").replace(b"G01", b"G1")
+            if self._sd_writing_file is not None and not from_sd:
+                self._commands.popleft()
+                self._reply(self._writeToFile(code, command), now)
+                continue
+            if not self._arcs and (code == b"G2" or code == b"G3"):
+                code = b""  # An unknown command.
+            if code in self.__move_codes:
+                if len(self._planner) >= self._planner_buffer_size:
+                    return  # Wait until a move is executed.
+                self._planMove(now)
+            elif code == b"M400" and self._planner:
+                return  # Wait until all moves are executed.
+            self._commands.popleft()
+            with self._statistics_lock:
+                self._statistics["commands"] += 1
+            reply = self._executeCommand(code, command)
+            if not from_sd:  # Commands from the SD card are not answered.
+                self._reply(reply, now)
+
+    def _planMove(self, now):
+        with self._statistics_lock:
+            if not self._planner and self._statistics["moves"] > 0 and now > self._last_move_end_time:
+                self._statistics["underruns"] += 1
+                self._statistics["starved_time"] += now - self._last_move_end_time
+            self._statistics["moves"] += 1
+        self._last_move_end_time = max(now, self._last_move_end_time) + self._move_time
+        self._planner.append(self._last_move_end_time)
+
+    ##  Execute a command that is not a move.
+    #   \return The answer to the command.
+    def _executeCommand(self, code, command):
+        if code in (b"M104", b"M109"):
+            self._hotend_target = self._hotend_temperature = self._getParameter(command, b"S", self._hotend_target)
+        elif code in (b"M140", b"M190"):
+            self._bed_target = self._bed_temperature = self._getParameter(command, b"S", self._bed_target)
+        elif code == b"M105":
+            return "ok T:%.1f /%.1f B:%.1f /%.1f @:0 B@:0\n" % (self._hotend_temperature, self._hotend_target, self._bed_temperature, self._bed_target)
+        elif code == b"M115":
+            return "FIRMWARE_NAME:Marlin VirtualPrinter PROTOCOL_VERSION:1.0 MACHINE_TYPE:Virtual EXTRUDER_COUNT:1\nCap:ARCS:%d\nok\n" % self._arcs
+        elif code == b"M28":
+            self._sd_writing_file = (self._getFileName(command), [])
+            return "Writing to file: %s\nok\n" % self._sd_writing_file[0]
+        elif code == b"M23":
+            file_name = self._getFileName(command)
+            if file_name not in self._sd_files:
+                return "open failed, File: %s.\nok\n" % file_name
+            self._sd_selected_file = file_name
+            self._sd_file_size = sum(len(line) + 1 for line in self._sd_files[file_name])
+            self._sd_position = self._sd_byte_position = 0
+            self._sd_printing = False
+            return "File opened: %s Size: %d\nFile selected\nok\n" % (file_name, self._sd_file_size)
+        elif code == b"M24":
+            self._sd_printing = self._sd_selected_file is not None
+        elif code == b"M25":
+            self._sd_printing = False
+        elif code == b"M27":
+            if self._sd_printing:
+                return "SD printing byte %d/%d\nok\n" % (self._sd_byte_position, self._sd_file_size)
+            return "Not SD printing\nok\n"
+        elif not code:
+            return "echo:Unknown command: \"%s\"\nok\n" % command.decode("utf-8", "replace")
+        return self._getOk()
+
+    ##  Write a command to the file on the SD card that is being written, or
+    #   close the file.
+    #   \return The answer to the command.
+    def _writeToFile(self, code, command):
+        if code == b"M29":
+            self._sd_files[self._sd_writing_file[0]] = self._sd_writing_file[1]
+            self._sd_writing_file = None
+            return "Done saving file.\n"  # Marlin doesn't answer M29 with "ok".
+        self._sd_writing_file[1].append(command)
+        with self._statistics_lock:
+            self._statistics["sd_lines_written"] += 1
+        return self._getOk()
+
+    def _getOk(self):
+        if self._advanced_ok:
+            return "ok N%d P%d B%d\n" % (self._last_line_number, self._planner_buffer_size - len(self._planner), self._command_buffer_size - len(self._commands))
+        return "ok\n"
+
+    def _getFileName(self, command):
+        parts = command[self.__code_regex.match(command).end():].split()
+        return parts[0].decode("utf-8", "replace").lower() if parts else ""
+
+    def _getParameter(self, command, letter, default):
+        match = re.search(letter + b"(-?[0-9.]+)", command)
+        try:
+            return float(match.group(1))
+        except (AttributeError, ValueError):
+            return default
+
+    def _reply(self, text, now):
+        self._replies.append((now + self._latency, text.encode()))
+
+    __line_number_regex = re.compile(b"N(-?[0-9]+)")
+    __code_regex = re.compile(b"([GMTgmt])([0-9]+)")
+    __move_codes = (b"G0", b"G1", b"G2", b"G3", b"G28")
+
+
+##  Run a virtual printer until the standard input is closed.
+#
+#   The port name is written to the standard output when the printer is
+#   started. Every line "statistics" on the standard input is answered with
+#   the statistics of the printer, as JSON. This way the printer can run in
+#   its own process, apart from what is being benchmarked.
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Simulate a Marlin printer on a pseudo-terminal.")
+    parser.add_argument("--planner-buffer-size", type = int, default = 16)
+    parser.add_argument("--move-time", type = float, default = 0.002, help = "Seconds to execute one move.")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "Seconds to delay every answer.")
+    parser.add_argument("--command-buffer-size", type = int, default = 4)
+    parser.add_argument("--receive-buffer-size", type = int, default = 128)
+    parser.add_argument("--error-rate", type = float, default = 0.0, help = "Part of the lines to reject.")
+    parser.add_argument("--advanced-ok", action = "store_true")
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--arcs", action = "store_true", help = "Support G2 and G3 arcs.")
+    parser.add_argument("--flush-on-resend", action = "store_true", help = "Lose the received lines when a line is rejected.")
+    arguments = parser.parse_args(arguments)
+
+    printer = VirtualPrinter(arguments.planner_buffer_size, arguments.move_time, arguments.latency, arguments.command_buffer_size,
+                             arguments.receive_buffer_size, arguments.error_rate, arguments.advanced_ok, arguments.seed, arguments.arcs,
+                             arguments.flush_on_resend)
+    printer.start()
+    print(printer.getPortName(), flush = True)
+    for line in sys.stdin:
+        if line.strip() == "statistics":
+            print(json.dumps(printer.getStatistics()), flush = True)
+    printer.stop()
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ STK500v2 protocol implementation for programming AVR chips.
 The STK500v2 protocol is used by the ArduinoMega2560 and a few other Arduino platforms to load firmware.
 This is a python 3 conversion of the code created by David Braam for the Cura project.
 """
+import functools
+import operator
 import os
 import struct
 import sys
@@ -90,8 +92,10 @@ class Stk500v2(ispBase.IspBase):
         else:
             self.sendMessage([0x06, 0x00, 0x00, 0x00, 0x00])
         load_count = (len(flash_data) + page_size - 1) / page_size   
+        flash_data = memoryview(bytes(flash_data))
+        page_header = bytes([0x13, page_size >> 8, page_size & 0xFF, 0xc1, 0x0a, 0x40, 0x4c, 0x20, 0x00, 0x00])
         for i in range(0, int(load_count)):
-            recv = self.sendMessage([0x13, page_size >> 8, page_size & 0xFF, 0xc1, 0x0a, 0x40, 0x4c, 0x20, 0x00, 0x00] + flash_data[(i * page_size):(i * page_size + page_size)])
+            recv = self.sendMessage(page_header + flash_data[(i * page_size):(i * page_size + page_size)])
             if self.progress_callback is not None:
                 if self._has_checksum:
                     self.progress_callback(i + 1, load_count)
@@ -103,10 +107,7 @@ class Stk500v2(ispBase.IspBase):
             self.sendMessage([0x06, 0x00, (len(flash_data) >> 17) & 0xFF, (len(flash_data) >> 9) & 0xFF, (len(flash_data) >> 1) & 0xFF])
             res = self.sendMessage([0xEE])
             checksum_recv = res[2] | (res[3] << 8)
-            checksum = 0
-            for d in flash_data:
-                checksum += d
-            checksum &= 0xFFFF
+            checksum = sum(bytes(flash_data)) & 0xFFFF
             if hex(checksum) != hex(checksum_recv):
                 raise ispBase.IspError("Verify checksum mismatch: 0x%x != 0x%x" % (checksum & 0xFFFF, checksum_recv))
         else:
@@ -118,21 +119,21 @@ class Stk500v2(ispBase.IspBase):
                 self.sendMessage([0x06, 0x00, 0x00, 0x00, 0x00])
 
             load_count = (len(flash_data) + 0xFF) / 0x100
+            flash_data = bytes(flash_data)
             for i in range(0, int(load_count)):
-                recv = self.sendMessage([0x14, 0x01, 0x00, 0x20])[2:0x102]
+                recv = bytes(self.sendMessage([0x14, 0x01, 0x00, 0x20])[2:0x102])
                 if self.progress_callback is not None:
                     self.progress_callback(load_count + i + 1, load_count*2)
-                for j in range(0, 0x100):
-                    if i * 0x100 + j < len(flash_data) and flash_data[i * 0x100 + j] != recv[j]:
-                        raise ispBase.IspError("Verify error at: 0x%x" % (i * 0x100 + j))
+                expected = flash_data[i * 0x100:(i + 1) * 0x100]
+                if recv[:len(expected)] != expected:
+                    # Find the first byte that differs, for the error message.
+                    for j in range(0, len(expected)):
+                        if j >= len(recv) or expected[j] != recv[j]:
+                            raise ispBase.IspError("Verify error at: 0x%x" % (i * 0x100 + j))
 
     def sendMessage(self, data):
-        message = struct.pack(">BBHB", 0x1B, self.seq, len(data), 0x0E)
-        for c in data:
-            message += struct.pack(">B", c)
-        checksum = 0
-        for c in message:
-            checksum ^= c
+        message = struct.pack(">BBHB", 0x1B, self.seq, len(data), 0x0E) + bytes(data)
+        checksum = functools.reduce(operator.xor, message, 0)
         message += struct.pack(">B", checksum)
         try:
             self.serial.write(message)
@@ -143,42 +144,27 @@ class Stk500v2(ispBase.IspBase):
         return self.recvMessage()
     
     def recvMessage(self):
-        state = "Start"
-        checksum = 0
+        # Wait for the start of a message, then read the header, body and checksum each in one read.
         while True:
             s = self.serial.read()
             if len(s) < 1:
                 raise ispBase.IspError("Timeout")
-            b = struct.unpack(">B", s)[0]
-            checksum ^= b
-            #print(hex(b))
-            if state == "Start":
-                if b == 0x1B:
-                    state = "GetSeq"
-                    checksum = 0x1B
-            elif state == "GetSeq":
-                state = "MsgSize1"
-            elif state == "MsgSize1":
-                msg_size = b << 8
-                state = "MsgSize2"
-            elif state == "MsgSize2":
-                msg_size |= b
-                state = "Token"
-            elif state == "Token":
-                if b != 0x0E:
-                    state = "Start"
-                else:
-                    state = "Data"
-                    data = []
-            elif state == "Data":
-                data.append(b)
-                if len(data) == msg_size:
-                    state = "Checksum"
-            elif state == "Checksum":
-                if checksum != 0:
-                    state = "Start"
-                else:
-                    return data
+            if s[0] != 0x1B:
+                continue
+            header = self._readExactly(4)  # Sequence number, message size and token.
+            if header[3] != 0x0E:
+                continue
+            msg_size = (header[1] << 8) | header[2]
+            body = self._readExactly(msg_size + 1)  # The data and the checksum.
+            if functools.reduce(operator.xor, body, 0x1B ^ functools.reduce(operator.xor, header, 0)) != 0:
+                continue
+            return list(body[:-1])
+
+    def _readExactly(self, size):
+        data = self.serial.read(size)
+        if len(data) < size:
+            raise ispBase.IspError("Timeout")
+        return data
 
 def portList():
     ret = []
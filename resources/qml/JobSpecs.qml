@@ -26,6 +26,8 @@ Rectangle {
     property variant printDuration: PrintInformation.currentPrintTime
     property variant printMaterialLengths: PrintInformation.materialLengths
     property variant printMaterialWeights: PrintInformation.materialWeights
+    // A quick estimate is shown while slicing, marked with a tilde.
+    property string printEstimatePrefix: PrintInformation.estimateProvisional ? "~" : ""
 
     height: childrenRect.height
     color: "transparent"
@@ -173,7 +175,7 @@ Rectangle {
                 anchors.verticalCenter: parent.verticalCenter
                 font: UM.Theme.getFont("small")
                 color: UM.Theme.getColor("text_subtext")
-                text: (!base.printDuration || !base.printDuration.valid) ? catalog.i18nc("@label", "00h 00min") : base.printDuration.getDisplayString(UM.DurationFormat.Short)
+                text: (!base.printDuration || !base.printDuration.valid) ? catalog.i18nc("@label", "00h 00min") : base.printEstimatePrefix + base.printDuration.getDisplayString(UM.DurationFormat.Short)
             }
             UM.RecolorImage {
                 id: lengthIcon
@@ -209,7 +211,7 @@ Rectangle {
                         lengths = ["0.00"];
                         weights = ["0"];
                     }
-                    return catalog.i18nc("@label", "%1 m / %2 g").arg(lengths.join(" + ")).arg(weights.join(" + "));
+                    return base.printEstimatePrefix + catalog.i18nc("@label", "%1 m / %2 g").arg(lengths.join(" + ")).arg(weights.join(" + "));
                 }
             }
         }
@@ -211,6 +211,11 @@ Rectangle {
                     onObjectAdded: devicesMenu.insertItem(index, object)
                     onObjectRemoved: devicesMenu.removeItem(object)
                 }
+                MenuSeparator { }
+                MenuItem {
+                    text: catalog.i18nc("@action:inmenu", "Save to All Devices")
+                    onTriggered: Printer.requestWriteToAllDevices(PrintInformation.jobName)
+                }
                 ExclusiveGroup { id: devicesMenuGroup; }
             }
         }
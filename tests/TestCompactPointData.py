@@ -0,0 +1,60 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+
+from cura.CompactPointData import CompactPointData
+
+def createPoints(xz, heights):
+    points = numpy.empty((len(xz), 3), dtype = numpy.float32)
+    points[:, [0, 2]] = numpy.array(xz, dtype = numpy.float64) / 1000  # From microns, like the engine sends them.
+    points[:, 1] = heights
+    return points
+
+def test_roundTripSmallSteps():
+    points = createPoints([[10000, -20000], [10400, -20000], [10400, -19600], [-20000, 12000]], 0.3)
+
+    data = CompactPointData.encode(points)
+
+    assert data is not None
+    assert data._is_delta
+    assert len(data) == len(points)
+    assert numpy.array_equal(data.decode(), points)
+    assert data.nbytes < points.nbytes
+
+def test_roundTripLargeSteps():
+    # A step of more than 32.767 mm doesn't fit in an int16.
+    points = createPoints([[0, 0], [200000, 0], [200000, 200000]], 0.3)
+
+    data = CompactPointData.encode(points)
+
+    assert data is not None
+    assert not data._is_delta
+    assert len(data) == len(points)
+    assert numpy.array_equal(data.decode(), points)
+
+def test_roundTripSpiralized():
+    points = createPoints([[0, 0], [1000, 0], [1000, 1000]], [0.3, 0.35, 0.4])
+
+    data = CompactPointData.encode(points)
+
+    assert data is not None
+    assert numpy.array_equal(data.decode(), points)
+
+def test_roundTripSinglePoint():
+    points = createPoints([[5000, 5000]], 0.2)
+
+    data = CompactPointData.encode(points)
+
+    assert data is not None
+    assert len(data) == 1
+    assert numpy.array_equal(data.decode(), points)
+
+def test_notEncodedWithLoss():
+    # Not on the micron grid of the engine, so it can not be stored as microns.
+    points = numpy.array([[0.0, 0.3, 0.0], [1.0001234, 0.3, 0.0]], dtype = numpy.float32)
+
+    assert CompactPointData.encode(points) is None
+
+def test_notEncodedEmpty():
+    assert CompactPointData.encode(numpy.empty((0, 3), dtype = numpy.float32)) is None
@@ -0,0 +1,58 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import functools
+
+from USBPrinting.GCodeLineStream import GCodeLineStream
+
+##  The line as the firmware expects it, computed one byte at a time.
+def encodeLine(number, line):
+    numbered_line = "N%d%s" % (number, line)
+    checksum = functools.reduce(lambda checksum, character: checksum ^ ord(character), numbered_line, 0)
+    return ("%s*%d\n" % (numbered_line, checksum)).encode()
+
+def test_linesAndChecksums():
+    stream = GCodeLineStream(["G28 ; Home\n", "", "  ;Only a comment\n", "G1 X10 Y20 E1.5\n", "M0\n"])
+
+    assert len(stream) == 3
+    assert stream.getLine(0) == encodeLine(0, "G28")
+    assert stream.getLine(1) == encodeLine(1, "G1 X10 Y20 E1.5")
+    assert stream.getLine(2) == encodeLine(2, "M105")  # A pause on the LCD is not sent.
+
+def test_offsets():
+    lines = ["G1 X%d Y%d" % (index, index * 7) for index in range(200)]
+    stream = GCodeLineStream(lines)
+
+    encoded = [encodeLine(number, line) for number, line in enumerate(lines)]
+    total_size = sum(map(len, encoded))
+    sent_size = 0
+    for index, line in enumerate(encoded):
+        assert stream.getLineSize(index) == len(line)
+        assert stream.getLine(index) == line
+        assert stream.getProgress(index) == sent_size / total_size
+        sent_size += len(line)
+    assert stream.getProgress(len(lines)) == 1.0
+
+def test_offsetsOverChunks(monkeypatch):
+    monkeypatch.setattr(GCodeLineStream, "_GCodeLineStream__chunk_size", 3)
+    lines = ["G1 X%d" % index for index in range(10)]
+
+    stream = GCodeLineStream(lines)
+
+    assert len(stream) == 10
+    for number, line in enumerate(lines):
+        assert stream.getLine(number) == encodeLine(number, line)
+
+def test_heights():
+    stream = GCodeLineStream(["G28", "G0 Z0.3", "G1 X10 E1", "G0 Z0.5 X5", "G1 X20 E2"])
+
+    assert stream.getZ(0) == 0.0
+    assert stream.getZ(1) == 0.3
+    assert stream.getZ(2) == 0.3
+    assert stream.getZ(4) == 0.5
+
+def test_empty():
+    stream = GCodeLineStream([";Only comments", ""])
+
+    assert len(stream) == 0
+    assert stream.getProgress(0) == 1.0
@@ -0,0 +1,128 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import gzip
+import numpy
+import pytest
+
+from cura.LayerPolygon import LayerPolygon
+from GCodeReader.GCodeParser import GCodeParser
+
+gcode = """;FLAVOR:RepRap
+G28
+G1 Z15.0 F1200
+G92 E0
+;LAYER:0
+G0 F6000 X10 Y10 Z0.3
+;TYPE:WALL-OUTER
+G1 F1200 X20 Y10 E1
+G1 X20 Y20 E2
+G10
+G0 X30 Y30
+G11
+;TYPE:FILL
+G1X40Y30E3
+;LAYER:1
+G0 X40 Y30 Z0.5
+G1 X50 Y30 E4
+"""
+
+@pytest.fixture
+def gcode_file(tmpdir):
+    path = tmpdir.join("test.gcode")
+    path.write(gcode)
+    return str(path)
+
+def parse(file_name, **kwargs):
+    parser = GCodeParser(**kwargs)
+    layers = list(parser.parse(file_name))
+    return parser, layers
+
+def test_layers(gcode_file):
+    parser, layers = parse(gcode_file)
+
+    assert [layer[0] for layer in layers] == [0, 1]
+    number, height, thickness, polygons, durations = layers[0]
+    assert height == pytest.approx(0.3)
+    assert thickness == pytest.approx(0.3)
+    assert len(polygons) == 1
+    extruder, line_types, points, line_widths = polygons[0]
+    assert extruder == 0
+    # The travel from the start g-code, the walls, the retracted travel (G10) and the infill (compact parameters).
+    assert line_types.ravel().tolist() == [LayerPolygon.MoveCombingType, LayerPolygon.Inset0Type, LayerPolygon.Inset0Type,
+                                           LayerPolygon.MoveRetractionType, LayerPolygon.InfillType]
+    # The points are in the coordinates of the scene: Y is up, and the Y of the printer is -Z.
+    assert numpy.allclose(points[1:], [[10, 0.3, -10], [20, 0.3, -10], [20, 0.3, -20], [30, 0.3, -30], [40, 0.3, -30]])
+    assert line_widths.shape == (5, 1)
+    assert len(durations) == 5
+    assert numpy.all(durations > 0)
+
+    number, height, thickness, polygons, durations = layers[1]
+    assert height == pytest.approx(0.5)
+    assert thickness == pytest.approx(0.2)
+    assert polygons[0][1].ravel().tolist() == [LayerPolygon.MoveCombingType, LayerPolygon.InfillType]
+
+def test_filament(gcode_file):
+    parser, layers = parse(gcode_file, filament_diameter = 1.75)
+
+    assert parser.getFilamentLengths() == [pytest.approx(4.0)]
+    assert parser.getMaterialAmounts() == [pytest.approx(4.0 * numpy.pi * (1.75 / 2) ** 2)]
+    # The moves of the start g-code are not shown, but they take time too: the lift of 15 mm takes at least 3 s.
+    assert parser.getPrintTime() > sum(float(numpy.sum(layer[4])) for layer in layers) + 15.0 / 5
+
+def test_chunks(gcode_file):
+    parser, layers = parse(gcode_file)
+    # Chunks that end in the middle of the layers, but are longer than the lines.
+    chunked_parser, chunked_layers = parse(gcode_file, chunk_size = 32)
+
+    assert len(chunked_layers) == len(layers)
+    for layer, chunked_layer in zip(layers, chunked_layers):
+        assert chunked_layer[:3] == layer[:3]
+        for polygon, chunked_polygon in zip(layer[3], chunked_layer[3]):
+            assert chunked_polygon[0] == polygon[0]
+            for values, chunked_values in zip(polygon[1:], chunked_polygon[1:]):
+                assert numpy.array_equal(chunked_values, values)
+    assert chunked_parser.getPrintTime() == pytest.approx(parser.getPrintTime(), rel = 0.01)
+
+def test_compressed(gcode_file, tmpdir):
+    compressed_file = str(tmpdir.join("test.gcode.gz"))
+    with gzip.open(compressed_file, "wb") as f:
+        f.write(gcode.encode())
+
+    parser, layers = parse(gcode_file)
+    compressed_parser, compressed_layers = parse(compressed_file)
+
+    assert [layer[:3] for layer in compressed_layers] == [layer[:3] for layer in layers]
+    assert compressed_parser.getFilamentLengths() == parser.getFilamentLengths()
+
+def test_relativeMoves(tmpdir):
+    # The end g-code of many printers moves away from the print with relative moves.
+    path = tmpdir.join("relative.gcode")
+    path.write(";LAYER:0\nG0 F6000 X10 Y10 Z0.3\nG1 F1200 X20 Y10 E1\nG91\nG1 Z+0.5 E-5 X-20 Y-20\nG90\nG1 X30 Y30\n")
+
+    parser, layers = parse(str(path))
+
+    points = layers[0][3][0][2]
+    assert numpy.allclose(points[-2:], [[0, 0.8, 10], [30, 0.8, -30]])
+    # G91 makes the retraction relative too: 5 mm back from 1 mm, not to -5 mm.
+    assert parser.getFilamentLengths() == [pytest.approx(-4.0)]
+
+def test_indentedLines(tmpdir):
+    path = tmpdir.join("indented.gcode")
+    path.write(";LAYER:0\n  G0 F6000 X10 Y10 Z0.3\n\t;TYPE:WALL-OUTER\n\tG1 F1200 X20 Y10 E1\n")
+
+    parser, layers = parse(str(path))
+
+    line_types = layers[0][3][0][1]
+    points = layers[0][3][0][2]
+    assert line_types.ravel().tolist() == [LayerPolygon.MoveCombingType, LayerPolygon.Inset0Type]
+    assert numpy.allclose(points[-1], [20, 0.3, -10])
+
+def test_empty(tmpdir):
+    path = tmpdir.join("empty.gcode")
+    path.write("")
+
+    parser, layers = parse(str(path))
+
+    assert layers == []
+    assert parser.getPrintTime() == 0.0
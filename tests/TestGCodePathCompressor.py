@@ -0,0 +1,77 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import math
+import pytest
+
+from USBPrinting.GCodePathCompressor import GCodePathCompressor
+
+##  Moves along a circle around (100, 100), one degree each.
+def createArc(radius = 40, degrees = 10):
+    lines = ["G0 X%.3f Y100" % (100 + radius), "G92 E0"]
+    for angle in range(1, degrees + 1):
+        x = 100 + radius * math.cos(math.radians(angle))
+        y = 100 + radius * math.sin(math.radians(angle))
+        lines.append("G1 F1800 X%.3f Y%.3f E%.5f" % (x, y, angle * 0.02))
+    return lines
+
+def test_straight():
+    compressor = GCodePathCompressor()
+
+    result = list(compressor.compress(["G0 X0 Y0 ;Start", "G92 E0", "G1 F1500 X1 Y0 E0.1", "G1 X2 Y0 E0.2", "G1 X3 Y0 E0.3", "", "G1 Z0.5", "G1 X3 Y1 E0.4"]))
+
+    # The comment and empty line are left out, and the moves in one direction merged. The move in Z ends the run.
+    assert result == ["G0 X0 Y0", "G92 E0", "G1 F1500 X3.000 Y0.000 E0.3", "G1 Z0.5", "G1 X3 Y1 E0.4"]
+    statistics = compressor.getStatistics()
+    assert statistics["merged_moves"] == 3
+    assert statistics["lines"] == len(result)
+
+def test_relativeExtrusion():
+    result = list(GCodePathCompressor().compress(["G0 X0 Y0", "M83", "G1 F1500 X1 Y0 E0.1", "G1 X2 Y0 E0.1", "G1 X3 Y0 E0.1"]))
+
+    assert result == ["G0 X0 Y0", "M83", "G1 F1500 X3.000 Y0.000 E0.30000"]
+
+def test_corner():
+    lines = ["G0 X0 Y0", "G92 E0", "G1 F1500 X10 Y0 E1", "G1 X10 Y10 E2"]
+
+    assert list(GCodePathCompressor().compress(lines)) == lines
+
+def test_unevenExtrusion():
+    lines = ["G0 X0 Y0", "G92 E0", "G1 F1500 X10 Y0 E1", "G1 X20 Y0 E3"]
+
+    assert list(GCodePathCompressor().compress(lines)) == lines
+
+def test_differentFeedrate():
+    lines = ["G0 X0 Y0", "G92 E0", "G1 F1500 X10 Y0 E1", "G1 F3000 X20 Y0 E2"]
+
+    assert list(GCodePathCompressor().compress(lines)) == lines
+
+def test_retraction():
+    lines = ["G0 X0 Y0", "G92 E0", "G1 F1500 X10 Y0 E1", "G1 F1500 E-5.5", "G1 F1500 X20 Y0 E1"]
+
+    assert list(GCodePathCompressor().compress(lines)) == lines
+
+def test_unknownPosition():
+    # After homing the start of the first move is not known, so it is not merged.
+    lines = ["G28", "G92 E0", "G1 F1500 X1 Y0 E0.1", "G1 X2 Y0 E0.2"]
+
+    assert list(GCodePathCompressor().compress(lines)) == lines
+
+def test_noArcs():
+    result = list(GCodePathCompressor().compress(createArc()))
+
+    assert not any(line.startswith("G2") or line.startswith("G3") for line in result)
+
+def test_arc():
+    compressor = GCodePathCompressor(arcs = True)
+
+    result = list(compressor.compress(createArc()))
+
+    assert len(result) == 3
+    assert result[-1].startswith("G3 F1800 X139.392 Y106.946 ")
+    assert result[-1].endswith(" E0.20000")
+    # The center of the arc, relative to its start.
+    offsets = dict((parameter[0], float(parameter[1:])) for parameter in result[-1].split() if parameter[0] in "IJ")
+    assert offsets["I"] == pytest.approx(-40, abs = 0.1)
+    assert offsets["J"] == pytest.approx(0, abs = 0.1)
+    assert compressor.getStatistics()["arcs"] == 1
@@ -0,0 +1,83 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import pytest
+
+from UM.Preferences import Preferences
+
+from PauseAtHeight.PauseAtHeight import PauseAtHeight
+
+# Start g-code like that of the bq printers, which lifts the nozzle to 15 mm before the first layer.
+start_gcode = [
+    "G21\n",
+    "G90\n",
+    "M82\n",
+    "G28 X0 Y0\n",
+    "G28 Z0\n",
+    "G1 Z15.0 F1200\n",
+    "G92 E0\n",
+    "G1 F200 E3\n",
+    "G92 E0\n"
+]
+
+def createLayers(heights):
+    lines = []
+    for layer_number, height in enumerate(heights):
+        lines.append(";LAYER:%d\n" % layer_number)
+        lines.append("G0 F3600 X10 Y10 Z%.1f\n" % height)
+        lines.append("G1 F1200 X20 Y10 E%.1f\n" % (layer_number + 1))
+    return lines
+
+@pytest.fixture
+def pause_at_height():
+    stage = PauseAtHeight()
+    yield stage
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 0.0)
+
+def test_disabled(pause_at_height):
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 0.0)
+    assert not pause_at_height.isEnabled()
+
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 5.0)
+    assert pause_at_height.isEnabled()
+
+def test_pauseAfterStartGCodeLift(pause_at_height):
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 5.0)
+    gcode = start_gcode + createLayers([1.0, 3.0, 5.0, 7.0])
+
+    result = list(pause_at_height.process(iter(gcode)))
+
+    # The lift to 15 mm of the start g-code is not taken for a layer.
+    pause = result.index(";Pause at height\n")
+    assert pause > result.index(";LAYER:2\n")
+    assert result[pause + 8:] == gcode[gcode.index(";LAYER:2\n") + 1:]
+    assert "M0\n" in result[pause:pause + 8]
+    # The nozzle goes back to the height of the layer before the pause.
+    assert "G0 F300 Z3.000\n" in result[pause:pause + 8]
+    # The print used absolute extrusion, which is restored after the pause.
+    assert result[pause + 7] == "M82\n"
+    assert len(result) == len(gcode) + 8
+
+def test_pauseAboveStartGCodeLift(pause_at_height):
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 20.0)
+    gcode = start_gcode + createLayers([1.0, 20.0])
+
+    result = list(pause_at_height.process(iter(gcode)))
+
+    assert result.index(";Pause at height\n") > result.index(";LAYER:1\n")
+
+def test_pauseWithRelativeExtrusion(pause_at_height):
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 2.0)
+    gcode = ["M83\n"] + createLayers([1.0, 2.0])
+
+    result = list(pause_at_height.process(iter(gcode)))
+
+    pause = result.index(";Pause at height\n")
+    assert "M82\n" not in result[pause:]
+    assert len(result) == len(gcode) + 7
+
+def test_noPauseBelowHeight(pause_at_height):
+    Preferences.getInstance().setValue("post_processing/pause_at_height", 10.0)
+    gcode = start_gcode + createLayers([1.0, 2.0, 3.0])
+
+    assert list(pause_at_height.process(iter(gcode))) == gcode
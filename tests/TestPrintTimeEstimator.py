@@ -0,0 +1,77 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import numpy
+import pytest
+
+from cura.PrintTimeEstimator import PrintTimeEstimator
+
+def test_cruise():
+    # Without a jerk limit the head starts and stops at full speed.
+    estimator = PrintTimeEstimator(max_jerks = (1e6, 1e6, 1e6))
+
+    durations = estimator.estimate([[100, 0, 0, 0]], [50])
+
+    assert durations == pytest.approx([2.0])
+
+def test_trapezoid():
+    # Without jerk the head accelerates from standing still and decelerates to standing still.
+    estimator = PrintTimeEstimator(acceleration = 4000, max_jerks = (0, 0, 0))
+
+    durations = estimator.estimate([[100, 0, 0, 0]], [50])
+
+    assert durations == pytest.approx([100 / 50 + 50 / 4000])
+
+def test_triangle():
+    # Too short to reach the nominal speed: accelerate to the peak speed halfway and decelerate again.
+    estimator = PrintTimeEstimator(acceleration = 1000, max_jerks = (0, 0, 0))
+
+    durations = estimator.estimate([[1, 0, 0, 0]], [100])
+
+    assert durations == pytest.approx([2 * numpy.sqrt(1 / 1000)])
+
+def test_straightJunction():
+    # Moves in the same direction don't slow down at their junction, so splitting a move doesn't change its duration.
+    estimator = PrintTimeEstimator(acceleration = 4000, max_jerks = (0, 0, 0))
+    single_duration = estimator.estimate([[100, 0, 0, 0]], [50])
+
+    estimator.reset()
+    split_durations = estimator.estimate([[25, 0, 0, 0]] * 4, [50] * 4)
+
+    assert numpy.sum(split_durations) == pytest.approx(single_duration[0])
+
+def test_batches():
+    # The velocity at the end of a batch is kept for the junction with the next batch.
+    deltas = [[10, 0, 0, 0.5], [10, 0, 0, 0.5], [0, 10, 0, 0.5], [-10, 0, 0, 0.5], [0, 0, 0.2, 0]]
+    feedrates = [30, 30, 60, 60, 10]
+    estimator = PrintTimeEstimator(max_jerks = (1e6, 1e6, 1e6))
+    durations = estimator.estimate(deltas, feedrates)
+
+    estimator.reset()
+    batched_durations = numpy.concatenate((estimator.estimate(deltas[:2], feedrates[:2]), estimator.estimate(deltas[2:], feedrates[2:])))
+
+    assert batched_durations == pytest.approx(durations)
+
+def test_axisLimits():
+    # A move of only Z is limited by the maximum feedrate of Z.
+    estimator = PrintTimeEstimator(max_feedrates = (500, 500, 5, 25), max_jerks = (1e6, 1e6, 1e6))
+
+    durations = estimator.estimate([[0, 0, 10, 0]], [100])
+
+    assert durations == pytest.approx([2.0])
+
+def test_retraction():
+    # A move of only the filament takes the time of the filament move.
+    estimator = PrintTimeEstimator(max_feedrates = (500, 500, 5, 25), max_jerks = (1e6, 1e6, 1e6))
+
+    durations = estimator.estimate([[0, 0, 0, -5]], [25])
+
+    assert durations == pytest.approx([0.2])
+
+def test_noMove():
+    estimator = PrintTimeEstimator()
+
+    durations = estimator.estimate([[0, 0, 0, 0], [10, 0, 0, 0]], [50, 50])
+
+    assert durations[0] == 0.0
+    assert durations[1] > 0.0
@@ -0,0 +1,95 @@
+# Copyright (c) 2016 Ultimaker B.V.
+# Cura is released under the terms of the AGPLv3 or higher.
+
+import os
+import pytest
+import time
+
+if not hasattr(os, "openpty"):
+    pytest.skip("The virtual printer needs a pseudo-terminal", allow_module_level = True)
+pytest.importorskip("serial")
+
+from UM.Preferences import Preferences
+
+from cura.PrinterOutputDevice import ConnectionState
+from USBPrinting.GCodeLineStream import GCodeLineStream
+from USBPrinting.USBPrinterOutputDevice import USBPrinterOutputDevice
+from USBPrinting.VirtualPrinter import VirtualPrinter
+
+##  A layer of short moves, which fill the window with several lines.
+def createGCode(moves = 200):
+    lines = ["G28", "G92 E0", "G0 F7200 X100 Y100 Z0.3"]
+    for move in range(1, moves + 1):
+        lines.append("G1 F1800 X%.3f Y%.3f E%.5f" % (100 + move * 0.1, 100 + (move % 2) * 0.1, move * 0.01))
+    return lines
+
+@pytest.fixture
+def preferences():
+    preferences = Preferences.getInstance()
+    for key, default_value in (("usb_printing/streaming", False), ("usb_printing/streaming_lines", 4), ("usb_printing/streaming_bytes", 127),
+                               ("usb_printing/sd_upload", False), ("usb_printing/path_compression", False), ("usb_printing/baud_rates", "{}")):
+        preferences.addPreference(key, default_value)
+        preferences.setValue(key, default_value)
+    return preferences
+
+##  Connect a device to a printer.
+#   \return Generates the device, which is closed afterwards.
+def connect(printer):
+    device = USBPrinterOutputDevice(printer.getPortName())
+    device.connect()
+    end_time = time.time() + 30
+    while device.connectionState != ConnectionState.connected:
+        assert time.time() < end_time, "Could not connect to the virtual printer"
+        time.sleep(0.05)
+    return device
+
+##  Print g-code and wait until the device is done with it.
+#   \return The statistics of the printer at the moment the device was done.
+def printGCode(device, printer, lines):
+    gcode = GCodeLineStream(device._getPrintLines(lines, False))
+    device._printGCodeStream(gcode)
+    end_time = time.time() + 60
+    while device._is_printing:
+        assert time.time() < end_time, "The print did not finish"
+        time.sleep(0.01)
+    return gcode, printer.getStatistics()
+
+@pytest.mark.parametrize("error_rate, flush_on_resend", [(0.0, False), (0.05, False), (0.05, True)])
+def test_streaming(preferences, error_rate, flush_on_resend):
+    preferences.setValue("usb_printing/streaming", True)
+    printer = VirtualPrinter(move_time = 0.0005, error_rate = error_rate, seed = 1, flush_on_resend = flush_on_resend)
+    printer.start()
+    device = None
+    try:
+        device = connect(printer)
+
+        gcode, statistics = printGCode(device, printer, createGCode())
+
+        # The print is only done when the printer has all lines, and nothing overflows its receive buffer.
+        assert statistics["last_line_number"] == len(gcode) - 1
+        assert statistics["dropped_bytes"] == 0
+        assert device.jobState == "ready"
+        if error_rate > 0:
+            assert statistics["resends"] > 0
+            assert device.streamingStatistics["resends"] > 0
+        assert device.streamingStatistics["timeouts"] == 0
+    finally:
+        if device is not None:
+            device.close()
+        printer.stop()
+
+def test_pingPong(preferences):
+    printer = VirtualPrinter(move_time = 0.0005, error_rate = 0.05, seed = 1)
+    printer.start()
+    device = None
+    try:
+        device = connect(printer)
+
+        gcode, statistics = printGCode(device, printer, createGCode(50))
+
+        assert statistics["last_line_number"] == len(gcode) - 1
+        assert statistics["dropped_bytes"] == 0
+    finally:
+        if device is not None:
+            device.close()
+        printer.stop()